@@ -0,0 +1,146 @@
+# answer_cache.py - Semantic answer cache for /api/chat
+# Reuses a generated answer when a new question is a near-paraphrase of a cached
+# one (cosine similarity of query embeddings above a threshold) AND retrieves
+# exactly the same chunks, so the answer is grounded in the same context.
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from metrics import cache_lookup
+from config import ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD
+
+class SemanticAnswerCache:
+    """
+    Bounded LRU cache of (query embedding, chunk ids, answer) entries with TTL.
+    All entries are dropped when the index version changes.
+    """
+
+    def __init__(self, maxsize=512, ttl=None, threshold=0.95):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._version = None
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._matrix = None
+        self._keys = []
+        self._lock = threading.Lock()
+
+    def _check_version(self, version):
+        if version != self._version:
+            self._entries.clear()
+            self._matrix = None
+            self._version = version
+
+    def _expire(self):
+        if self.ttl is None:
+            return
+        now = time.monotonic()
+        expired = [key for key, entry in self._entries.items() if now - entry["stored_at"] >= self.ttl]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def _embedding_matrix(self):
+        """Stacked embeddings of all live entries, rebuilt only after the entry set changes."""
+        if self._matrix is None:
+            self._keys = list(self._entries)
+            if self._keys:
+                self._matrix = np.vstack([self._entries[key]["embedding"] for key in self._keys])
+            else:
+                self._matrix = np.zeros((0, 0), dtype=np.float32)
+        return self._matrix
+
+    def lookup(self, query_embedding, chunk_ids, version):
+        """
+        Return the cached answer for the most similar entry above the threshold that
+        retrieved the same chunk ids under the same index version, or None.
+        """
+        if self.maxsize <= 0:
+            return None
+        query = _unit(query_embedding)
+        wanted = frozenset(chunk_ids)
+        with self._lock:
+            self._check_version(version)
+            self._expire()
+            matrix = self._embedding_matrix()
+            if len(matrix):
+                scores = matrix @ query
+                for i in np.argsort(-scores):
+                    if scores[i] < self.threshold:
+                        break
+                    key = self._keys[i]
+                    entry = self._entries[key]
+                    if entry["chunk_ids"] == wanted:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        self.saved_seconds += entry["latency"]
+                        return entry["answer"]
+            self.misses += 1
+            return None
+
+    def store(self, query_embedding, chunk_ids, answer, version, latency=0.0):
+        """Cache an answer together with the query embedding and chunk ids it was generated from."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._check_version(version)
+            self._entries[self._next_key] = {
+                "embedding": _unit(query_embedding),
+                "chunk_ids": frozenset(chunk_ids),
+                "answer": answer,
+                "latency": latency,
+                "stored_at": time.monotonic()
+            }
+            self._next_key += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "threshold": self.threshold,
+                "index_version": self._version
+            }
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+_cache = SemanticAnswerCache(
+    maxsize=ANSWER_CACHE_SIZE,
+    ttl=ANSWER_CACHE_TTL or None,
+    threshold=ANSWER_CACHE_THRESHOLD
+)
+
+def lookup(query_embedding, chunk_ids, version):
+    """Cached answer for a near-identical question with the same retrieved chunks, or None."""
+    if query_embedding is None:  # lexical-only retrieval: nothing to compare questions by
+        return None
+    answer = _cache.lookup(query_embedding, chunk_ids, version)
+    if _cache.maxsize > 0:
+        cache_lookup("answer", answer is not None)
+    return answer
+
+def store(query_embedding, chunk_ids, answer, version, latency=0.0):
+    """Remember a generated answer; latency is the generation time a future hit saves."""
+    if query_embedding is None:
+        return
+    _cache.store(query_embedding, chunk_ids, answer, version, latency)
+
+def stats():
+    """Size, hit rate and total generation seconds saved by the answer cache."""
+    return _cache.stats()
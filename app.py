@@ -1,22 +1,132 @@
-from flask import Flask, request, jsonify
+import startup  # first, so the import time it logs covers everything below
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
-from retrieval import retrieve_top_k
-import google.generativeai as genai
-from config import GEMINI_API_KEY
+from retrieval import retrieve_top_k, get_store
+from embeddings import cache_stats, batcher_stats
+from pipeline import (
+    retrieve, retrieve_batch, group_batch_questions, batch_response,
+    sse_event, routed_events, source_list, ANSWER_MODEL, FALLBACK_ANSWER
+)
+from prompts import build_lead_prompt
+import answer_cache
+import sessions
+import router
+import llm
+import singleflight
+import metrics
+from metrics import span
+from config import BATCH_MAX_QUESTIONS, BATCH_CONCURRENCY
+from concurrent.futures import ThreadPoolExecutor
 import os
 import time
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS on all routes
 
-# Configure Google GenAI for Gemini
-genai.configure(api_key=GEMINI_API_KEY)
+# Gemini calls for /api/chat/batch share one pool, so concurrent batch jobs together
+# never run more than BATCH_CONCURRENCY generations in this worker
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix="batch-generate")
+
+startup.imports_done('app')
+
+@app.before_request
+def start_request_metrics():
+    """Start collecting stage timings and count the request as in flight."""
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.timings = metrics.start_timings()
+    g.started = time.perf_counter()
+    metrics.IN_FLIGHT.labels(g.metrics_endpoint).inc()
+
+@app.after_request
+def finish_request_metrics(response):
+    """Record latency and status, and report the stage timings in a Server-Timing header."""
+    endpoint = g.pop('metrics_endpoint')
+    elapsed = time.perf_counter() - g.started
+    metrics.REQUEST_SECONDS.labels(endpoint).observe(elapsed)
+    metrics.REQUESTS.labels(endpoint, str(response.status_code)).inc()
+    response.headers['Server-Timing'] = metrics.server_timing(g.timings, elapsed)
+    # Streamed responses stay in flight until the server has sent the whole body
+    response.call_on_close(metrics.IN_FLIGHT.labels(endpoint).dec)
+    return response
+
+@app.teardown_request
+def end_request_metrics(exc):
+    """Release the in-flight slot of a request that never produced a response."""
+    endpoint = g.pop('metrics_endpoint', None)
+    if endpoint is not None:
+        metrics.IN_FLIGHT.labels(endpoint).dec()
+
+def _unavailable_response(error):
+    """503 with Retry-After when the Gemini client refuses a call (circuit open or overloaded)."""
+    return jsonify({'error': str(error)}), 503, {'Retry-After': str(error.retry_after)}
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint for Render."""
     return jsonify({'status': 'healthy', 'service': 'Convo Sol RAG Chatbot'}), 200
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness probe: 200 once the model, a dummy encode and the index have been
+    warmed up, 503 until then. Starts warm-up if nothing else has.
+    """
+    startup.warm_up_in_background()
+    status = startup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    """Cache and batching counters for this worker."""
+    return jsonify({
+        'embedding_cache': cache_stats(),
+        'embedding_batcher': batcher_stats(),
+        'answer_cache': answer_cache.stats(),
+        'sessions': sessions.stats(),
+        'router': router.stats(),
+        'llm': llm.stats(),
+        'singleflight': singleflight.stats()
+    }), 200
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus metrics (summed across Gunicorn workers when PROMETHEUS_MULTIPROC_DIR is set)."""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+def _answer(question, query, history=None):
+    """
+    Retrieve, then answer from the cache or from Gemini: the answer text for
+    /api/chat. Answers without history are cached. Raises llm.LLMError.
+    """
+    # Retrieve top relevant chunks for the question
+    store, query_embedding, relevant_chunks, chunk_ids = retrieve(query)
+
+    # Serve a cached answer for a near-identical question grounded in the same chunks
+    use_cache = history is None
+    if use_cache:
+        with span("answer_cache"):
+            cached_answer = answer_cache.lookup(query_embedding, chunk_ids, store.version)
+        if cached_answer is not None:
+            return cached_answer
+
+    # Build a lead-generation focused prompt within the context token budget
+    with span("prompt"):
+        prompt, _ = build_lead_prompt(question, relevant_chunks, history=history)
+
+    # Call Gemini through the shared client (deadlines, retries, circuit breaker)
+    started = time.perf_counter()
+    with span("generate"):
+        answer_text = llm.generate(prompt, ANSWER_MODEL, endpoint='/api/chat')
+
+    # Fallback if no content was returned
+    if not answer_text.strip():
+        answer_text = FALLBACK_ANSWER
+    elif use_cache:
+        answer_cache.store(query_embedding, chunk_ids, answer_text, store.version,
+                           latency=time.perf_counter() - started)
+    return answer_text
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     try:
@@ -24,52 +134,36 @@ def chat():
         question = data.get('question', '').strip()
         if not question:
             return jsonify({'error': 'No question provided.'}), 400
+        try:
+            with span("session"):
+                conversation = sessions.open_conversation(data.get('session_id'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        # Retrieve top relevant chunks for the question
-        relevant_chunks = retrieve_top_k(question, top_k=3)
-        
-        # Extract text from chunks (retrieve_top_k returns list of (score, chunk_dict))
-        context = "\n".join([chunk['text'] for score, chunk in relevant_chunks])
-
-        # Build a lead-generation focused prompt
-        prompt = (
-            f"You are a professional business development chatbot for Convo Sol, an AI SaaS company. "
-            f"Your primary goal is to generate leads and convince potential clients to start projects with us. "
-            f"Be conversational, brief, and persuasive. Focus on understanding their needs and positioning our services as the solution. "
-            f"If they show interest, guide them towards scheduling a meeting to discuss their project in detail.\\n\\n"
-            f"Guidelines:\\n"
-            f"- Keep responses concise and engaging (2-3 sentences max)\\n"
-            f"- Ask follow-up questions to understand their project needs\\n"
-            f"- Highlight our expertise and successful track record\\n"
-            f"- When appropriate, suggest scheduling a consultation call\\n"
-            f"- If clients want to connect with co-founders, provide their contact details from the company information\\n"
-            f"- Co-founders: Muneeb Qureshi (muneebq2003@gmail.com, LinkedIn: https://www.linkedin.com/in/muneebqureshi2003/), Muhammad Hadi (muhammadhadiabid@gmail.com, LinkedIn: https://www.linkedin.com/in/muhammad-hadi-abid), Awais Khaleeq (ds.awaisk@gmail.com, LinkedIn: https://www.linkedin.com/in/muhammad-awais-khaleeq)\\n"
-            f"- Use a friendly, professional tone like you're chatting with a potential client\\n\\n"
-            f"Company Information:\\n{context}\\n\\n"
-            f"Client: {question}\\n"
-            f"Response:"
-        )
+        # A follow-up is matched and searched together with the previous question
+        query = conversation.retrieval_query(question)
 
-        # Call Gemini text-generation API to get the answer
-        answer_text = None
-        for attempt in range(3):
-            try:
-                model = genai.GenerativeModel('gemini-2.5-flash')
-                response = model.generate_content(prompt)
-                # GenAI SDK returns .text
-                answer_text = response.text
-                break
-            except Exception as e:
-                if attempt < 2:
-                    time.sleep(1)
-                else:
-                    return jsonify({'error': 'Failed to generate response.'}), 500
+        # Greetings, intents and curated FAQ answers skip retrieval and the LLM
+        routed = router.route(question, query)
+        if routed is not None:
+            conversation.record(question, query, routed['answer'])
+            return jsonify(conversation.reply({'answer': routed['answer'], 'route': routed['route']}))
 
-        # Fallback if no content was returned
-        if not answer_text.strip():
-            answer_text = "I'm sorry, I do not have an answer. Please contact support for assistance."
-        
-        return jsonify({'answer': answer_text})
+        # Concurrent requests for the same question share one retrieval and Gemini call.
+        # A follow-up's answer also depends on the conversation, so it is never shared.
+        try:
+            if conversation.has_history:
+                answer_text = _answer(question, query, history=conversation.history_text())
+            else:
+                answer_text = singleflight.do(question, get_store().version, lambda: _answer(question, query))
+        except llm.LLMUnavailable as e:
+            return _unavailable_response(e)
+        except llm.LLMError as e:
+            print(f"Error generating response: {e}")
+            return jsonify({'error': 'Failed to generate response.'}), 500
+
+        conversation.record(question, query, answer_text)
+        return jsonify(conversation.reply({'answer': answer_text}))
         
     except Exception as e:
         print(f"Error in chat endpoint: {e}")
@@ -77,6 +171,173 @@ def chat():
         traceback.print_exc()
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
+def _answer_batch_item(question, query_embedding, relevant_chunks, chunk_ids, version):
+    """Answer one question of a batch; returns {'answer', 'cached'} (plus 'route' from the fast path) or {'error'}."""
+    routed = router.route(question, query_embedding=query_embedding)
+    if routed is not None:
+        return {'answer': routed['answer'], 'cached': False, 'route': routed['route']}
+
+    cached_answer = answer_cache.lookup(query_embedding, chunk_ids, version)
+    if cached_answer is not None:
+        return {'answer': cached_answer, 'cached': True}
+
+    prompt, _ = build_lead_prompt(question, relevant_chunks)
+    started = time.perf_counter()
+    try:
+        with span("generate"):
+            answer_text = llm.generate(prompt, ANSWER_MODEL, endpoint='/api/chat/batch')
+    except llm.LLMUnavailable as e:
+        return {'error': str(e), 'retry_after': e.retry_after}
+    except llm.LLMError as e:
+        print(f"Error answering batch question: {e}")
+        return {'error': 'Failed to generate response.'}
+
+    if not answer_text.strip():
+        answer_text = FALLBACK_ANSWER
+    else:
+        answer_cache.store(query_embedding, chunk_ids, answer_text, version,
+                           latency=time.perf_counter() - started)
+    return {'answer': answer_text, 'cached': False}
+
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    """
+    Answer many questions in one request: {"questions": [...]} -> {"results": [...]}.
+    All questions are embedded in one batched encode and searched with one
+    multi-query search, then answered concurrently (BATCH_CONCURRENCY per worker).
+    Results keep the input order; an item that failed has "error" instead of "answer".
+    """
+    data = request.json or {}
+    questions = data.get('questions')
+    if not isinstance(questions, list) or not questions:
+        return jsonify({'error': 'Provide a non-empty "questions" list.'}), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({'error': f'At most {BATCH_MAX_QUESTIONS} questions per batch.'}), 400
+
+    try:
+        # Identical questions are retrieved and answered once
+        results, unique, positions = group_batch_questions(questions)
+        if unique:
+            store, query_embeddings, chunk_lists, chunk_ids = retrieve_batch(unique)
+            futures = [
+                _batch_executor.submit(_answer_batch_item, question, embedding, chunks, ids, store.version)
+                for question, embedding, chunks, ids in zip(unique, query_embeddings, chunk_lists, chunk_ids)
+            ]
+            for future, indices in zip(futures, positions):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error answering batch question: {e}")
+                    result = {'error': f'Internal server error: {str(e)}'}
+                for i in indices:
+                    results[i] = dict({'question': questions[i]}, **result)
+        return jsonify(batch_response(results))
+
+    except Exception as e:
+        print(f"Error in chat batch endpoint: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Stream the answer as Server-Sent Events: one "sources" event with the cited
+    chunks, "token" events as Gemini produces text, then a "done" event with
+    timings (or an "error" event if generation fails).
+    """
+    data = request.json or {}
+    question = data.get('question', '').strip()
+    if not question:
+        return jsonify({'error': 'No question provided.'}), 400
+    try:
+        conversation = sessions.open_conversation(data.get('session_id'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    started = time.perf_counter()
+    query = conversation.retrieval_query(question)
+    try:
+        routed = router.route(question, query)
+        if routed is None:
+            store, query_embedding, relevant_chunks, chunk_ids = retrieve(query)
+    except Exception as e:
+        print(f"Error in chat stream endpoint: {e}")
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+    if routed is not None:
+        conversation.record(question, query, routed['answer'])
+        timing = {'total_ms': round((time.perf_counter() - started) * 1000, 1)}
+        done = {'cached': False, 'route': routed['route'], 'timing': timing}
+        return Response(
+            routed_events(routed['answer'], conversation.reply(done)),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    retrieval_ms = (time.perf_counter() - started) * 1000
+    sources = source_list(relevant_chunks)
+
+    # Check the cache and reserve a Gemini slot before the stream starts, so an open
+    # circuit or a full queue is answered with 503 and Retry-After rather than an error event
+    use_cache = not conversation.has_history
+    cached_answer = answer_cache.lookup(query_embedding, chunk_ids, store.version) if use_cache else None
+    slot = None
+    if cached_answer is None:
+        try:
+            slot = llm.admit()
+        except llm.LLMUnavailable as e:
+            return _unavailable_response(e)
+
+    def events():
+        yield sse_event('sources', {'sources': sources})
+        timing = {'retrieval_ms': round(retrieval_ms, 1)}
+
+        if cached_answer is not None:
+            timing['first_token_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            yield sse_event('token', {'text': cached_answer})
+            timing['total_ms'] = timing['first_token_ms']
+            conversation.record(question, query, cached_answer)
+            yield sse_event('done', conversation.reply({'cached': True, 'timing': timing}))
+            return
+
+        with span("prompt"):
+            prompt, prompt_info = build_lead_prompt(question, relevant_chunks, history=conversation.history_text())
+        generation_started = time.perf_counter()
+        parts = []
+        try:
+            with span("generate"):
+                for text in llm.stream(prompt, ANSWER_MODEL, endpoint='/api/chat/stream', slot=slot):
+                    if not parts:
+                        timing['first_token_ms'] = round((time.perf_counter() - started) * 1000, 1)
+                    parts.append(text)
+                    yield sse_event('token', {'text': text})
+        except llm.LLMError as e:
+            print(f"Error streaming response: {e}")
+            yield sse_event('error', {'error': 'Failed to generate response.'})
+            return
+
+        answer_text = "".join(parts)
+        if not answer_text.strip():
+            answer_text = FALLBACK_ANSWER
+            yield sse_event('token', {'text': answer_text})
+        elif use_cache:
+            answer_cache.store(query_embedding, chunk_ids, answer_text, store.version,
+                               latency=time.perf_counter() - generation_started)
+        conversation.record(question, query, answer_text)
+        timing['total_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        yield sse_event('done', conversation.reply(
+            {'cached': False, 'timing': timing, 'prompt_tokens': prompt_info['prompt_tokens']}
+        ))
+
+    response = Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    if slot is not None:
+        # Frees the slot even if the client disconnects before generation starts
+        response.call_on_close(slot.release)
+    return response
+
 def terminal_chat():
     """Terminal chatbot interface."""
     print("=" * 60)
@@ -98,33 +359,21 @@ def terminal_chat():
                 
             print("\n🤖 Bot:", end=" ")
             
-            # Use the same logic as the Flask endpoint
+            # Use the same logic as the Flask endpoint, printing tokens as they arrive
+            routed = router.route(question)
+            if routed is not None:
+                print(routed['answer'])
+                print("-" * 60)
+                continue
+
             relevant_chunks = retrieve_top_k(question, top_k=3)
-            context = "\n".join([chunk['text'] for score, chunk in relevant_chunks])
-            
-            prompt = (
-                f"You are a professional business development chatbot for Convo Sol, an AI SaaS company. "
-                f"Your primary goal is to generate leads and convince potential clients to start projects with us. "
-                f"Be conversational, brief, and persuasive. Focus on understanding their needs and positioning our services as the solution. "
-                f"If they show interest, guide them towards scheduling a meeting to discuss their project in detail.\n\n"
-                f"Guidelines:\n"
-                f"- Keep responses concise and engaging (2-3 sentences max)\n"
-                f"- Ask follow-up questions to understand their project needs\n"
-                f"- Highlight our expertise and successful track record\n"
-                f"- When appropriate, suggest scheduling a consultation call\n"
-                f"- If clients want to connect with co-founders, provide their contact details from the company information\n"
-                f"- Co-founders: Muneeb Qureshi (muneebq2003@gmail.com, LinkedIn: https://www.linkedin.com/in/muneebqureshi2003/), Muhammad Hadi (muhammadhadiabid@gmail.com, LinkedIn: https://www.linkedin.com/in/muhammad-hadi-abid), Awais Khaleeq (ds.awaisk@gmail.com, LinkedIn: https://www.linkedin.com/in/muhammad-awais-khaleeq)\n"
-                f"- Use a friendly, professional tone like you're chatting with a potential client\n\n"
-                f"Company Information:\n{context}\n\n"
-                f"Client: {question}\n"
-                f"Response:"
-            )
+            prompt, _ = build_lead_prompt(question, relevant_chunks)
             
             try:
-                model = genai.GenerativeModel('gemini-2.5-flash')
-                response = model.generate_content(prompt)
-                print(response.text)
-            except Exception as e:
+                for text in llm.stream(prompt, ANSWER_MODEL):
+                    print(text, end="", flush=True)
+                print()
+            except llm.LLMError as e:
                 print(f"Error: {e}")
                 
             print("-" * 60)
@@ -141,6 +390,7 @@ if __name__ == '__main__':
     else:
         # Run Flask server by default
         port = int(os.environ.get('PORT', 8080))
+        startup.warm_up_in_background()
         print(f"🚀 Starting Flask server on http://localhost:{port}")
         print(f"📡 API endpoint: http://localhost:{port}/api/chat")
         print("🔗 Use with ngrok: ngrok http 8080")
@@ -0,0 +1,379 @@
+# asgi.py - Async (ASGI) serving mode
+# Same /health and /api/chat contract as app.py, but each request is a coroutine
+# instead of a blocked thread: Gemini is called through llm.py's async client, the
+# embedding + vector search step runs in a bounded thread pool and retry backoff
+# uses asyncio.sleep. One process can keep hundreds of chats in flight.
+#
+# Run with: uvicorn asgi:app --host 0.0.0.0 --port $PORT
+import startup  # first, so the import time it logs covers everything below
+import asyncio
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from quart import Quart, request, jsonify, Response, g
+from quart_cors import cors
+from embeddings import cache_stats, batcher_stats
+from retrieval import get_store
+from pipeline import (
+    retrieve, retrieve_batch, group_batch_questions, batch_response,
+    sse_event, routed_events, source_list, ANSWER_MODEL, FALLBACK_ANSWER
+)
+from prompts import build_lead_prompt
+import answer_cache
+import sessions
+import router
+import llm
+import singleflight
+import metrics
+from metrics import span
+from config import ASGI_EXECUTOR_WORKERS, BATCH_MAX_QUESTIONS, BATCH_CONCURRENCY
+
+app = cors(Quart(__name__), allow_origin="*")  # Enable CORS on all routes
+
+# Embedding and vector search are CPU-bound; keep them off the event loop
+_executor = ThreadPoolExecutor(max_workers=ASGI_EXECUTOR_WORKERS, thread_name_prefix="retrieval")
+
+# Caps concurrent Gemini calls made for /api/chat/batch across all batch requests
+_batch_slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+startup.imports_done('asgi')
+
+@app.before_serving
+async def start_warm_up():
+    """Warm up in the background so /health answers while the model loads."""
+    startup.warm_up_in_background()
+
+async def _blocking(fn, *args):
+    """Run a blocking call in the bounded executor, in this request's context so its spans are reported."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, context.run, fn, *args)
+
+async def _route(question, query=None, query_embedding=None):
+    """router.route in the executor: it may load the FAQ index and store, and embed the question."""
+    return await _blocking(router.route, question, query, query_embedding)
+
+async def _retrieve(question, retrieve_fn=retrieve):
+    """Run pipeline.retrieve (or retrieve_batch) in the executor."""
+    return await _blocking(retrieve_fn, question)
+
+async def _open_conversation(session_id):
+    """sessions.open_conversation in the executor: the sqlite session store reads from disk."""
+    with span("session"):
+        return await _blocking(sessions.open_conversation, session_id)
+
+async def _record(conversation, question, query, answer):
+    """Conversation.record in the executor: it compacts the history and writes the session."""
+    await _blocking(conversation.record, question, query, answer)
+
+@app.before_request
+async def start_request_metrics():
+    """Start collecting stage timings and count the request as in flight."""
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.timings = metrics.start_timings()
+    g.started = time.perf_counter()
+    metrics.IN_FLIGHT.labels(g.metrics_endpoint).inc()
+
+@app.after_request
+async def finish_request_metrics(response):
+    """Record latency and status, and report the stage timings in a Server-Timing header."""
+    elapsed = time.perf_counter() - g.started
+    metrics.REQUEST_SECONDS.labels(g.metrics_endpoint).observe(elapsed)
+    metrics.REQUESTS.labels(g.metrics_endpoint, str(response.status_code)).inc()
+    response.headers['Server-Timing'] = metrics.server_timing(g.timings, elapsed)
+    return response
+
+@app.teardown_request
+async def end_request_metrics(exc):
+    """Quart tears the request down once the (possibly streamed) body has been sent."""
+    if 'metrics_endpoint' in g:
+        metrics.IN_FLIGHT.labels(g.metrics_endpoint).dec()
+
+def _unavailable_response(error):
+    """503 with Retry-After when the Gemini client refuses a call (circuit open or overloaded)."""
+    return jsonify({'error': str(error)}), 503, {'Retry-After': str(error.retry_after)}
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    """Health check endpoint for Render."""
+    return jsonify({'status': 'healthy', 'service': 'Convo Sol RAG Chatbot'}), 200
+
+@app.route('/ready', methods=['GET'])
+async def readiness_check():
+    """
+    Readiness probe: 200 once the model, a dummy encode and the index have been
+    warmed up, 503 until then. Starts warm-up if nothing else has.
+    """
+    startup.warm_up_in_background()
+    status = startup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/api/stats', methods=['GET'])
+async def stats():
+    """Cache and batching counters for this worker."""
+    return jsonify({
+        'embedding_cache': cache_stats(),
+        'embedding_batcher': batcher_stats(),
+        'answer_cache': answer_cache.stats(),
+        'sessions': sessions.stats(),
+        'router': router.stats(),
+        'llm': llm.stats(),
+        'singleflight': singleflight.stats(asynchronous=True)
+    }), 200
+
+@app.route('/metrics', methods=['GET'])
+async def prometheus_metrics():
+    """Prometheus metrics for this process (or all processes when PROMETHEUS_MULTIPROC_DIR is set)."""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+async def _answer(question, query, history=None):
+    """
+    Retrieve, then answer from the cache or from Gemini: the answer text for
+    /api/chat. Answers without history are cached. Raises llm.LLMError.
+    """
+    # Retrieve top relevant chunks for the question
+    store, query_embedding, relevant_chunks, chunk_ids = await _retrieve(query)
+
+    # Serve a cached answer for a near-identical question grounded in the same chunks
+    use_cache = history is None
+    if use_cache:
+        with span("answer_cache"):
+            cached_answer = await _blocking(answer_cache.lookup, query_embedding, chunk_ids, store.version)
+        if cached_answer is not None:
+            return cached_answer
+
+    # Build a lead-generation focused prompt within the context token budget
+    with span("prompt"):
+        prompt, _ = build_lead_prompt(question, relevant_chunks, history=history)
+
+    # Call Gemini through the shared client (deadlines, retries, circuit breaker, async)
+    started = time.perf_counter()
+    with span("generate"):
+        answer_text = await llm.agenerate(prompt, ANSWER_MODEL, endpoint='/api/chat')
+
+    # Fallback if no content was returned
+    if not answer_text.strip():
+        answer_text = FALLBACK_ANSWER
+    elif use_cache:
+        await _blocking(answer_cache.store, query_embedding, chunk_ids, answer_text, store.version,
+                        time.perf_counter() - started)
+    return answer_text
+
+@app.route('/api/chat', methods=['POST'])
+async def chat():
+    try:
+        data = await request.get_json(silent=True) or {}
+        question = data.get('question', '').strip()
+        if not question:
+            return jsonify({'error': 'No question provided.'}), 400
+        try:
+            conversation = await _open_conversation(data.get('session_id'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # A follow-up is matched and searched together with the previous question
+        query = conversation.retrieval_query(question)
+
+        # Greetings, intents and curated FAQ answers skip retrieval and the LLM
+        routed = await _route(question, query)
+        if routed is not None:
+            await _record(conversation, question, query, routed['answer'])
+            return jsonify(conversation.reply({'answer': routed['answer'], 'route': routed['route']}))
+
+        # Concurrent requests for the same question share one retrieval and Gemini call.
+        # A follow-up's answer also depends on the conversation, so it is never shared.
+        try:
+            if conversation.has_history:
+                answer_text = await _answer(question, query, history=conversation.history_text())
+            else:
+                store = await _blocking(get_store)  # may load a newly published snapshot
+                answer_text = await singleflight.ado(question, store.version, lambda: _answer(question, query))
+        except llm.LLMUnavailable as e:
+            return _unavailable_response(e)
+        except llm.LLMError as e:
+            print(f"Error generating response: {e}")
+            return jsonify({'error': 'Failed to generate response.'}), 500
+
+        await _record(conversation, question, query, answer_text)
+        return jsonify(conversation.reply({'answer': answer_text}))
+
+    except Exception as e:
+        print(f"Error in chat endpoint: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+async def _answer_batch_item(question, query_embedding, relevant_chunks, chunk_ids, version):
+    """Answer one question of a batch; returns {'answer', 'cached'} (plus 'route' from the fast path) or {'error'}."""
+    routed = await _route(question, query_embedding=query_embedding)
+    if routed is not None:
+        return {'answer': routed['answer'], 'cached': False, 'route': routed['route']}
+
+    cached_answer = await _blocking(answer_cache.lookup, query_embedding, chunk_ids, version)
+    if cached_answer is not None:
+        return {'answer': cached_answer, 'cached': True}
+
+    prompt, _ = build_lead_prompt(question, relevant_chunks)
+    started = time.perf_counter()
+    async with _batch_slots:
+        try:
+            with span("generate"):
+                answer_text = await llm.agenerate(prompt, ANSWER_MODEL, endpoint='/api/chat/batch')
+        except llm.LLMUnavailable as e:
+            return {'error': str(e), 'retry_after': e.retry_after}
+        except llm.LLMError as e:
+            print(f"Error answering batch question: {e}")
+            return {'error': 'Failed to generate response.'}
+
+    if not answer_text.strip():
+        answer_text = FALLBACK_ANSWER
+    else:
+        await _blocking(answer_cache.store, query_embedding, chunk_ids, answer_text, version,
+                        time.perf_counter() - started)
+    return {'answer': answer_text, 'cached': False}
+
+@app.route('/api/chat/batch', methods=['POST'])
+async def chat_batch():
+    """Same contract as app.py's /api/chat/batch; generations run as concurrent coroutines."""
+    data = await request.get_json(silent=True) or {}
+    questions = data.get('questions')
+    if not isinstance(questions, list) or not questions:
+        return jsonify({'error': 'Provide a non-empty "questions" list.'}), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({'error': f'At most {BATCH_MAX_QUESTIONS} questions per batch.'}), 400
+
+    try:
+        # Identical questions are retrieved and answered once
+        results, unique, positions = group_batch_questions(questions)
+        if unique:
+            store, query_embeddings, chunk_lists, chunk_ids = await _retrieve(unique, retrieve_batch)
+            answers = await asyncio.gather(*[
+                _answer_batch_item(question, embedding, chunks, ids, store.version)
+                for question, embedding, chunks, ids in zip(unique, query_embeddings, chunk_lists, chunk_ids)
+            ], return_exceptions=True)
+            for result, indices in zip(answers, positions):
+                if isinstance(result, Exception):
+                    print(f"Error answering batch question: {result}")
+                    result = {'error': f'Internal server error: {str(result)}'}
+                for i in indices:
+                    results[i] = dict({'question': questions[i]}, **result)
+        return jsonify(batch_response(results))
+
+    except Exception as e:
+        print(f"Error in chat batch endpoint: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+@app.route('/api/chat/stream', methods=['POST'])
+async def chat_stream():
+    """Server-Sent Events stream with the same events as app.py's /api/chat/stream."""
+    data = await request.get_json(silent=True) or {}
+    question = data.get('question', '').strip()
+    if not question:
+        return jsonify({'error': 'No question provided.'}), 400
+    try:
+        conversation = await _open_conversation(data.get('session_id'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    started = time.perf_counter()
+    query = conversation.retrieval_query(question)
+    try:
+        routed = await _route(question, query)
+        if routed is None:
+            store, query_embedding, relevant_chunks, chunk_ids = await _retrieve(query)
+    except Exception as e:
+        print(f"Error in chat stream endpoint: {e}")
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+    if routed is not None:
+        await _record(conversation, question, query, routed['answer'])
+        timing = {'total_ms': round((time.perf_counter() - started) * 1000, 1)}
+        done = {'cached': False, 'route': routed['route'], 'timing': timing}
+        return Response(
+            routed_events(routed['answer'], conversation.reply(done)),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    retrieval_ms = (time.perf_counter() - started) * 1000
+    sources = source_list(relevant_chunks)
+
+    # Check the cache and reserve a Gemini slot before the stream starts, so an open
+    # circuit or a full queue is answered with 503 and Retry-After rather than an error event
+    use_cache = not conversation.has_history
+    cached_answer = None
+    if use_cache:
+        cached_answer = await _blocking(answer_cache.lookup, query_embedding, chunk_ids, store.version)
+    slot = None
+    if cached_answer is None:
+        try:
+            slot = await llm.admit_async()
+        except llm.LLMUnavailable as e:
+            return _unavailable_response(e)
+
+    async def events():
+        yield sse_event('sources', {'sources': sources})
+        timing = {'retrieval_ms': round(retrieval_ms, 1)}
+
+        if cached_answer is not None:
+            timing['first_token_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            yield sse_event('token', {'text': cached_answer})
+            timing['total_ms'] = timing['first_token_ms']
+            await _record(conversation, question, query, cached_answer)
+            yield sse_event('done', conversation.reply({'cached': True, 'timing': timing}))
+            return
+
+        with span("prompt"):
+            prompt, prompt_info = build_lead_prompt(question, relevant_chunks, history=conversation.history_text())
+        generation_started = time.perf_counter()
+        parts = []
+        try:
+            with span("generate"):
+                async for text in llm.astream(prompt, ANSWER_MODEL, endpoint='/api/chat/stream', slot=slot):
+                    if not parts:
+                        timing['first_token_ms'] = round((time.perf_counter() - started) * 1000, 1)
+                    parts.append(text)
+                    yield sse_event('token', {'text': text})
+        except llm.LLMError as e:
+            print(f"Error streaming response: {e}")
+            yield sse_event('error', {'error': 'Failed to generate response.'})
+            return
+
+        answer_text = "".join(parts)
+        if not answer_text.strip():
+            answer_text = FALLBACK_ANSWER
+            yield sse_event('token', {'text': answer_text})
+        elif use_cache:
+            await _blocking(answer_cache.store, query_embedding, chunk_ids, answer_text, store.version,
+                            time.perf_counter() - generation_started)
+        await _record(conversation, question, query, answer_text)
+        timing['total_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        yield sse_event('done', conversation.reply(
+            {'cached': False, 'timing': timing, 'prompt_tokens': prompt_info['prompt_tokens']}
+        ))
+
+    async def released(body):
+        # llm.astream releases the slot once it runs; this covers streams that end before it
+        try:
+            async for event in body:
+                yield event
+        finally:
+            if slot is not None:
+                slot.release()
+
+    response = Response(
+        released(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    response.timeout = None  # stream for as long as generation takes
+    return response
+
+if __name__ == '__main__':
+    import uvicorn
+    port = int(os.environ.get('PORT', 8080))
+    print(f"🚀 Starting async server on http://localhost:{port}")
+    print(f"📡 API endpoint: http://localhost:{port}/api/chat")
+    uvicorn.run(app, host='0.0.0.0', port=port)
@@ -0,0 +1,2 @@
+# bench - Offline benchmarks: embeddings, retrieval, ingest and end-to-end chat
+# Run from the repository root, e.g. `python -m bench` or `python -m bench.bench_retrieval`.
@@ -0,0 +1,32 @@
+# bench/__main__.py - Run every benchmark and write bench/results/<name>.json
+# Run with: python -m bench [--quick] [--only retrieval,chat]
+import argparse
+from bench import bench_embeddings, bench_retrieval, bench_vector_index, bench_ingest, bench_chat
+from bench.common import parse_list, write_results
+
+# name -> (module, arguments for --quick)
+BENCHMARKS = {
+    "embeddings": (bench_embeddings, ["--texts", "128", "--queries", "64"]),
+    "retrieval": (bench_retrieval, ["--sizes", "1000,10000,100000", "--queries", "100"]),
+    "vector_index": (bench_vector_index, ["--sizes", "10000,100000", "--queries", "100"]),
+    "ingest": (bench_ingest, ["--files", "20", "--chars", "10000"]),
+    "chat": (bench_chat, ["--concurrency", "1,8", "--requests", "50"]),
+    "chat_stream": (bench_chat, ["--concurrency", "1,8", "--requests", "50", "--stream"]),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite.")
+    parser.add_argument("--quick", action="store_true", help="smaller corpora and fewer requests")
+    parser.add_argument("--only", type=lambda v: parse_list(v, str), default=list(BENCHMARKS),
+                        help=f"comma-separated subset of: {', '.join(BENCHMARKS)}")
+    args = parser.parse_args()
+
+    for name in args.only:
+        module, quick_args = BENCHMARKS[name]
+        defaults = ["--stream"] if name == "chat_stream" else []
+        bench_args = module.build_parser().parse_args(quick_args if args.quick else defaults)
+        print(f"== {name} ==")
+        write_results(name, module.run(bench_args), bench_args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# bench/bench_chat.py - End-to-end /api/chat load test
+# Starts bench/fake_gemini.py and app.py in-process (or targets a running server
+# with --url), then drives N concurrent clients per concurrency level and reports
+# p50/p95/p99 latency, throughput, errors, time to first token for the streaming
+# endpoint and the mean of each Server-Timing stage.
+#
+# Run with: python -m bench.bench_chat --concurrency 1,8,32 --requests 200 --latency-ms 400
+# Against Gunicorn: start the fake API (python -m bench.fake_gemini), run the app with
+# GEMINI_API_ENDPOINT=http://127.0.0.1:8765, then pass --url http://127.0.0.1:8080.
+#
+# --no-model makes the embedding model fail to load in-process and exits non-zero if
+# any request fails: a check that lexical retrieval answers without the model.
+#   RETRIEVAL_MODE=lexical LEXICAL_FALLBACK=false python -m bench.bench_chat --no-model --concurrency 1,8 --requests 20
+import argparse
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from bench.common import percentiles, parse_list, write_results
+from bench.fake_gemini import FakeGeminiServer
+
+QUESTIONS = [
+    "What services do you offer?",
+    "How much does a custom chatbot cost?",
+    "Who are the founders of Convo Sol?",
+    "Can you build a voice agent for my clinic?",
+    "Do you integrate with our CRM?",
+    "How long does a typical project take?",
+    "Can I book a meeting with your team?",
+    "What industries have you worked with?",
+    "Do you offer support after deployment?",
+    "How do you handle data security?",
+]
+
+def _post(url, path, question, stream, timeout):
+    """Send one chat request; returns (ok, seconds, seconds to first token, Server-Timing header)."""
+    parsed = urllib.parse.urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+    connection = connection_class(parsed.hostname, parsed.port, timeout=timeout)
+    started = time.perf_counter()
+    first_token = None
+    try:
+        connection.request("POST", path, body=json.dumps({"question": question}),
+                           headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        ok = response.status == 200
+        if stream and ok:
+            for line in response:
+                if first_token is None and line.startswith(b"event: token"):
+                    first_token = time.perf_counter() - started
+                elif line.startswith(b"event: error"):
+                    ok = False
+        else:
+            response.read()
+        return ok, time.perf_counter() - started, first_token, response.getheader("Server-Timing")
+    except (OSError, http.client.HTTPException):
+        return False, time.perf_counter() - started, None, None
+    finally:
+        connection.close()
+
+def _server_timing_means(headers):
+    stages = {}
+    for header in headers:
+        for entry in (header or "").split(","):
+            name, _, duration = entry.strip().partition(";dur=")
+            if duration:
+                stages.setdefault(name, []).append(float(duration))
+    return {name: round(sum(values) / len(values), 3) for name, values in stages.items()}
+
+def run_level(url, path, concurrency, requests, stream, unique, timeout, offset):
+    outcomes = [None] * requests
+
+    def one(i):
+        question = QUESTIONS[i % len(QUESTIONS)]
+        if unique:
+            question = f"{question} (request {offset + i})"
+        outcomes[i] = _post(url, path, question, stream, timeout)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    succeeded = [o for o in outcomes if o[0]]
+    result = {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": requests - len(succeeded),
+        "throughput_rps": round(len(succeeded) / elapsed, 2),
+        "latency": percentiles([o[1] for o in succeeded]),
+        "server_timing_mean_ms": _server_timing_means(o[3] for o in succeeded)
+    }
+    if stream:
+        result["first_token"] = percentiles([o[2] for o in succeeded if o[2] is not None])
+    return result
+
+def _start_app(args):
+    """Serve app.py in-process on a free port, pointed at the fake Gemini API."""
+    from werkzeug.serving import make_server
+    import answer_cache
+    from app import app
+    from llm import get_genai
+
+    # Configure here rather than through the environment: config.py may already have been imported.
+    # get_genai() first, so its own lazy configuration has already run and cannot override this.
+    genai = get_genai()
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY") or "bench", transport="rest",
+                    client_options={"api_endpoint": args.fake_url})
+    if not args.answer_cache:
+        answer_cache._cache.maxsize = 0
+    if args.no_model:
+        import embeddings
+
+        embeddings.EMBEDDING_BACKEND = "none"  # every load fails, as with a missing model
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def run(args):
+    fake = app_server = None
+    url = args.url
+    if url is None:
+        fake = FakeGeminiServer(latency_ms=args.latency_ms, chunks=args.chunks,
+                                chunk_interval_ms=args.chunk_interval_ms, error_rate=args.error_rate).start()
+        args.fake_url = fake.url
+        app_server, url = _start_app(args)
+
+    path = "/api/chat/stream" if args.stream else "/api/chat"
+    try:
+        # Warm up: model load, index load and connection setup are not part of the measurement
+        run_level(url, path, 1, args.warmup, args.stream, True, args.timeout, offset=10 ** 6)
+        levels = []
+        offset = 0
+        for concurrency in args.concurrency:
+            level = run_level(url, path, concurrency, args.requests, args.stream, not args.repeat_questions,
+                              args.timeout, offset)
+            offset += args.requests
+            levels.append(level)
+            latency = level["latency"]
+            print(f"{concurrency:>4} clients: {level['throughput_rps']:7.2f} req/s, p50 {latency.get('p50_ms', 0):.1f} ms, "
+                  f"p95 {latency.get('p95_ms', 0):.1f} ms, p99 {latency.get('p99_ms', 0):.1f} ms, {level['errors']} errors")
+    finally:
+        if app_server is not None:
+            app_server.shutdown()
+        if fake is not None:
+            fake.stop()
+
+    return {
+        "target": args.url or "in-process app.py",
+        "endpoint": path,
+        "fake_gemini": None if args.url else {
+            "latency_ms": args.latency_ms, "chunks": args.chunks,
+            "chunk_interval_ms": args.chunk_interval_ms, "error_rate": args.error_rate,
+            "requests_seen": fake.stats["requests"]
+        },
+        "unique_questions": not args.repeat_questions,
+        "levels": levels
+    }
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Load-test /api/chat against a fake Gemini API.")
+    parser.add_argument("--url", help="base URL of a running server (default: start app.py in-process)")
+    parser.add_argument("--concurrency", type=parse_list, default=[1, 8, 32], help="concurrent clients per level")
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--stream", action="store_true", help="use /api/chat/stream and measure time to first token")
+    parser.add_argument("--repeat-questions", action="store_true",
+                        help="reuse the same questions (exercises caches) instead of making each one unique")
+    parser.add_argument("--answer-cache", action="store_true", help="keep the semantic answer cache on in-process")
+    parser.add_argument("--latency-ms", type=float, default=400, help="fake Gemini delay before the first part")
+    parser.add_argument("--chunks", type=int, default=8, help="fake Gemini streamed parts")
+    parser.add_argument("--chunk-interval-ms", type=float, default=30, help="fake Gemini delay between parts")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake Gemini calls failing with 503")
+    parser.add_argument("--no-model", action="store_true",
+                        help="make the embedding model fail to load in-process; exit non-zero on any failed request")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="JSON output path (default bench/results/chat.json or chat_stream.json)")
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    if args.no_model and args.url:
+        raise SystemExit("--no-model needs the in-process app (drop --url)")
+    results = run(args)
+    write_results("chat_stream" if args.stream else "chat", results, args.output)
+    errors = sum(level["errors"] for level in results["levels"])
+    if args.no_model and errors:
+        raise SystemExit(f"❌ {errors} requests failed without the embedding model")
+
+if __name__ == "__main__":
+    main()
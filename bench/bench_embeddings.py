@@ -0,0 +1,103 @@
+# bench/bench_embeddings.py - Embedding throughput
+# Measures get_embeddings() throughput at several batch sizes (cache disabled, as
+# during ingest), single-query latency through the micro-batcher from concurrent
+# threads (as under Gunicorn), and the latency of an embedding cache hit.
+#
+# Run with: python -m bench.bench_embeddings --batch-sizes 1,8,32,128 --threads 1,4,16
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from bench.common import percentiles, synthetic_text, parse_list, write_results
+
+def bench_batches(get_embeddings, texts, batch_sizes):
+    results = []
+    for batch_size in batch_sizes:
+        latencies = []
+        started = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            batch_started = time.perf_counter()
+            get_embeddings(texts[i:i + batch_size], use_cache=False)
+            latencies.append(time.perf_counter() - batch_started)
+        elapsed = time.perf_counter() - started
+        results.append({
+            "batch_size": batch_size,
+            "texts": len(texts),
+            "texts_per_s": round(len(texts) / elapsed, 1),
+            "batch_latency": percentiles(latencies)
+        })
+        print(f"batch {batch_size:>4}: {len(texts) / elapsed:8.1f} texts/s")
+    return results
+
+def bench_concurrent_queries(get_embeddings, queries, thread_counts):
+    """Each thread embeds one query at a time, like a request handler does."""
+    results = []
+    for threads in thread_counts:
+        latencies = []
+
+        def one(query):
+            started = time.perf_counter()
+            get_embeddings([query], normalize=True, use_cache=False)
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(one, queries))
+        elapsed = time.perf_counter() - started
+        results.append({
+            "threads": threads,
+            "queries": len(queries),
+            "queries_per_s": round(len(queries) / elapsed, 1),
+            "latency": percentiles(latencies)
+        })
+        print(f"{threads:>3} threads: {len(queries) / elapsed:8.1f} queries/s, "
+              f"p95 {results[-1]['latency']['p95_ms']:.2f} ms")
+    return results
+
+def run(args):
+    import embeddings
+
+    rng = np.random.default_rng(args.seed)
+    texts = [synthetic_text(rng, args.words) for _ in range(args.texts)]
+    queries = [synthetic_text(rng, 10) for _ in range(args.queries)]
+
+    started = time.perf_counter()
+    embeddings._get_model()
+    embeddings.get_embeddings(texts[:1], use_cache=False)
+    model_load_s = time.perf_counter() - started
+    print(f"Model loaded in {model_load_s:.2f}s")
+
+    results = {
+        "model_load_s": round(model_load_s, 3),
+        "words_per_text": args.words,
+        "batches": bench_batches(embeddings.get_embeddings, texts, args.batch_sizes),
+        "concurrent_queries": bench_concurrent_queries(embeddings.get_embeddings, queries, args.threads)
+    }
+
+    embeddings.get_embeddings([queries[0]])
+    hits = []
+    for _ in range(1000):
+        started = time.perf_counter()
+        embeddings.get_embeddings([queries[0]])
+        hits.append(time.perf_counter() - started)
+    results["cache_hit"] = percentiles(hits)
+    results["batcher"] = embeddings.batcher_stats()
+    return results
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark embedding throughput.")
+    parser.add_argument("--batch-sizes", type=parse_list, default=[1, 8, 32, 128])
+    parser.add_argument("--threads", type=parse_list, default=[1, 4, 16], help="concurrent single-query callers")
+    parser.add_argument("--texts", type=int, default=512, help="texts per batch-size run")
+    parser.add_argument("--words", type=int, default=120, help="words per text (~800 characters, one chunk)")
+    parser.add_argument("--queries", type=int, default=256, help="queries per thread-count run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON output path (default bench/results/embeddings.json)")
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    write_results("embeddings", run(args), args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# bench/bench_ingest.py - Ingest throughput
+# Generates a synthetic data/ directory in a scratch folder and times ingest.py there:
+# a full build, a re-run with nothing changed, and a re-run after editing one file.
+# The repository's own data/ and db/ are never touched.
+#
+# Run with: python -m bench.bench_ingest --files 200 --chars 20000 --workers 1
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from bench.common import synthetic_text, write_results
+
+# Keep every ingest output inside the scratch directory, whatever the environment says
+os.environ["INGEST_MANIFEST_PATH"] = "db/manifest.json"
+os.environ["SNAPSHOT_DIR"] = "db/snapshots"
+
+def _write_corpus(root, files, chars, rng):
+    os.makedirs(os.path.join(root, "data"))
+    for i in range(files):
+        words = max(1, chars // 7)
+        with open(os.path.join(root, "data", f"doc{i:05d}.txt"), "w", encoding="utf-8") as f:
+            f.write(synthetic_text(rng, words))
+
+def _chunk_count(manifest_path):
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return sum(len(entry["chunks"]) for entry in json.load(f)["files"].values())
+
+def run(args):
+    rng = np.random.default_rng(args.seed)
+    scratch = tempfile.mkdtemp(prefix="ingest-bench-")
+    previous_cwd = os.getcwd()
+    try:
+        _write_corpus(scratch, args.files, args.chars, rng)
+        # ingest.py works on data/ and db/ relative to the working directory
+        os.chdir(scratch)
+        import ingest
+        import embeddings
+
+        # Time the pipeline, not the one-off model load (worker processes still load their own)
+        if args.workers <= 1:
+            embeddings.get_embeddings(["warm up"], use_cache=False)
+
+        timings = {}
+        started = time.perf_counter()
+        ingest.build_db(full=True, batch_size=args.batch_size, workers=args.workers)
+        timings["full"] = time.perf_counter() - started
+        chunks = _chunk_count(ingest.INGEST_MANIFEST_PATH)
+
+        started = time.perf_counter()
+        ingest.build_db(batch_size=args.batch_size, workers=args.workers)
+        timings["unchanged"] = time.perf_counter() - started
+
+        with open(os.path.join("data", "doc00000.txt"), "a", encoding="utf-8") as f:
+            f.write(" " + synthetic_text(rng, 50))
+        started = time.perf_counter()
+        ingest.build_db(batch_size=args.batch_size, workers=args.workers)
+        timings["one_file_changed"] = time.perf_counter() - started
+    finally:
+        os.chdir(previous_cwd)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return {
+        "files": args.files,
+        "chars_per_file": args.chars,
+        "chunks": chunks,
+        "batch_size": args.batch_size,
+        "workers": args.workers,
+        "full_s": round(timings["full"], 3),
+        "full_chunks_per_s": round(chunks / timings["full"], 1),
+        "unchanged_s": round(timings["unchanged"], 3),
+        "one_file_changed_s": round(timings["one_file_changed"], 3)
+    }
+
+def build_parser():
+    from config import INGEST_BATCH_SIZE, INGEST_WORKERS
+    parser = argparse.ArgumentParser(description="Benchmark ingest.py on a synthetic corpus.")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--chars", type=int, default=20000, help="characters per file")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON output path (default bench/results/ingest.json)")
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    results = run(args)
+    print(f"{results['chunks']} chunks: full build {results['full_s']}s ({results['full_chunks_per_s']} chunks/s), "
+          f"unchanged {results['unchanged_s']}s, one file changed {results['one_file_changed_s']}s")
+    write_results("ingest", results, args.output)
+
+if __name__ == "__main__":
+    main()
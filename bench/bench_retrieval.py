@@ -0,0 +1,156 @@
+# bench/bench_retrieval.py - Vector search latency on synthetic corpora
+# Builds an InMemoryVectorStore of random unit vectors for each corpus size and
+# measures single-query search, batched search and (unless --no-model) the full
+# retrieve_top_k path including query embedding. With --lexical it also builds a
+# BM25 index over Zipf-distributed synthetic texts (word frequencies like real
+# text) and times lexical search, which needs no embedding model.
+#
+# Run with: python -m bench.bench_retrieval --sizes 1000,10000,100000,1000000 [--lexical]
+# A 1M-chunk corpus at 384 dimensions needs about 1.5 GB of RAM.
+import argparse
+import time
+import numpy as np
+from bench.common import percentiles, synthetic_text, parse_list, write_results
+
+class SyntheticChunks:
+    """Chunk records generated on access, so large corpora only cost memory for their vectors."""
+
+    def __init__(self, count, files=100):
+        self.count = count
+        self.files = files
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.count:
+            raise IndexError("chunk index out of range")
+        return {
+            "id": f"synthetic-{i}",
+            "text": f"Synthetic chunk {i}",
+            "filename": f"file{i % self.files}.txt",
+            "chunk_index": i // self.files,
+            "start": None,
+            "end": None
+        }
+
+def random_unit_vectors(rng, count, dim, block=65536):
+    """float32 matrix of unit-length rows, generated in blocks to bound peak memory."""
+    matrix = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, block):
+        rows = rng.standard_normal((min(block, count - start), dim), dtype=np.float32)
+        rows /= np.linalg.norm(rows, axis=1, keepdims=True)
+        matrix[start:start + len(rows)] = rows
+    return matrix
+
+def zipf_texts(rng, count, words=80, vocab=50000, block=65536):
+    """Synthetic texts whose word frequencies follow Zipf's law over a `vocab`-word vocabulary."""
+    for start in range(0, count, block):
+        n = min(block, count - start)
+        ids = np.minimum(rng.zipf(1.1, (n, words)), vocab)
+        for row in ids:
+            yield " ".join(f"w{i}" for i in row)
+
+def _bench_lexical(rng, store, size, args):
+    from bm25 import BM25Builder, BM25Index
+
+    started = time.perf_counter()
+    builder = BM25Builder()
+    builder.add(zipf_texts(rng, size))
+    store.lexical = BM25Index(*builder.arrays())
+    build_s = time.perf_counter() - started
+    del builder
+    queries = [" ".join(f"w{i}" for i in np.minimum(rng.zipf(1.1, 4), 50000)) for _ in range(args.queries)]
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        store.search_lexical(query, top_k=args.top_k)
+        timings.append(time.perf_counter() - started)
+    return dict(percentiles(timings), build_s=round(build_s, 2), postings=int(len(store.lexical.rows)))
+
+def run(args):
+    import retrieval
+    from retrieval import InMemoryVectorStore
+
+    get_embeddings = None
+    dim = args.dim
+    if not args.no_model:
+        from embeddings import get_embeddings, _get_model
+        dim = _get_model().get_sentence_embedding_dimension()
+
+    rng = np.random.default_rng(args.seed)
+    queries = random_unit_vectors(rng, args.queries, dim)
+    results = []
+    for size in args.sizes:
+        started = time.perf_counter()
+        matrix = random_unit_vectors(rng, size, dim)
+        store = InMemoryVectorStore(matrix, SyntheticChunks(size), normalized=True, version=f"synthetic-{size}")
+        build_s = time.perf_counter() - started
+
+        store.search(queries[0], top_k=args.top_k)
+        single = []
+        for query in queries:
+            started = time.perf_counter()
+            store.search(query, top_k=args.top_k)
+            single.append(time.perf_counter() - started)
+
+        batched = []
+        for i in range(0, len(queries), args.batch):
+            started = time.perf_counter()
+            store.search_batch(queries[i:i + args.batch], top_k=args.top_k)
+            batched.append(time.perf_counter() - started)
+
+        result = {
+            "chunks": size,
+            "dim": dim,
+            "top_k": args.top_k,
+            "matrix_mb": round(matrix.nbytes / 2 ** 20, 1),
+            "build_s": round(build_s, 3),
+            "search": percentiles(single),
+            "search_batch": dict(percentiles(batched), batch_size=args.batch,
+                                 queries_per_s=round(len(queries) / sum(batched), 1))
+        }
+
+        if args.lexical:
+            result["lexical_search"] = _bench_lexical(rng, store, size, args)
+
+        if get_embeddings is not None:
+            # Serve this store through get_store() and time the request path end to end
+            retrieval._store, retrieval._store_checked_at = store, float("inf")
+            texts = [synthetic_text(rng, 12) for _ in range(args.queries)]
+            retrieval.retrieve_top_k(texts[0], top_k=args.top_k)
+            full = []
+            for text in texts[1:]:
+                started = time.perf_counter()
+                retrieval.retrieve_top_k(text, top_k=args.top_k)
+                full.append(time.perf_counter() - started)
+            result["retrieve_top_k"] = percentiles(full)
+            retrieval._store = None
+
+        results.append(result)
+        print(f"{size:>8} chunks: search p50 {result['search']['p50_ms']:.3f} ms, "
+              f"p99 {result['search']['p99_ms']:.3f} ms"
+              + (f", BM25 search p50 {result['lexical_search']['p50_ms']:.3f} ms" if "lexical_search" in result else "")
+              + (f", retrieve_top_k p50 {result['retrieve_top_k']['p50_ms']:.3f} ms" if "retrieve_top_k" in result else ""))
+        del store, matrix
+    return {"corpora": results}
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark vector search on synthetic corpora.")
+    parser.add_argument("--sizes", type=parse_list, default=[1000, 10000, 100000, 1000000], help="corpus sizes in chunks")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--batch", type=int, default=32, help="queries per search_batch call")
+    parser.add_argument("--dim", type=int, default=384, help="vector dimension when --no-model is set")
+    parser.add_argument("--no-model", action="store_true", help="skip retrieve_top_k (no embedding model needed)")
+    parser.add_argument("--lexical", action="store_true", help="also build a BM25 index and time lexical search")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON output path (default bench/results/retrieval.json)")
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    write_results("retrieval", run(args), args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# bench/bench_vector_index.py - Recall vs latency of the approximate vector backends against exact search
+# For each corpus size, builds flat, IVF and IVF-PQ indexes and int8 / binary codes
+# over clustered synthetic unit vectors (random uniform vectors have no neighborhoods
+# for IVF to exploit), loads them the way the server does (IVF lists and codes
+# memory-mapped) and reports, per nprobe or re-scoring factor, recall@k against
+# exact search, search latency, the file size and the memory the loaded index adds
+# to the process (for codes, once a search has touched them).
+#
+# Run with: python -m bench.bench_vector_index --sizes 10000,100000,1000000 --nprobe 1,4,16,64 --rerank 1,4,20
+# FAISS types need faiss-cpu. A 1M-chunk corpus at 384 dimensions needs about 1.5 GB of RAM.
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from bench.common import percentiles, parse_list, write_results
+from bench.bench_retrieval import SyntheticChunks
+
+def clustered_unit_vectors(rng, count, dim, clusters, spread=0.35, block=65536):
+    """Unit vectors scattered around `clusters` random centers, like embeddings of related texts."""
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    matrix = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, block):
+        n = min(block, count - start)
+        rows = centers[rng.integers(0, clusters, n)] + spread * rng.standard_normal((n, dim), dtype=np.float32) / np.sqrt(dim)
+        rows /= np.linalg.norm(rows, axis=1, keepdims=True)
+        matrix[start:start + n] = rows
+    return matrix
+
+def _rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+def _bench_quantized(kind, matrix, queries, scratch, version, args):
+    """Write one kind of codes, load them memory-mapped and measure each re-scoring factor."""
+    from recall import exact_top_k, measure_recall as measure_search
+    from quantized import Int8Codes, BinaryCodes, load_quantized, quantized_search, INT8_CODES_FILE, BINARY_CODES_FILE
+
+    started = time.perf_counter()
+    codes = Int8Codes.encode(matrix) if kind == "int8" else BinaryCodes.encode(matrix)
+    build_s = time.perf_counter() - started
+    path = os.path.join(scratch, version)
+    os.makedirs(path)
+    files = {"int8": [INT8_CODES_FILE, "int8_scale.npy"], "binary": [BINARY_CODES_FILE]}[kind]
+    np.save(os.path.join(path, files[0]), codes.codes)
+    if kind == "int8":
+        np.save(os.path.join(path, files[1]), codes.scale)
+    del codes
+
+    truth = exact_top_k(matrix, queries, args.top_k)
+    rss_before = _rss_mb()
+    codes = load_quantized(version, kind, root=scratch)
+    report = []
+    for factor in args.rerank:
+        point = measure_search(quantized_search(codes, matrix, factor), matrix, queries, k=args.top_k, truth=truth)
+        report.append(dict(rerank=factor, **point))
+    loaded_mb = _rss_mb() - rss_before
+    return dict(
+        type=kind,
+        build_s=round(build_s, 2),
+        file_mb=round(sum(os.path.getsize(os.path.join(path, name)) for name in files) / 2 ** 20, 1),
+        loaded_rss_mb=round(loaded_mb, 1),
+        rerank=report
+    )
+
+def run(args):
+    from retrieval import InMemoryVectorStore
+    from recall import ExactRerank
+    from faiss_index import build_index, measure_recall, load_faiss_index, INDEX_FILE, INFO_FILE
+    from config import FAISS_RERANK
+
+    rng = np.random.default_rng(args.seed)
+    scratch = tempfile.mkdtemp(prefix="bench-vector-index-")
+    results = []
+    try:
+        for size in args.sizes:
+            matrix = clustered_unit_vectors(rng, size, args.dim, max(size // 100, 10))
+            # Queries: perturbed corpus rows, so each has real neighbors but is not itself indexed
+            rows = rng.integers(0, size, args.queries)
+            queries = matrix[rows] + 0.2 * rng.standard_normal((args.queries, args.dim), dtype=np.float32) / np.sqrt(args.dim)
+            queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+            exact = InMemoryVectorStore(matrix, SyntheticChunks(size), normalized=True, version="exact")
+            exact_timings = []
+            for query in queries:
+                started = time.perf_counter()
+                exact.search(query, top_k=args.top_k)
+                exact_timings.append(time.perf_counter() - started)
+            corpus = {
+                "chunks": size,
+                "dim": args.dim,
+                "top_k": args.top_k,
+                "matrix_mb": round(matrix.nbytes / 2 ** 20, 1),
+                "exact_search": percentiles(exact_timings),
+                "indexes": []
+            }
+
+            for index_type in args.types:
+                if index_type in ("int8", "binary"):
+                    result = _bench_quantized(index_type, matrix, queries, scratch, f"{index_type}-{size}", args)
+                    corpus["indexes"].append(result)
+                    for point in result["rerank"]:
+                        print(f"{size:>8} chunks {index_type:>6} rerank {point['rerank']:>3}x: recall@{args.top_k} "
+                              f"{point['recall']:.3f}, p50 {point['p50_ms']:.3f} ms, p95 {point['p95_ms']:.3f} ms")
+                    shutil.rmtree(os.path.join(scratch, f"{index_type}-{size}"))
+                    continue
+                import faiss
+
+                started = time.perf_counter()
+                index, info = build_index(matrix, index_type)
+                build_s = time.perf_counter() - started
+                version = f"{index_type}-{size}"
+                os.makedirs(os.path.join(scratch, version))
+                faiss.write_index(index, os.path.join(scratch, version, INDEX_FILE))
+                with open(os.path.join(scratch, version, INFO_FILE), "w", encoding="utf-8") as f:
+                    f.write("{}")
+                del index
+
+                rss_before = _rss_mb()
+                index, _ = load_faiss_index(version, root=scratch)
+                loaded_mb = _rss_mb() - rss_before
+                rerank = ExactRerank(matrix, FAISS_RERANK) if info["type"] == "ivfpq" else None
+                nprobes = args.nprobe if info["type"] != "flat" else [0]
+                report = measure_recall(index, matrix, k=args.top_k, nprobes=nprobes, queries=queries, rerank=rerank)
+                corpus["indexes"].append(dict(
+                    info,
+                    build_s=round(build_s, 2),
+                    file_mb=round(os.path.getsize(os.path.join(scratch, version, INDEX_FILE)) / 2 ** 20, 1),
+                    loaded_rss_mb=round(loaded_mb, 1),
+                    nprobe=report
+                ))
+                for point in report:
+                    label = f"nprobe {point['nprobe']:>3}" if info["type"] != "flat" else "exact    "
+                    print(f"{size:>8} chunks {info['type']:>6} {label}: recall@{args.top_k} {point['recall']:.3f}, "
+                          f"p50 {point['p50_ms']:.3f} ms, p95 {point['p95_ms']:.3f} ms")
+                del index
+                shutil.rmtree(os.path.join(scratch, version))
+            print(f"{size:>8} chunks numpy exact search: p50 {corpus['exact_search']['p50_ms']:.3f} ms")
+            results.append(corpus)
+            del exact, matrix
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return {"corpora": results}
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark approximate vector search recall and latency against exact search.")
+    parser.add_argument("--sizes", type=parse_list, default=[10000, 100000, 1000000], help="corpus sizes in chunks")
+    parser.add_argument("--types", type=lambda v: parse_list(v, str), default=["flat", "ivf", "ivfpq", "int8", "binary"])
+    parser.add_argument("--nprobe", type=parse_list, default=[1, 4, 16, 64], help="IVF lists searched per query")
+    parser.add_argument("--rerank", type=parse_list, default=[1, 4, 20], help="int8/binary candidates per result re-scored exactly")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON output path (default bench/results/vector_index.json)")
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    write_results("vector_index", run(args), args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# bench/common.py - Shared helpers for the benchmark scripts
+import json
+import os
+import platform
+import subprocess
+import time
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "bench", "results")
+
+WORDS = (
+    "ai chatbot automation voice agent lead customer support workflow integration website "
+    "crm pricing meeting project team founder data model training deployment cloud api "
+    "analytics dashboard sales marketing email booking appointment service business growth "
+    "convo sol saas platform solution consultation demo onboarding scale secure custom"
+).split()
+
+def percentiles(samples):
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples, dtype=np.float64) * 1000.0
+    return {
+        "count": int(len(ms)),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3)
+    }
+
+def synthetic_text(rng, n_words):
+    """Deterministic filler text drawn from a small business vocabulary."""
+    return " ".join(WORDS[i] for i in rng.integers(0, len(WORDS), n_words))
+
+def parse_list(value, cast=int):
+    """Parse a comma-separated command line value such as "1,8,32"."""
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+def environment():
+    """Machine and build details stored with every result so runs can be compared."""
+    return {
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "embedding_model": os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2"),
+        "embedding_backend": os.getenv("EMBEDDING_BACKEND", "torch")
+    }
+
+def write_results(name, results, output=None):
+    """Write results as JSON (default bench/results/<name>.json) and return the path."""
+    path = output or os.path.join(RESULTS_DIR, f"{name}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    document = {
+        "benchmark": name,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": environment(),
+        "results": results
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+    print(f"Results written to {path}")
+    return path
@@ -0,0 +1,67 @@
+# bench/compare.py - Compare two benchmark result files and flag regressions
+# Latencies (*_ms, *_s) regress when they grow, throughputs (*_per_s, *_rps) when
+# they shrink. Exits with status 1 if any metric is worse than --threshold.
+#
+# Run with: python -m bench.compare baseline/retrieval.json bench/results/retrieval.json
+import argparse
+import json
+import sys
+
+HIGHER_IS_BETTER = ("_per_s", "_rps")
+LOWER_IS_BETTER = ("_ms", "_s")
+IGNORED = ("max_ms", "mean_ms")  # single outliers; compare percentiles instead
+
+def _flatten(node, prefix=""):
+    """Yield (path, value) for every numeric leaf; list items are keyed by their first value (e.g. chunks=1000)."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from _flatten(value, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(node, list):
+        for i, item in enumerate(node):
+            label = i
+            if isinstance(item, dict) and item:
+                first_key = next(iter(item))
+                label = f"{first_key}={item[first_key]}"
+            yield from _flatten(item, f"{prefix}[{label}]")
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        yield prefix, float(node)
+
+def compare(baseline, current, threshold):
+    """Return a list of (path, baseline, current, change, regressed) for comparable metrics."""
+    before = dict(_flatten(baseline["results"]))
+    rows = []
+    for path, value in _flatten(current["results"]):
+        key = path.rsplit(".", 1)[-1]
+        if path not in before or key.endswith(IGNORED):
+            continue
+        if key.endswith(HIGHER_IS_BETTER):
+            worse_by = (before[path] - value) / before[path] if before[path] else 0.0
+        elif key.endswith(LOWER_IS_BETTER):
+            worse_by = (value - before[path]) / before[path] if before[path] else 0.0
+        else:
+            continue
+        rows.append((path, before[path], value, worse_by, worse_by > threshold))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare benchmark results against a baseline.")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown as a fraction (default 0.10)")
+    args = parser.parse_args()
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, "r", encoding="utf-8") as f:
+        current = json.load(f)
+
+    regressions = 0
+    for path, before, after, worse_by, regressed in compare(baseline, current, args.threshold):
+        regressions += regressed
+        flag = "REGRESSION" if regressed else ""
+        print(f"{path:<60} {before:>12.3f} -> {after:>12.3f}  {0.0 - worse_by:+7.1%} {flag}")
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
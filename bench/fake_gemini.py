@@ -0,0 +1,174 @@
+# bench/fake_gemini.py - Local stand-in for the Gemini REST API
+# Answers generateContent and streamGenerateContent with canned text after a
+# configurable delay, so benchmarks measure our own overhead without network
+# variance, quota or cost. Point the app at it with GEMINI_API_ENDPOINT.
+#
+# Run with: python -m bench.fake_gemini --port 8765 --latency-ms 400 --chunks 8 --chunk-interval-ms 30
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = (
+    "Convo Sol builds custom AI chatbots, voice agents and automation for growing businesses. "
+    "Tell me a little about your project and I can suggest the best fit, or we can set up a "
+    "quick call with one of our co-founders to go through the details."
+)
+
+_PATH = re.compile(r"^/v1(?:beta)?/models/(?P<model>[^:]+):(?P<method>generateContent|streamGenerateContent)")
+
+def _response(text, prompt_tokens, done):
+    candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    if done:
+        candidate["finishReason"] = "STOP"
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": len(ANSWER) // 4,
+            "totalTokenCount": prompt_tokens + len(ANSWER) // 4
+        }
+    }
+
+def _split(text, parts):
+    """Split text into roughly equal pieces on word boundaries."""
+    words = text.split(" ")
+    parts = max(1, min(parts, len(words)))
+    size = -(-len(words) // parts)
+    pieces = [" ".join(words[i:i + size]) for i in range(0, len(words), size)]
+    return [p + " " for p in pieces[:-1]] + pieces[-1:]
+
+def make_handler(latency_ms=400, chunks=8, chunk_interval_ms=30, error_rate=0.0):
+    """Build a request handler class with the given timing behaviour."""
+
+    class FakeGeminiHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # headers and body are separate writes; avoid delayed-ACK stalls
+        stats = {"requests": 0, "streams": 0, "errors": 0}
+        _lock = threading.Lock()
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            match = _PATH.match(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not match:
+                self._send_json(404, {"error": {"code": 404, "message": f"Unknown path {self.path}", "status": "NOT_FOUND"}})
+                return
+            stream = match.group("method") == "streamGenerateContent"
+            with self._lock:
+                self.stats["requests"] += 1
+                self.stats["streams"] += stream
+
+            prompt = "".join(
+                part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", [])
+            )
+            prompt_tokens = len(prompt) // 4
+
+            time.sleep(latency_ms / 1000.0)
+            if error_rate and random.random() < error_rate:
+                with self._lock:
+                    self.stats["errors"] += 1
+                self._send_json(503, {"error": {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}})
+                return
+
+            if not stream:
+                self._send_json(200, _response(ANSWER, prompt_tokens, done=True))
+                return
+
+            # Streamed responses are a JSON array written element by element (alt=json),
+            # or one "data:" line per element when the client asks for alt=sse
+            sse = "alt=sse" in self.path
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream" if sse else "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            pieces = _split(ANSWER, chunks)
+            if not sse:
+                self._write_chunk(b"[")
+            for i, piece in enumerate(pieces):
+                if i:
+                    time.sleep(chunk_interval_ms / 1000.0)
+                element = json.dumps(_response(piece, prompt_tokens, done=i == len(pieces) - 1))
+                if sse:
+                    self._write_chunk(f"data: {element}\r\n\r\n".encode("utf-8"))
+                else:
+                    self._write_chunk(((",\r\n" if i else "") + element).encode("utf-8"))
+            if not sse:
+                self._write_chunk(b"]")
+            self._write_chunk(b"")
+
+        def _write_chunk(self, data):
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+    return FakeGeminiHandler
+
+class FakeGeminiServer:
+    """Run the fake API on a background thread; use as a context manager or call start()/stop()."""
+
+    def __init__(self, host="127.0.0.1", port=0, **timing):
+        self.handler = make_handler(**timing)
+        self.httpd = ThreadingHTTPServer((host, port), self.handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def stats(self):
+        return dict(self.handler.stats)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-gemini", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake Gemini generateContent API for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=400, help="delay before the (first part of the) response")
+    parser.add_argument("--chunks", type=int, default=8, help="number of streamed parts")
+    parser.add_argument("--chunk-interval-ms", type=float, default=30, help="delay between streamed parts")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    server = FakeGeminiServer(
+        args.host, args.port, latency_ms=args.latency_ms, chunks=args.chunks,
+        chunk_interval_ms=args.chunk_interval_ms, error_rate=args.error_rate
+    )
+    print(f"Fake Gemini API on {server.url} (set GEMINI_API_ENDPOINT={server.url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
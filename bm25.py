@@ -0,0 +1,199 @@
+# bm25.py - BM25 inverted index for lexical and hybrid retrieval (RETRIEVAL_MODE)
+# ingest.py writes the index into each snapshot, over the same rows as the embeddings:
+#   db/snapshots/<version>/bm25.json          term list (term id = position), chunk count, mean length,
+#                                             tokenizer version (indexes from another version are rebuilt)
+#   db/snapshots/<version>/bm25_offsets.npy   int64 (terms + 1): start of each term's postings
+#   db/snapshots/<version>/bm25_rows.npy      int32: postings (snapshot row ids), grouped by term
+#   db/snapshots/<version>/bm25_tf.npy        uint16: term frequency of each posting
+#   db/snapshots/<version>/bm25_lengths.npy   uint32 (chunks,): tokens per chunk, for length norms
+# The arrays are memory-mapped. A query scores only the postings of its own terms,
+# so it needs neither the embedding model nor a scan of every chunk: it answers in
+# milliseconds while the model is still loading or cannot be loaded, and matches
+# exact terms (product names, emails, "HIPAA") that dense search can miss.
+# BM25_K1 and BM25_B are applied at load time, so changing them needs no re-ingest.
+import os
+import re
+import json
+from array import array
+import numpy as np
+from config import SNAPSHOT_DIR, BM25_K1, BM25_B
+
+INFO_FILE = "bm25.json"
+OFFSETS_FILE = "bm25_offsets.npy"
+ROWS_FILE = "bm25_rows.npy"
+TF_FILE = "bm25_tf.npy"
+LENGTHS_FILE = "bm25_lengths.npy"
+
+# Bumped whenever tokenize() changes: postings written by another version are not used
+TOKENIZER_VERSION = 2
+
+# Words, numbers, and compounds joined by . @ ' - ("GDPR-inspired", "info@convosol.com",
+# "Sol's", "gemini-2.5"). A compound is indexed as its parts plus the whole compound,
+# so "GDPR" finds "GDPR-inspired" and an email or domain still matches as one term.
+_TOKEN = re.compile(r"\w+(?:[.@'-]\w+)*")
+_WORD = re.compile(r"\w+")
+
+# Words too common to tell chunks apart; dropped from documents and queries
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in into is it its "
+    "me my of on or our so than that the their them then there these they this to us was "
+    "we were what when where which who why will with you your s t".split()
+)
+
+def tokenize(text):
+    """
+    Lowercased terms of a text, stopwords removed. Documents and queries share it.
+
+    >>> tokenize("Our GDPR-inspired policy")
+    ['gdpr-inspired', 'gdpr', 'inspired', 'policy']
+    """
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        parts = _WORD.findall(token)
+        if len(parts) > 1:
+            terms.append(token)
+        terms.extend(parts)
+    return [term for term in terms if term not in STOPWORDS]
+
+class BM25Builder:
+    """Accumulate postings chunk by chunk (in snapshot row order), then write() the index files."""
+
+    def __init__(self):
+        self.terms = {}       # term -> term id
+        self.rows = []        # per term id: array of row ids
+        self.tfs = []         # per term id: array of term frequencies
+        self.lengths = array("I")
+
+    def add(self, texts):
+        for text in texts:
+            row = len(self.lengths)
+            counts = {}
+            tokens = tokenize(text or "")
+            for term in tokens:
+                counts[term] = counts.get(term, 0) + 1
+            for term, tf in counts.items():
+                term_id = self.terms.get(term)
+                if term_id is None:
+                    term_id = self.terms[term] = len(self.rows)
+                    self.rows.append(array("i"))
+                    self.tfs.append(array("H"))
+                self.rows[term_id].append(row)
+                self.tfs[term_id].append(min(tf, 65535))
+            self.lengths.append(len(tokens))
+
+    def arrays(self):
+        """(terms, offsets, rows, tfs, lengths) as numpy arrays."""
+        offsets = np.zeros(len(self.rows) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(rows) for rows in self.rows])
+        rows = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.uint16)
+        for term_id, (term_rows, term_tfs) in enumerate(zip(self.rows, self.tfs)):
+            rows[offsets[term_id]:offsets[term_id + 1]] = term_rows
+            tfs[offsets[term_id]:offsets[term_id + 1]] = term_tfs
+        return list(self.terms), offsets, rows, tfs, np.frombuffer(self.lengths, dtype=np.uint32).copy()
+
+    def write(self, path):
+        """Write the index files into a snapshot directory. Returns its info."""
+        terms, offsets, rows, tfs, lengths = self.arrays()
+        np.save(os.path.join(path, OFFSETS_FILE), offsets)
+        np.save(os.path.join(path, ROWS_FILE), rows)
+        np.save(os.path.join(path, TF_FILE), tfs)
+        np.save(os.path.join(path, LENGTHS_FILE), lengths)
+        info = {
+            "count": len(lengths),
+            "avg_length": float(lengths.mean()) if len(lengths) else 0.0,
+            "postings": int(len(rows)),
+            "tokenizer": TOKENIZER_VERSION,
+            "terms": terms
+        }
+        with open(os.path.join(path, INFO_FILE), "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False, separators=(",", ":"))
+        return info
+
+class BM25Index:
+    """
+    Okapi BM25 over postings arrays (memory-mapped from a snapshot, or built in
+    memory). IDF and per-chunk length norms are computed once when loaded.
+    """
+
+    def __init__(self, terms, offsets, rows, tfs, lengths, k1=BM25_K1, b=BM25_B):
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.rows = rows
+        self.tfs = tfs
+        self.k1 = k1
+        count = len(lengths)
+        frequencies = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((count - frequencies + 0.5) / (frequencies + 0.5)).astype(np.float32)
+        avg_length = float(np.mean(lengths)) if count else 0.0
+        self.norms = (k1 * (1 - b + b * np.asarray(lengths, dtype=np.float32) / max(avg_length, 1.0))).astype(np.float32)
+
+    @classmethod
+    def build(cls, texts):
+        """An in-memory index over texts (row ids = positions), for stores without index files."""
+        builder = BM25Builder()
+        builder.add(texts)
+        return cls(*builder.arrays())
+
+    def __len__(self):
+        return len(self.norms)
+
+    def scores(self, query):
+        """BM25 score of every chunk for a query text (0 for chunks sharing no term with it)."""
+        scores = np.zeros(len(self.norms), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            rows = self.rows[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            # A chunk occurs at most once in a term's postings, so plain fancy-index add is safe
+            scores[rows] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + self.norms[rows])
+        return scores
+
+    def search(self, query, k, mask=None):
+        """Row ids and scores of the k best matching chunks, best first; mask optionally restricts rows."""
+        scores = self.scores(query)
+        if mask is not None:
+            scores[~mask] = 0
+        matches = np.flatnonzero(scores > 0)
+        if len(matches) > k:
+            matches = matches[np.argpartition(-scores[matches], k - 1)[:k]]
+        order = np.argsort(-scores[matches], kind="stable")
+        return matches[order], scores[matches[order]]
+
+def load_bm25(version, root=SNAPSHOT_DIR):
+    """
+    A snapshot's BM25 index (postings memory-mapped), or None if it was published
+    without one or with another tokenizer version.
+    """
+    path = os.path.join(root, version)
+    try:
+        with open(os.path.join(path, INFO_FILE), "r", encoding="utf-8") as f:
+            info = json.load(f)
+    except FileNotFoundError:
+        return None
+    if info.get("tokenizer") != TOKENIZER_VERSION:
+        return None
+    return BM25Index(
+        info["terms"],
+        np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r"),
+        np.load(os.path.join(path, ROWS_FILE), mmap_mode="r"),
+        np.load(os.path.join(path, TF_FILE), mmap_mode="r"),
+        np.load(os.path.join(path, LENGTHS_FILE), mmap_mode="r")
+    )
+
+def reciprocal_rank_fusion(rankings, top_k, k=60):
+    """
+    Fuse ranked lists of (score, chunk) by reciprocal rank: each chunk scores
+    sum(1 / (k + rank)) over the lists it appears in. Returns the top_k as
+    (fused score, chunk), best first.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, (score, chunk) in enumerate(ranking, start=1):
+            entry = fused.setdefault(chunk['id'], [0.0, chunk])
+            entry[0] += 1.0 / (k + rank)
+    best = sorted(fused.values(), key=lambda entry: -entry[0])[:top_k]
+    return [(score, chunk) for score, chunk in best]
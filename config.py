@@ -4,9 +4,67 @@ from dotenv import load_dotenv
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")  # e.g. http://127.0.0.1:8765 for bench/fake_gemini.py (REST)
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")  # Local sentence-transformers model
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")  # "torch" (sentence-transformers) or "onnx" (int8 ONNX Runtime)
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", f"models/{EMBEDDING_MODEL}-onnx")  # written by export_onnx.py
+EMBEDDING_ONNX_MIN_COSINE = float(os.getenv("EMBEDDING_ONNX_MIN_COSINE", 0.99))  # min cosine vs torch reference vectors
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 1024))  # cached query embeddings (0 disables)
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", 0))    # seconds; 0 means no expiry
+EMBEDDING_BATCHING = os.getenv("EMBEDDING_BATCHING", "true").lower() == "true"  # coalesce concurrent query encodes
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", 3))  # max wait to fill a batch under load
+EMBEDDING_BATCH_MAX = int(os.getenv("EMBEDDING_BATCH_MAX", 32))               # max texts per batched encode
 CHAT_MODEL = os.getenv("CHAT_MODEL", "gemini-2.0-flash")  # change if you want another model
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 20))        # seconds per Gemini attempt
+LLM_BUDGET = float(os.getenv("LLM_BUDGET", 30))          # seconds for all attempts of one call, backoff included
+LLM_MAX_ATTEMPTS = max(1, int(os.getenv("LLM_MAX_ATTEMPTS", 3)))  # at least one attempt
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 0.5))  # jittered backoff: up to base * 2^attempt seconds
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 4))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() == "true"  # race a second call once one exceeds p95 latency
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))   # failed attempts in a row that open the circuit
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 30))  # seconds the circuit stays open
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 32))    # Gemini calls in flight per process
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", 2))       # max wait for a free slot before 503
 TOP_K = int(os.getenv("TOP_K", 4))
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 800))      # characters per chunk
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 200))# overlap characters
-DB_PATH = "db/db.pkl"
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", 1200))  # max retrieved-context tokens per prompt
+INGEST_MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", "db/manifest.json")  # per-file/per-chunk content hashes
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 256))  # chunks per encode/upsert batch
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 1))         # encoder processes for ingest (1 = inline)
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "db/snapshots")  # versioned, memory-mapped index snapshots
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", 3))      # old snapshot versions kept on disk
+SNAPSHOT_CHECK_INTERVAL = float(os.getenv("SNAPSHOT_CHECK_INTERVAL", 5))  # seconds between checks for a new snapshot
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "exact")  # "exact" (numpy over the mmap'd snapshot), "faiss", "int8" or "binary"
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto")  # built by ingest.py: flat, ivf, ivfpq or auto (by corpus size)
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", 0))            # IVF lists; 0 = about 4 * sqrt(chunks)
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", 0))              # IVF-PQ bytes per chunk; 0 = dimension / 8
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", 16))         # IVF lists searched per query (recall vs latency)
+FAISS_RERANK = int(os.getenv("FAISS_RERANK", 10))         # IVF-PQ candidates per result re-scored exactly
+QUANTIZED_RERANK = int(os.getenv("QUANTIZED_RERANK", 0))  # int8/binary candidates per result re-scored exactly; 0 = 4 (int8) or 20 (binary)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")  # "dense" (embeddings), "hybrid" (dense + BM25, rank-fused) or "lexical" (BM25)
+LEXICAL_FALLBACK = os.getenv("LEXICAL_FALLBACK", "true").lower() == "true"  # BM25 while the embedding model is loading or failing
+BM25_K1 = float(os.getenv("BM25_K1", 1.2))   # term-frequency saturation
+BM25_B = float(os.getenv("BM25_B", 0.75))    # chunk-length normalization (0 = none)
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 20))  # results taken from each ranking before fusion
+RRF_K = int(os.getenv("RRF_K", 60))          # reciprocal rank fusion constant: 1 / (RRF_K + rank)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 512))          # cached /api/chat answers (0 disables)
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))        # seconds; 0 means no expiry
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))  # min cosine between questions
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true"  # share in-flight identical questions
+SINGLEFLIGHT_BACKEND = os.getenv("SINGLEFLIGHT_BACKEND", "memory")  # "memory" (per process) or "file" (all workers on the host)
+SINGLEFLIGHT_DIR = os.getenv("SINGLEFLIGHT_DIR", "/dev/shm/convosol-singleflight")  # lock/result files for "file"
+SINGLEFLIGHT_TIMEOUT = float(os.getenv("SINGLEFLIGHT_TIMEOUT", 40))  # max seconds to wait on another request's answer
+ASGI_EXECUTOR_WORKERS = int(os.getenv("ASGI_EXECUTOR_WORKERS", 4))  # threads for embedding/search in asgi.py
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", 256))  # questions per /api/chat/batch request
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))        # concurrent Gemini calls for batch requests per worker
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() == "true"  # greeting/intent/FAQ fast path
+ROUTER_INTENTS_PATH = os.getenv("ROUTER_INTENTS_PATH")  # JSON list of intents replacing router.DEFAULT_INTENTS
+FAQ_PATH = os.getenv("FAQ_PATH", "data/faq.txt")        # Q:/A: pairs indexed by ingest.py
+FAQ_THRESHOLD = float(os.getenv("FAQ_THRESHOLD", 0.9))   # min cosine to a FAQ question to answer from the FAQ
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # "memory" (per process) or "sqlite" (shared by workers)
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "db/sessions.sqlite3")  # used when SESSION_BACKEND=sqlite
+SESSION_MAX = int(os.getenv("SESSION_MAX", 10000))                   # sessions kept (least recently used dropped)
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", 64 * 1024 * 1024))  # memory cap for the memory backend (0 = none)
+SESSION_TTL = float(os.getenv("SESSION_TTL", 1800))                  # seconds idle before a session expires; 0 = never
+SESSION_HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", 400))  # max conversation-history tokens per prompt
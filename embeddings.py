@@ -1,31 +1,385 @@
 # embeddings.py
-from sentence_transformers import SentenceTransformer
-from config import EMBEDDING_MODEL
+import os
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+from metrics import span, cache_lookup
+from config import (
+    EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_ONNX_DIR, EMBEDDING_ONNX_MIN_COSINE,
+    EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL,
+    EMBEDDING_BATCHING, EMBEDDING_BATCH_WINDOW_MS, EMBEDDING_BATCH_MAX
+)
 
 # Load the model once at module level (lazy loading)
 _model = None
+_model_lock = threading.Lock()   # held while the model loads
+_model_failed_at = None          # monotonic time of the last failed load
+
+# Seconds after a failed load during which model_available() reports False
+MODEL_RETRY_INTERVAL = 30
 
 def _get_model():
-    """Lazy load the embedding model."""
-    global _model
+    """Lazy load the embedding model for the configured EMBEDDING_BACKEND ("torch" or "onnx")."""
+    global _model, _model_failed_at
     if _model is None:
-        _model = SentenceTransformer(EMBEDDING_MODEL)
+        with _model_lock:
+            if _model is None:
+                try:
+                    with span("model_load"):
+                        if EMBEDDING_BACKEND == "onnx":
+                            model = OnnxEmbeddingModel(EMBEDDING_ONNX_DIR)
+                            model.verify(EMBEDDING_ONNX_MIN_COSINE)
+                            _model = model
+                        elif EMBEDDING_BACKEND == "torch":
+                            from sentence_transformers import SentenceTransformer
+                            _model = SentenceTransformer(EMBEDDING_MODEL)
+                        else:
+                            raise ValueError(f"Unknown EMBEDDING_BACKEND: {EMBEDDING_BACKEND}")
+                except Exception:
+                    _model_failed_at = time.monotonic()
+                    raise
+                _model_failed_at = None
     return _model
 
+def model_available():
+    """
+    Whether an embedding can be had without waiting on a load: the model is
+    loaded, or nobody is loading it and it has not failed to load in the last
+    MODEL_RETRY_INTERVAL seconds (so this caller may load it).
+    """
+    if _model is not None:
+        return True
+    if _model_lock.locked():
+        return False
+    return _model_failed_at is None or time.monotonic() - _model_failed_at >= MODEL_RETRY_INTERVAL
+
+class OnnxEmbeddingModel:
+    """
+    Sentence-transformers model exported by export_onnx.py and run with ONNX
+    Runtime on CPU (int8-quantized weights, no torch import).
+    Mirrors the SentenceTransformer pipeline: tokenize, transformer, mean
+    pooling over the attention mask, then optional L2 normalization.
+    """
+
+    def __init__(self, path):
+        from tokenizers import Tokenizer
+
+        self.path = path
+        with open(os.path.join(path, "export.json"), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        if self.config["model"] != EMBEDDING_MODEL:
+            raise RuntimeError(
+                f"ONNX export in {path} is for {self.config['model']}, but EMBEDDING_MODEL is {EMBEDDING_MODEL}"
+            )
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+
+        self._open_session()
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _open_session(self):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            os.path.join(self.path, self.config["onnx_file"]), options, providers=["CPUExecutionProvider"]
+        )
+        self._session_pid = os.getpid()
+
+    def get_sentence_embedding_dimension(self):
+        return self.config["dim"]
+
+    def encode(self, texts, convert_to_numpy=True, batch_size=64, **kwargs):
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        if self._session_pid != os.getpid():
+            # ONNX Runtime sessions are not fork-safe (their thread pool stays in the parent)
+            self._open_session()
+        out = []
+        for i in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[i:i + batch_size])
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+            hidden = self.session.run(None, feeds)[0]
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.config["normalize"]:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            out.append(pooled.astype(np.float32))
+        vectors = np.vstack(out) if out else np.zeros((0, self.config["dim"]), dtype=np.float32)
+        return vectors[0] if single else vectors
+
+    def verify(self, min_cosine):
+        """
+        Re-encode the reference sentences saved at export time and compare with the
+        torch vectors stored alongside them. Raises RuntimeError if any pair's
+        cosine similarity falls below min_cosine.
+        """
+        with open(os.path.join(self.path, "reference.json"), "r", encoding="utf-8") as f:
+            sentences = json.load(f)
+        expected = np.load(os.path.join(self.path, "reference.npy"))
+        actual = self.encode(sentences)
+        cosine = (expected * actual).sum(axis=1) / (
+            np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1)
+        )
+        worst = float(cosine.min())
+        if worst < min_cosine:
+            raise RuntimeError(
+                f"ONNX embeddings drifted from torch: min cosine {worst:.4f} < {min_cosine}"
+            )
+        return worst
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU cache of embedding vectors with optional TTL.
+    Keys are (model name, normalized text); values are read-only float32 arrays.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                vector, stored_at = item
+                if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, vector):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (vector, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+_cache = EmbeddingCache(maxsize=EMBEDDING_CACHE_SIZE, ttl=EMBEDDING_CACHE_TTL or None)
+
+class EmbeddingBatcher:
+    """
+    Coalesces encode calls from concurrent request threads into one batched
+    forward pass run on a single dispatcher thread. Each caller gets its own
+    vectors back through futures.
+
+    When the previous batch held a single item the dispatcher encodes as soon
+    as a request arrives, so a lone caller never waits. Once concurrent
+    requests have been seen it holds each batch open for up to window_ms (or
+    until max_batch items) to collect the rest of a burst.
+    """
+
+    def __init__(self, encode_fn, window_ms=3.0, max_batch=32):
+        self.encode_fn = encode_fn
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self._last_batch_size = 0
+        self._queue = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        """Start the dispatcher thread (again after a fork, since threads do not survive it)."""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid != pid:
+                self._queue = queue.Queue()
+                threading.Thread(target=self._run, args=(self._queue,), name="embedding-batcher", daemon=True).start()
+                self._pid = pid
+
+    def encode(self, texts):
+        """Encode texts; returns a float32 array of shape (len(texts), dim)."""
+        if len(texts) >= self.max_batch:
+            return self.encode_fn(texts)
+        self._ensure_started()
+        futures = []
+        for text in texts:
+            future = Future()
+            self._queue.put((text, future))
+            futures.append(future)
+        return np.vstack([f.result() for f in futures])
+
+    def _run(self, requests):
+        while True:
+            batch = [requests.get()]
+            deadline = time.monotonic() + self.window if self._last_batch_size > 1 else None
+            while len(batch) < self.max_batch:
+                try:
+                    if deadline is None:
+                        batch.append(requests.get_nowait())
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        batch.append(requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._last_batch_size = len(batch)
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            try:
+                vectors = self.encode_fn([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "window_ms": self.window * 1000.0,
+            "max_batch": self.max_batch
+        }
+
+def _encode(texts):
+    """Run the model on a list of texts."""
+    model = _get_model()
+    with span("embed_model"):
+        encoded = model.encode(texts, convert_to_numpy=True, batch_size=64)
+    return np.asarray(encoded, dtype=np.float32)
+
+_batcher = EmbeddingBatcher(_encode, window_ms=EMBEDDING_BATCH_WINDOW_MS, max_batch=EMBEDDING_BATCH_MAX)
+
+def warm_up(fork_safe=False):
+    """
+    Load the model and run one dummy encode so the first request does not pay for
+    either. Returns the time each took in seconds.
+    With fork_safe=True (warming up in the Gunicorn master before workers fork) the
+    encode runs single-threaded, so torch starts no OpenMP worker threads that the
+    forked workers would inherit in a broken state.
+    """
+    started = time.perf_counter()
+    _get_model()
+    loaded = time.perf_counter()
+    if fork_safe and EMBEDDING_BACKEND == "torch":
+        import torch
+        threads = torch.get_num_threads()
+        torch.set_num_threads(1)
+        try:
+            _encode(["warm up"])
+        finally:
+            torch.set_num_threads(threads)
+    else:
+        _encode(["warm up"])
+    return {"model_load": loaded - started, "dummy_encode": time.perf_counter() - loaded}
+
+def normalize_text(text):
+    """
+    Collapse whitespace. Tokenizers split on whitespace, so this does not change
+    the embedding; case is kept, since a cased EMBEDDING_MODEL tells it apart.
+    """
+    return " ".join(text.split())
+
+def cache_stats():
+    """Hit/miss counters and size of the query embedding cache."""
+    return _cache.stats()
+
+def batcher_stats():
+    """Queue depth and batch-size counters of the cross-request embedding batcher."""
+    return _batcher.stats()
+
+def get_embeddings(texts, normalize=False, use_cache=True):
+    """
+    Embed a list of texts. Cached vectors are reused and all misses are encoded
+    in a single batched forward pass.
+    Returns a float32 numpy array of shape (len(texts), dim); rows are
+    L2-normalized when normalize=True.
+    """
+    try:
+        keys = [normalize_text(t) for t in texts]
+        vectors = [None] * len(keys)
+        missing = {}
+        for i, key in enumerate(keys):
+            vector = None
+            if use_cache:
+                vector = _cache.get((EMBEDDING_MODEL, key))
+                cache_lookup("embedding", vector is not None)
+            if vector is None:
+                # Encode the caller's text; the normalized key only identifies the cache entry
+                missing.setdefault(key, (texts[i], []))[1].append(i)
+            else:
+                vectors[i] = vector
+
+        if missing:
+            miss_texts = [text for text, _ in missing.values()]
+            encoded = _batcher.encode(miss_texts) if EMBEDDING_BATCHING else _encode(miss_texts)
+            for (key, (_, positions)), vector in zip(missing.items(), encoded):
+                vector.setflags(write=False)
+                if use_cache:
+                    _cache.put((EMBEDDING_MODEL, key), vector)
+                for i in positions:
+                    vectors[i] = vector
+
+        if not vectors:
+            return np.zeros((0, _get_model().get_sentence_embedding_dimension()), dtype=np.float32)
+        matrix = np.vstack(vectors)
+        if normalize:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix = matrix / norms
+        return matrix
+    except Exception as e:
+        raise RuntimeError(f"Failed to get embedding: {e}")
+
 def get_embedding(text: str, model: str = None, task_type: str = "retrieval_document"):
     """
     Generate embedding for text using local sentence-transformers model.
     Returns vector as list[float].
-    
+
     Args:
         text: Text to embed
         model: Model name (ignored, uses config model)
         task_type: "retrieval_document" for documents, "retrieval_query" for queries (both use same model)
     """
-    try:
-        embedding_model = _get_model()
-        # sentence-transformers handles both documents and queries the same way
-        embedding = embedding_model.encode(text, convert_to_numpy=True).tolist()
-        return embedding
-    except Exception as e:
-        raise RuntimeError(f"Failed to get embedding: {e}")
+    # sentence-transformers handles both documents and queries the same way
+    return get_embeddings([text])[0].tolist()
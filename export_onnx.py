@@ -0,0 +1,109 @@
+# export_onnx.py - Export the embedding model to int8 ONNX
+# Run this locally (needs torch + sentence-transformers + onnx), then deploy the output
+# directory and set EMBEDDING_BACKEND=onnx so workers never import torch.
+import os
+import sys
+import json
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+from onnxruntime.quantization import quantize_dynamic, QuantType
+from utils import read_text_files, chunk_text
+from config import EMBEDDING_MODEL, EMBEDDING_ONNX_DIR, EMBEDDING_ONNX_MIN_COSINE, CHUNK_SIZE, CHUNK_OVERLAP
+
+# Queries checked against torch in addition to a sample of document chunks
+REFERENCE_QUERIES = [
+    "What services do you offer?",
+    "How much does a custom chatbot cost?",
+    "Can I talk to one of the co-founders?",
+    "Do you integrate with WhatsApp?",
+    "hello",
+]
+
+class _HiddenStates(torch.nn.Module):
+    """Expose only the transformer's last hidden state, which is what pooling consumes."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        return self.model(
+            input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+        ).last_hidden_state
+
+def _reference_sentences(limit=64):
+    sentences = list(REFERENCE_QUERIES)
+    for file in read_text_files("data"):
+        for chunk, start, end in chunk_text(file["text"], size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+            sentences.append(chunk)
+    return sentences[:limit]
+
+def export(out_dir=EMBEDDING_ONNX_DIR):
+    """Export, quantize and verify the model; returns the minimum cosine vs torch."""
+    os.makedirs(out_dir, exist_ok=True)
+    st_model = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+    transformer = st_model[0]
+    pooling = st_model[1]
+    pooling_config = pooling.get_config_dict()
+    if not (pooling_config.get("pooling_mode_mean_tokens") or pooling_config.get("pooling_mode") == "mean"):
+        raise RuntimeError("Only mean-pooling models are supported by the ONNX backend")
+    tokenizer = transformer.tokenizer
+
+    print(f"Exporting {EMBEDDING_MODEL} to ONNX...")
+    fp32_path = os.path.join(out_dir, "model.fp32.onnx")
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    token_type_ids = sample.get("token_type_ids", torch.zeros_like(sample["input_ids"]))
+    dynamic = {0: "batch", 1: "sequence"}
+    torch.onnx.export(
+        _HiddenStates(transformer.auto_model).eval(),
+        (sample["input_ids"], sample["attention_mask"], token_type_ids),
+        fp32_path,
+        input_names=["input_ids", "attention_mask", "token_type_ids"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={
+            "input_ids": dynamic,
+            "attention_mask": dynamic,
+            "token_type_ids": dynamic,
+            "last_hidden_state": dynamic,
+        },
+        opset_version=17,
+    )
+
+    print("Quantizing weights to int8...")
+    quantize_dynamic(fp32_path, os.path.join(out_dir, "model.int8.onnx"), weight_type=QuantType.QInt8)
+    for leftover in (fp32_path, fp32_path + ".data"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+
+    tokenizer.backend_tokenizer.save(os.path.join(out_dir, "tokenizer.json"))
+    export_config = {
+        "model": EMBEDDING_MODEL,
+        "onnx_file": "model.int8.onnx",
+        "dim": st_model.get_sentence_embedding_dimension(),
+        "max_seq_length": st_model.max_seq_length,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+        "normalize": any(type(module).__name__ == "Normalize" for module in st_model),
+    }
+    with open(os.path.join(out_dir, "export.json"), "w", encoding="utf-8") as f:
+        json.dump(export_config, f, indent=2)
+
+    # Torch reference vectors let the ONNX backend re-check itself at load time
+    sentences = _reference_sentences()
+    reference = st_model.encode(sentences, convert_to_numpy=True)
+    np.save(os.path.join(out_dir, "reference.npy"), reference.astype(np.float32))
+    with open(os.path.join(out_dir, "reference.json"), "w", encoding="utf-8") as f:
+        json.dump(sentences, f, ensure_ascii=False)
+
+    from embeddings import OnnxEmbeddingModel
+    worst = OnnxEmbeddingModel(out_dir).verify(EMBEDDING_ONNX_MIN_COSINE)
+    print(f"ONNX export saved in {out_dir} (min cosine vs torch over {len(sentences)} texts: {worst:.4f})")
+    return worst
+
+if __name__ == "__main__":
+    try:
+        export(sys.argv[1] if len(sys.argv) > 1 else EMBEDDING_ONNX_DIR)
+    except RuntimeError as e:
+        print(f"Export failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,153 @@
+# faiss_index.py - Approximate nearest-neighbor index for VECTOR_BACKEND=faiss
+# ingest.py trains and writes a FAISS index into each snapshot next to the exact
+# embeddings, and retrieval.FaissVectorStore serves it:
+#   db/snapshots/<version>/vectors.faiss   FAISS index over the snapshot rows (ids = row numbers)
+#   db/snapshots/<version>/vectors.json    index type, parameters and the recall measured at build time
+# Build-time recall is measured with the snapshot's FAQ questions as queries when it
+# has them (real user questions), otherwise with a sample of the indexed rows.
+#
+# Index types (FAISS_INDEX_TYPE):
+#   flat   exact inner-product search; loaded into memory (dim * 4 bytes per chunk)
+#   ivf    inverted lists of full vectors; searches FAISS_NPROBE of FAISS_NLIST lists
+#   ivfpq  inverted lists of product-quantized codes (FAISS_PQ_M bytes per chunk);
+#          the shortlist is re-scored against the exact snapshot vectors
+#   auto   flat below AUTO_IVF_MIN chunks, ivf below AUTO_IVFPQ_MIN, ivfpq above
+# IVF indexes are read with IO_FLAG_MMAP, so their lists stay in the page cache
+# shared by all workers instead of being copied into each one.
+import os
+import json
+import math
+import time
+import numpy as np
+from recall import ExactRerank, exact_top_k, recall_queries, measure_recall as _measure_recall
+from config import SNAPSHOT_DIR, FAISS_INDEX_TYPE, FAISS_NLIST, FAISS_PQ_M, FAISS_NPROBE, FAISS_RERANK
+
+INDEX_FILE = "vectors.faiss"
+INFO_FILE = "vectors.json"
+INDEX_TYPES = ("flat", "ivf", "ivfpq")
+
+# Corpus sizes at which "auto" switches to IVF and to IVF-PQ
+AUTO_IVF_MIN = 20000
+AUTO_IVFPQ_MIN = 200000
+
+# k-means needs about this many training points per centroid (FAISS warns below 39)
+POINTS_PER_CENTROID = 64
+
+# Most rows sampled to train the coarse quantizer and the product quantizer
+MAX_TRAIN_POINTS = 262144
+
+def choose_index_type(count, index_type="auto"):
+    if index_type == "auto":
+        if count < AUTO_IVF_MIN:
+            return "flat"
+        return "ivf" if count < AUTO_IVFPQ_MIN else "ivfpq"
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type {index_type!r} (expected one of {', '.join(INDEX_TYPES)} or 'auto')")
+    return index_type
+
+def default_nlist(count):
+    """About 4 * sqrt(chunks) lists, with enough rows per list to train on."""
+    return max(1, min(int(4 * math.sqrt(count)), count // POINTS_PER_CENTROID))
+
+def default_pq_m(dim):
+    """Sub-quantizers of 8 dimensions each (48 one-byte codes for 384 dimensions)."""
+    return next(m for m in range(max(dim // 8, 1), 0, -1) if dim % m == 0)
+
+def build_index(embeddings, index_type="auto", nlist=0, pq_m=0, seed=0):
+    """
+    Train (for IVF types) and fill a FAISS inner-product index over L2-normalized rows.
+    Returns (index, info) where info records the type and parameters actually used.
+    """
+    import faiss
+
+    count, dim = embeddings.shape
+    index_type = choose_index_type(count, index_type)
+    info = {"type": index_type, "count": int(count), "dim": int(dim)}
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim)
+    else:
+        nlist = nlist or default_nlist(count)
+        quantizer = faiss.IndexFlatIP(dim)
+        if index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            pq_m = pq_m or default_pq_m(dim)
+            if dim % pq_m:
+                raise ValueError(f"FAISS_PQ_M={pq_m} does not divide the embedding dimension {dim}")
+            # 8-bit codes need 256 centroids per sub-quantizer; fewer bits on small corpora
+            nbits = max(1, min(8, int(math.log2(max(count // POINTS_PER_CENTROID, 2)))))
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, nbits, faiss.METRIC_INNER_PRODUCT)
+            info.update(pq_m=pq_m, pq_bits=nbits)
+        info["nlist"] = nlist
+        rng = np.random.default_rng(seed)
+        train_rows = min(count, max(nlist * POINTS_PER_CENTROID, 256 * POINTS_PER_CENTROID), MAX_TRAIN_POINTS)
+        sample = np.sort(rng.choice(count, size=train_rows, replace=False))
+        started = time.perf_counter()
+        index.train(np.ascontiguousarray(embeddings[sample], dtype=np.float32))
+        info["train_seconds"] = round(time.perf_counter() - started, 2)
+
+    # Add in blocks so a memory-mapped matrix is never copied whole
+    block = 65536
+    for start in range(0, count, block):
+        index.add(np.ascontiguousarray(embeddings[start:start + block], dtype=np.float32))
+    return index, info
+
+def set_nprobe(index, nprobe):
+    """Lists searched per query by an IVF index (no-op for flat)."""
+    import faiss
+
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    except RuntimeError:
+        pass
+
+def measure_recall(index, embeddings, k=10, nprobes=(FAISS_NPROBE,), queries=None, rerank=None):
+    """
+    Recall@k of the index against exact search, and its latency, for each nprobe:
+    [{"nprobe", "recall", "p50_ms", "p95_ms"}]. queries defaults to a sample of
+    corpus rows; rerank (an ExactRerank) re-scores candidates as the server does.
+    """
+    if queries is None:
+        queries, _ = recall_queries(None, embeddings)
+    truth = exact_top_k(embeddings, queries, min(k, len(embeddings)))
+
+    def search(query, k):
+        scores, ids = index.search(query[None, :], k if rerank is None else k * rerank.factor)
+        ids = ids[0][ids[0] >= 0]
+        return ids if rerank is None else rerank(query, ids, k)[0]
+
+    report = []
+    for nprobe in nprobes:
+        set_nprobe(index, nprobe)
+        report.append(dict(nprobe=nprobe, **_measure_recall(search, embeddings, queries, k=k, truth=truth)))
+    set_nprobe(index, FAISS_NPROBE)
+    return report
+
+def write_faiss_index(path, embeddings, index_type=FAISS_INDEX_TYPE, nlist=FAISS_NLIST, pq_m=FAISS_PQ_M):
+    """Build the index for a snapshot's embeddings, check its recall and write it into the snapshot directory."""
+    import faiss
+
+    started = time.perf_counter()
+    index, info = build_index(embeddings, index_type, nlist=nlist, pq_m=pq_m)
+    info["build_seconds"] = round(time.perf_counter() - started, 2)
+    rerank = ExactRerank(embeddings, FAISS_RERANK) if info["type"] == "ivfpq" else None
+    queries, info["recall_queries"] = recall_queries(path, embeddings)
+    info["recall_at_10"] = measure_recall(index, embeddings, k=10, queries=queries, rerank=rerank)[0]
+    faiss.write_index(index, os.path.join(path, INDEX_FILE))
+    with open(os.path.join(path, INFO_FILE), "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=2)
+    return info
+
+def load_faiss_index(version, root=SNAPSHOT_DIR):
+    """Read a snapshot's FAISS index (IVF lists memory-mapped). Returns (index, info), or None if it has none."""
+    import faiss
+
+    path = os.path.join(root, version)
+    try:
+        with open(os.path.join(path, INFO_FILE), "r", encoding="utf-8") as f:
+            info = json.load(f)
+    except FileNotFoundError:
+        return None
+    index = faiss.read_index(os.path.join(path, INDEX_FILE), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    set_nprobe(index, FAISS_NPROBE)
+    return index, info
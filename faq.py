@@ -0,0 +1,69 @@
+# faq.py - Curated FAQ index for the router's fast path (see router.py)
+# ingest.py parses data/faq.txt ("Q: ..." / "A: ..." pairs) and writes the embedded
+# questions into each snapshot next to the chunk index, so the FAQ served always
+# belongs to the snapshot being served:
+#   db/snapshots/<version>/faq_embeddings.npy   float32 (n, dim), rows L2-normalized
+#   db/snapshots/<version>/faq.json             [{"question", "answer"}, ...]
+import os
+import json
+import numpy as np
+from config import FAQ_PATH, SNAPSHOT_DIR
+
+EMBEDDINGS_FILE = "faq_embeddings.npy"
+ENTRIES_FILE = "faq.json"
+
+def parse_faq(text):
+    """
+    Return [{"question", "answer"}] from "Q:" / "A:" blocks. A question or answer
+    may continue over several lines; an answer runs until the next "Q:".
+    """
+    entries = []
+    question = None
+    answer = None
+
+    def finish():
+        if question and answer:
+            entries.append({"question": " ".join(question), "answer": "\n".join(answer)})
+
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("Q:"):
+            finish()
+            question, answer = [line[2:].strip()], None
+        elif line.startswith("A:") and question:
+            answer = [line[2:].strip()]
+        elif line and answer is not None:
+            answer.append(line)
+        elif line and question:
+            question.append(line)
+    finish()
+    return entries
+
+def write_faq_index(path, faq_path=FAQ_PATH):
+    """Embed the FAQ questions and write the index into a snapshot directory. Returns the entry count."""
+    from embeddings import get_embeddings
+
+    if not os.path.exists(faq_path):
+        return 0
+    with open(faq_path, "r", encoding="utf-8") as f:
+        entries = parse_faq(f.read())
+    if not entries:
+        return 0
+    embeddings = get_embeddings([e["question"] for e in entries], normalize=True, use_cache=False)
+    np.save(os.path.join(path, EMBEDDINGS_FILE), np.asarray(embeddings, dtype=np.float32))
+    with open(os.path.join(path, ENTRIES_FILE), "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+    return len(entries)
+
+def load_faq_index(version, root=SNAPSHOT_DIR):
+    """Memory-map a snapshot's FAQ index. Returns (embeddings, entries), or None if it has none."""
+    path = os.path.join(root, version)
+    try:
+        embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+        with open(os.path.join(path, ENTRIES_FILE), "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    except FileNotFoundError:
+        return None
+    if len(entries) != len(embeddings):
+        raise RuntimeError(f"FAQ index of snapshot {version} is inconsistent")
+    return embeddings, entries
@@ -0,0 +1,29 @@
+# gunicorn.conf.py - Gunicorn hooks for multi-worker metrics and pre-fork warm-up
+# Each worker writes its metric samples to PROMETHEUS_MULTIPROC_DIR and /metrics
+# merges them (see metrics.py). The variable must be set before the app is
+# imported, which is why it is set here rather than in config.py.
+import os
+import shutil
+
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/dev/shm/convosol-metrics")
+
+# Start from an empty directory so samples from a previous run are not reported
+shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+def child_exit(server, worker):
+    """Drop the live gauges (requests in flight) of a worker that has exited."""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+def when_ready(server):
+    """With --preload, warm up once in the master so every worker forks with the model and index loaded."""
+    if server.cfg.preload_app:
+        import startup
+        startup.warm_up(fork_safe=True)
+
+def post_fork(server, worker):
+    """Without --preload each worker warms up in the background; its /ready answers 503 until done."""
+    if not server.cfg.preload_app:
+        import startup
+        startup.warm_up_in_background()
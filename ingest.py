@@ -1,68 +1,366 @@
 # ingest.py - Offline Ingestion
-# Run this locally to build the ChromaDB collection.
-import sys
+# Run this locally to update the ChromaDB collection and publish a new index snapshot.
+# Running servers pick up the new snapshot without a restart (see retrieval.get_store).
+#
+# Ingestion is incremental: db/manifest.json records a content hash per file and the
+# content-derived ids of its chunks. Only chunks of new or changed files that are not
+# already in the collection are embedded; they are upserted before chunks that
+# disappeared are deleted, so the live collection is never empty mid-update.
+#
+# The pipeline streams: files are read one at a time, chunked lazily, encoded in
+# fixed-size batches (optionally by a pool of encoder processes) and upserted batch
+# by batch, so memory stays flat however large data/ grows. The manifest is saved as
+# each file completes, so re-running after a crash resumes where it stopped.
+#
+# Every snapshot gets a BM25 inverted index over the same chunks (see bm25.py) for
+# hybrid and lexical retrieval. With VECTOR_BACKEND=faiss (or --faiss-index TYPE) it
+# also gets a trained FAISS index, and with VECTOR_BACKEND=int8|binary (or --quantize)
+# int8 and binary codes of its embeddings; their recall against exact search is
+# printed after the build.
+#
+# Usage: python ingest.py [--full] [--snapshot-only] [--batch-size N] [--workers N] [--faiss-index TYPE] [--quantize]
 import os
-from sentence_transformers import SentenceTransformer
+import json
+import time
+import hashlib
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import numpy as np
 import chromadb
-from utils import read_text_files, chunk_text
-from config import CHUNK_SIZE, CHUNK_OVERLAP
-
-def build_db():
-    """Build ChromaDB collection with local sentence-transformers model."""
-    # Read and chunk documents
-    files = read_text_files("data")
-    chunks = []
-    
-    for file in files:
-        text = file["text"]
-        fname = file["filename"]
-        chunk_list = chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
-        
-        for idx, (chunk_text_, start, end) in enumerate(chunk_list):
-            chunks.append({
-                "text": chunk_text_,
-                "filename": fname,
-                "chunk_index": idx
-            })
-    
-    print(f"Processing {len(chunks)} chunks...")
-    
-    # Initialize ChromaDB client
+from tqdm import tqdm
+from embeddings import get_embeddings
+from utils import iter_text_files, iter_chunks
+from snapshot import SnapshotWriter, current_version
+from faq import write_faq_index
+from bm25 import BM25Builder
+from config import (
+    CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL, INGEST_MANIFEST_PATH,
+    INGEST_BATCH_SIZE, INGEST_WORKERS, VECTOR_BACKEND, FAISS_INDEX_TYPE
+)
+
+def _hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def make_chunk_id(filename, text, occurrence=0):
+    """Stable id derived from the file name and chunk content (occurrence separates repeated chunks)."""
+    digest = hashlib.sha1(f"{filename}\0{text}".encode("utf-8")).hexdigest()[:20]
+    return f"{digest}-{occurrence}" if occurrence else digest
+
+def iter_file_chunks(filename, text):
+    """Chunk one file lazily into dicts with content-derived ids."""
+    seen = {}
+    for idx, (chunk_text_, start, end) in enumerate(iter_chunks(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)):
+        occurrence = seen.get(chunk_text_, 0)
+        seen[chunk_text_] = occurrence + 1
+        yield {
+            "id": make_chunk_id(filename, chunk_text_, occurrence),
+            "text": chunk_text_,
+            "filename": filename,
+            "chunk_index": idx,
+            "start": start,
+            "end": end
+        }
+
+def _chunk_metadata(chunk):
+    return {"filename": chunk["filename"], "chunk_index": chunk["chunk_index"], "start": chunk["start"], "end": chunk["end"]}
+
+def load_manifest(path=INGEST_MANIFEST_PATH):
+    """Load the ingest manifest; it is discarded if chunking settings or the embedding model changed."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {"files": {}}
+    if manifest.get("embedding_model") != EMBEDDING_MODEL:
+        print("Embedding model changed; rebuilding the collection.")
+        return {"files": {}, "rebuild": True}
+    if manifest.get("chunk_size") != CHUNK_SIZE or manifest.get("chunk_overlap") != CHUNK_OVERLAP:
+        print("Chunking settings changed; re-chunking all files.")
+        return {"files": {}}
+    return manifest
+
+def save_manifest(files, path=INGEST_MANIFEST_PATH):
+    manifest = {
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "embedding_model": EMBEDDING_MODEL,
+        "files": files
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+COLLECTION_NAME = "documents"
+STAGING_COLLECTION_NAME = "documents_rebuild"
+
+def _get_collection(name=COLLECTION_NAME):
+    client = chromadb.PersistentClient(path="db")
+    return client.get_or_create_collection(name=name, metadata={"hnsw:space": "cosine"})
+
+def _new_staging_collection():
+    """Empty collection for a full rebuild (the embedding dimension may differ from the live one)."""
+    client = chromadb.PersistentClient(path="db")
+    try:
+        client.delete_collection(name=STAGING_COLLECTION_NAME)
+    except Exception:
+        pass
+    return client.create_collection(name=STAGING_COLLECTION_NAME, metadata={"hnsw:space": "cosine"})
+
+def _promote_staging(staging):
+    """Replace the live collection with a finished rebuild."""
     client = chromadb.PersistentClient(path="db")
-    
-    # Delete existing collection if it exists
     try:
-        client.delete_collection(name="documents")
-    except:
+        client.delete_collection(name=COLLECTION_NAME)
+    except Exception:
         pass
-    
-    # Create collection with sentence-transformers embedding function
-    collection = client.create_collection(
-        name="documents",
-        metadata={"hnsw:space": "cosine"}
-    )
-    
-    # Prepare data for ChromaDB
-    ids = [f"chunk_{i}" for i in range(len(chunks))]
-    documents = [c["text"] for c in chunks]
-    metadatas = [{"filename": c["filename"], "chunk_index": c["chunk_index"]} for c in chunks]
-    
-    # Load embedding model and generate embeddings
-    print("Generating embeddings...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    embeddings = model.encode(documents, convert_to_tensor=False, normalize_embeddings=True, show_progress_bar=True)
-    embeddings = embeddings.tolist()
-    
-    # Add to collection
-    collection.add(
-        ids=ids,
-        documents=documents,
-        metadatas=metadatas,
-        embeddings=embeddings
-    )
-    
-    print(f"Ingestion complete. ChromaDB collection saved in db/")
-    print(f"Total chunks: {len(chunks)}")
+    staging.modify(name=COLLECTION_NAME)
+    return client.get_collection(name=COLLECTION_NAME)
+
+def _init_encoder_process(threads):
+    """Give each encoder process an equal share of the cores instead of letting every one use all of them."""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+
+def _encode_batch(texts):
+    return get_embeddings(texts, normalize=True, use_cache=False)
+
+class EncoderPool:
+    """Encode batches in a pool of worker processes (each loads its own model), or inline with one worker."""
+
+    def __init__(self, workers=1):
+        self.workers = max(1, workers)
+        self._executor = None
+        if self.workers > 1:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_encoder_process,
+                initargs=(threads,)
+            )
+
+    def submit(self, texts):
+        if self._executor is not None:
+            return self._executor.submit(_encode_batch, texts)
+        future = Future()
+        future.set_result(_encode_batch(texts))
+        return future
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+def build_db(full=False, batch_size=INGEST_BATCH_SIZE, workers=INGEST_WORKERS, faiss_index=None, quantize=None):
+    """
+    Bring the ChromaDB collection in line with data/, embedding only new or changed chunks.
+    A full rebuild (--full or a new embedding model) is built in a staging collection
+    that replaces the live one only once complete; it does not resume after a crash.
+    """
+    started = time.perf_counter()
+    manifest = {"files": {}, "rebuild": True} if full else load_manifest()
+    old_files = manifest["files"]
+    rebuild = manifest.get("rebuild", False)
+    collection = _new_staging_collection() if rebuild else _get_collection()
+
+    files = {}        # manifest entries of completed files
+    pending = {}      # filename -> {"entry", "unflushed", "chunked"} for files still in the pipeline
+    live_ids = set()
+    in_flight = deque()
+    counts = {"unchanged": 0, "changed": 0, "embedded": 0, "updated": 0}
+    pool = EncoderPool(workers)
+    progress = tqdm(unit="chunk", desc="Embedding")
+
+    def complete_if_done(fname):
+        state = pending[fname]
+        if state["chunked"] and state["unflushed"] == 0:
+            files[fname] = pending.pop(fname)["entry"]
+            # Checkpoint: finished files are skipped if this run has to be restarted
+            if not rebuild:
+                save_manifest(dict(old_files, **files))
+
+    def mark_flushed(chunks):
+        for fname in {c["filename"] for c in chunks}:
+            pending[fname]["unflushed"] -= sum(1 for c in chunks if c["filename"] == fname)
+            complete_if_done(fname)
+
+    def upsert_oldest():
+        """Wait for the oldest encode batch and upsert it (batches are upserted in submission order)."""
+        future, chunks = in_flight.popleft()
+        collection.upsert(
+            ids=[c["id"] for c in chunks],
+            documents=[c["text"] for c in chunks],
+            metadatas=[_chunk_metadata(c) for c in chunks],
+            embeddings=future.result()
+        )
+        counts["embedded"] += len(chunks)
+        progress.update(len(chunks))
+        mark_flushed(chunks)
+
+    def drain(wait_all):
+        while in_flight and (wait_all or in_flight[0][0].done()):
+            upsert_oldest()
+
+    def flush(batch):
+        # Chunks whose content is already stored only need their position updated
+        existing = set() if rebuild else set(collection.get(ids=[c["id"] for c in batch], include=[])["ids"])
+        to_update = [c for c in batch if c["id"] in existing]
+        to_embed = [c for c in batch if c["id"] not in existing]
+        if to_update:
+            collection.update(ids=[c["id"] for c in to_update], metadatas=[_chunk_metadata(c) for c in to_update])
+            counts["updated"] += len(to_update)
+            mark_flushed(to_update)
+        if to_embed:
+            in_flight.append((pool.submit([c["text"] for c in to_embed]), to_embed))
+        # Bound memory: at most two batches per encoder waiting to be upserted
+        while len(in_flight) > 2 * pool.workers:
+            upsert_oldest()
+        drain(wait_all=False)
+
+    try:
+        batch = []
+        for file in iter_text_files("data"):
+            fname = file["filename"]
+            file_hash = _hash_text(file["text"])
+            entry = old_files.get(fname)
+            if entry and entry["hash"] == file_hash:
+                files[fname] = entry
+                live_ids.update(entry["chunks"])
+                counts["unchanged"] += 1
+                continue
+
+            counts["changed"] += 1
+            state = pending[fname] = {"entry": {"hash": file_hash, "chunks": []}, "unflushed": 0, "chunked": False}
+            for chunk in iter_file_chunks(fname, file["text"]):
+                state["entry"]["chunks"].append(chunk["id"])
+                state["unflushed"] += 1
+                live_ids.add(chunk["id"])
+                batch.append(chunk)
+                if len(batch) >= batch_size:
+                    flush(batch)
+                    batch = []
+            state["chunked"] = True
+            complete_if_done(fname)
+        if batch:
+            flush(batch)
+        drain(wait_all=True)
+    finally:
+        progress.close()
+        pool.shutdown()
+
+    # Delete only after new chunks are in, so queries never see an empty collection
+    stale = [chunk_id for chunk_id in collection.get(include=[])["ids"] if chunk_id not in live_ids]
+    if stale:
+        collection.delete(ids=stale)
+    if rebuild:
+        collection = _promote_staging(collection)
+    save_manifest(files)
+
+    elapsed = time.perf_counter() - started
+    print(f"{counts['unchanged']} files unchanged, {counts['changed']} new or changed, "
+          f"{len(set(old_files) - set(files))} removed")
+    print(f"Ingestion complete in {elapsed:.1f}s: {counts['embedded']} embedded "
+          f"({counts['embedded'] / elapsed:.1f} chunks/s), {counts['updated']} re-positioned, {len(stale)} deleted.")
+    print(f"Total chunks: {collection.count()}")
+
+    if rebuild or counts["embedded"] or counts["updated"] or stale or current_version() is None:
+        export_snapshot(collection, batch_size=batch_size, faiss_index=faiss_index, quantize=quantize)
+    else:
+        print("No changes; current index snapshot kept.")
+
+def export_snapshot(collection=None, batch_size=INGEST_BATCH_SIZE, faiss_index=None, quantize=None):
+    """
+    Publish a snapshot from the ChromaDB collection without re-embedding, paging
+    through it in batches. faiss_index is the FAISS index type to build into it
+    (default FAISS_INDEX_TYPE when VECTOR_BACKEND=faiss, otherwise none); quantize
+    adds int8 and binary codes (default when VECTOR_BACKEND is int8 or binary).
+    """
+    if faiss_index is None and VECTOR_BACKEND == "faiss":
+        faiss_index = FAISS_INDEX_TYPE
+    if quantize is None:
+        quantize = VECTOR_BACKEND in ("int8", "binary")
+    if collection is None:
+        collection = _get_collection()
+    count = collection.count()
+    if count == 0:
+        print("Collection is empty; no snapshot published.")
+        return None
+
+    writer = None
+    lexical = BM25Builder()
+    try:
+        for offset in range(0, count, batch_size):
+            results = collection.get(
+                include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset
+            )
+            embeddings = _normalized(results["embeddings"])
+            if writer is None:
+                writer = SnapshotWriter(count, embeddings.shape[1])
+            chunks = []
+            for chunk_id, text, meta in zip(results["ids"], results["documents"], results["metadatas"]):
+                meta = meta or {}
+                chunks.append({
+                    "id": chunk_id,
+                    "text": text,
+                    "filename": meta.get("filename", ""),
+                    "chunk_index": meta.get("chunk_index", 0),
+                    "start": meta.get("start"),
+                    "end": meta.get("end")
+                })
+            writer.add(embeddings, chunks)
+            lexical.add(chunk["text"] for chunk in chunks)
+        started = time.perf_counter()
+        info = lexical.write(writer.path)
+        print(f"Built BM25 index in {time.perf_counter() - started:.1f}s: {len(info['terms'])} terms, "
+              f"{info['postings']} postings")
+        faq_count = write_faq_index(writer.path)
+        if faiss_index:
+            from faiss_index import write_faiss_index
+
+            info = write_faiss_index(writer.path, writer.embeddings(), index_type=faiss_index)
+            recall = info["recall_at_10"]
+            probe = f" at nprobe {min(recall['nprobe'], info['nlist'])} of {info['nlist']} lists" if "nlist" in info else ""
+            print(f"Built FAISS {info['type']} index in {info['build_seconds']}s: recall@10 {recall['recall']:.3f} "
+                  f"vs exact search{probe} ({info['recall_queries']} queries), p50 {recall['p50_ms']} ms")
+        if quantize:
+            from quantized import write_quantized, KINDS
+
+            info = write_quantized(writer.path, writer.embeddings())
+            for kind in KINDS:
+                report = info[kind]
+                print(f"Wrote {kind} codes ({report['mb']} MB): recall@10 {report['recall']:.3f} vs exact search "
+                      f"re-scoring {report['rerank']}x ({info['recall_queries']} queries), p50 {report['p50_ms']} ms")
+        version = writer.publish()
+    except Exception:
+        if writer is not None:
+            writer.abort()
+        raise
+    print(f"Published index snapshot {version} ({count} chunks, {faq_count} FAQ entries)")
+    return version
+
+def _normalized(embeddings):
+    """Stored embeddings as a float32 matrix with unit-length rows."""
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
 
 if __name__ == "__main__":
-    build_db()
+    parser = argparse.ArgumentParser(description="Ingest data/ into ChromaDB and publish an index snapshot.")
+    parser.add_argument("--full", action="store_true", help="re-embed every chunk, ignoring the manifest")
+    parser.add_argument("--snapshot-only", action="store_true", help="publish a snapshot from the existing collection")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="chunks per encode/upsert batch")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="encoder processes (1 encodes inline)")
+    parser.add_argument("--faiss-index", choices=["flat", "ivf", "ivfpq", "auto"],
+                        help="build this FAISS index into the snapshot (default: FAISS_INDEX_TYPE if VECTOR_BACKEND=faiss)")
+    parser.add_argument("--quantize", action="store_true", default=None,
+                        help="write int8 and binary codes into the snapshot (default: if VECTOR_BACKEND is int8 or binary)")
+    args = parser.parse_args()
+    if args.snapshot_only:
+        export_snapshot(batch_size=args.batch_size, faiss_index=args.faiss_index, quantize=args.quantize)
+    else:
+        build_db(full=args.full, batch_size=args.batch_size, workers=args.workers, faiss_index=args.faiss_index,
+                 quantize=args.quantize)
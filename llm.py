@@ -0,0 +1,427 @@
+# llm.py - Shared Gemini client
+# Every entry point generates through this module instead of building its own
+# GenerativeModel and retry loop:
+# - google.generativeai is imported on first use and model handles are created once
+#   per model name and reused;
+# - each attempt has a deadline (LLM_TIMEOUT) and all attempts of a call stay within
+#   LLM_BUDGET, with jittered exponential backoff in between. The SDK's own retry,
+#   which can keep retrying a 503 for minutes, is switched off;
+# - optionally (LLM_HEDGE), a call still running after the recent p95 latency is
+#   raced by a second identical call and the first answer wins;
+# - a circuit breaker fails fast for LLM_BREAKER_COOLDOWN seconds once
+#   LLM_BREAKER_FAILURES attempts in a row have failed, then lets one probe through;
+# - at most LLM_MAX_CONCURRENCY calls run per process. A caller that cannot get a
+#   slot within LLM_QUEUE_TIMEOUT gets LLMUnavailable, which the endpoints turn
+#   into 503 with Retry-After instead of queueing more threads.
+import math
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from metrics import LLM_RETRIES, LLM_HEDGES, LLM_REJECTIONS
+from config import (
+    GEMINI_API_KEY, GEMINI_API_ENDPOINT, LLM_TIMEOUT, LLM_BUDGET, LLM_MAX_ATTEMPTS, LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX, LLM_HEDGE, LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN, LLM_MAX_CONCURRENCY, LLM_QUEUE_TIMEOUT
+)
+
+# Latencies kept for the hedging delay, and how many are needed before hedging starts
+LATENCY_WINDOW = 200
+MIN_HEDGE_SAMPLES = 20
+
+# No new attempt is started with less than this much of the budget left (seconds)
+MIN_ATTEMPT_SECONDS = 0.5
+
+class LLMError(Exception):
+    """Generation failed: a non-retryable error, or every attempt within the budget failed."""
+
+class LLMUnavailable(LLMError):
+    """Rejected without calling Gemini (circuit open or too many calls in flight)."""
+
+    def __init__(self, reason, retry_after):
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"The assistant is busy right now ({reason}); please retry in {self.retry_after}s.")
+
+class CircuitBreaker:
+    """Opens after `failures` failed attempts in a row; after `cooldown` seconds one probe call decides."""
+
+    def __init__(self, failures=5, cooldown=30.0):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.opened = 0
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    def open_for(self):
+        """Seconds until the breaker lets a call through again (0 when closed or ready to probe)."""
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def check(self):
+        """
+        Raise LLMUnavailable while open. Once the cooldown has passed a single probe
+        is admitted (another one only if it has not finished within a cooldown).
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return
+            now = time.monotonic()
+            remaining = self.opened_at + self.cooldown - now
+            probing = self._probe_started is not None and now - self._probe_started < self.cooldown
+            if remaining > 0 or probing:
+                LLM_REJECTIONS.labels("circuit_open").inc()
+                raise LLMUnavailable("circuit open", remaining if remaining > 0 else 1)
+            self._probe_started = now
+
+    def success(self):
+        """Gemini answered (even with a client error): close the breaker."""
+        with self._lock:
+            if self.opened_at is not None:
+                print("✅ Gemini circuit breaker closed")
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._probe_started = None
+
+    def failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            probe_failed = self._probe_started is not None
+            self._probe_started = None
+            if probe_failed or (self.opened_at is None and self.consecutive_failures >= self.failures):
+                self.opened_at = time.monotonic()
+                self.opened += 1
+                print(f"⚠️  Gemini circuit breaker open for {self.cooldown:.0f}s "
+                      f"after {self.consecutive_failures} failed attempts")
+
+    def state(self):
+        remaining = self.open_for()
+        with self._lock:
+            if self.opened_at is None:
+                state = "closed"
+            else:
+                state = "open" if remaining > 0 else "half_open"
+            return {"state": state, "consecutive_failures": self.consecutive_failures, "opened": self.opened}
+
+class LatencyWindow:
+    """Recent successful call latencies, for the hedging delay."""
+
+    def __init__(self, size=LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self):
+        """95th percentile of the window, or None until MIN_HEDGE_SAMPLES calls have completed."""
+        with self._lock:
+            if len(self._samples) < MIN_HEDGE_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+class Slot:
+    """A concurrency slot; release() is idempotent so it can be tied to several exit paths."""
+
+    def __init__(self, release):
+        self._release = release
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+_genai = None
+_genai_lock = threading.Lock()
+_models = {}
+_breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN)
+_latencies = LatencyWindow()
+_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+_async_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+_hedge_pool = ThreadPoolExecutor(max_workers=2 * LLM_MAX_CONCURRENCY, thread_name_prefix="llm-call")
+
+def get_genai():
+    """The google.generativeai module (about a second to import), imported and configured on first call."""
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                import google.generativeai as genai
+                # Gemini itself, or a local stand-in such as bench/fake_gemini.py
+                if GEMINI_API_ENDPOINT:
+                    genai.configure(api_key=GEMINI_API_KEY, transport='rest',
+                                    client_options={'api_endpoint': GEMINI_API_ENDPOINT})
+                else:
+                    genai.configure(api_key=GEMINI_API_KEY)
+                _genai = genai
+    return _genai
+
+def get_model(name):
+    """Shared GenerativeModel handle for a model name ("models/" prefix optional)."""
+    name = name.replace('models/', '', 1) if name.startswith('models/') else name
+    model = _models.get(name)
+    if model is None:
+        model = _models.setdefault(name, get_genai().GenerativeModel(name))
+    return model
+
+def _retryable(error):
+    """
+    Server errors (503, deadline exceeded), rate limiting and transport failures
+    (requests errors are OSErrors) are retried and count toward the circuit
+    breaker. Anything else, client errors and bugs on our side, fails at once.
+    """
+    from google.api_core import exceptions as api_exceptions
+    return isinstance(error, (
+        api_exceptions.ServerError, api_exceptions.TooManyRequests, OSError, TimeoutError, asyncio.TimeoutError
+    ))
+
+def _backoff(attempt):
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+def _request_options(timeout):
+    return {"timeout": timeout, "retry": None}
+
+def response_text(response):
+    """Text of a Gemini response, or "" when it has no text parts (e.g. blocked)."""
+    try:
+        return response.text
+    except ValueError:
+        return ""
+
+def _retry_delay(attempt, error, deadline, endpoint):
+    """
+    Record a failed attempt and return how long to sleep before the next one, or
+    None when the error is not retryable, attempts are used up or the budget is.
+    """
+    if not _retryable(error):
+        _breaker.success()
+        return None
+    _breaker.failure()
+    delay = _backoff(attempt)
+    if attempt + 1 >= LLM_MAX_ATTEMPTS or time.monotonic() + delay > deadline - MIN_ATTEMPT_SECONDS:
+        return None
+    print(f"⚠️  Gemini error (attempt {attempt + 1}): {error}; retrying in {delay:.2f}s")
+    if endpoint:
+        LLM_RETRIES.labels(endpoint).inc()
+    return delay
+
+def _check_admission():
+    remaining = _breaker.open_for()
+    if remaining > 0:
+        LLM_REJECTIONS.labels("circuit_open").inc()
+        raise LLMUnavailable("circuit open", remaining)
+
+def admit():
+    """
+    Take a concurrency slot (waiting up to LLM_QUEUE_TIMEOUT) or raise LLMUnavailable.
+    Also fails fast while the circuit breaker is open.
+    """
+    _check_admission()
+    if not _slots.acquire(timeout=LLM_QUEUE_TIMEOUT):
+        LLM_REJECTIONS.labels("overloaded").inc()
+        raise LLMUnavailable("too many requests in flight", 1)
+    return Slot(_slots.release)
+
+async def admit_async():
+    """admit() for asyncio code."""
+    _check_admission()
+    try:
+        await asyncio.wait_for(_async_slots.acquire(), LLM_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        LLM_REJECTIONS.labels("overloaded").inc()
+        raise LLMUnavailable("too many requests in flight", 1)
+    return Slot(_async_slots.release)
+
+def _hedged(call, timeout):
+    """Run call(); if it is still running after the p95 latency, race a second one and return the first result."""
+    delay = _latencies.p95()
+    if not LLM_HEDGE or delay is None or delay >= timeout:
+        return call()
+    first = _hedge_pool.submit(call)
+    done, pending = wait([first], timeout=delay)
+    if not done:
+        LLM_HEDGES.inc()
+        pending.add(_hedge_pool.submit(call))
+    error = None
+    while True:
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+        if not pending:
+            raise error
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+async def _ahedged(call, timeout):
+    """_hedged() for coroutines; the losing call is cancelled."""
+    delay = _latencies.p95()
+    if not LLM_HEDGE or delay is None or delay >= timeout:
+        return await call()
+    first = asyncio.ensure_future(call())
+    done, pending = await asyncio.wait({first}, timeout=delay)
+    if not done:
+        LLM_HEDGES.inc()
+        pending.add(asyncio.ensure_future(call()))
+    error = None
+    try:
+        while True:
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+            if not pending:
+                raise error
+            done, pending = await asyncio.wait(pending, return_when=FIRST_COMPLETED)
+    finally:
+        for task in pending:
+            task.cancel()
+
+def generate(prompt, model_name, endpoint=None, generation_config=None):
+    """
+    Generate a complete answer and return its text ("" if Gemini returned none).
+    Raises LLMUnavailable when rejected up front and LLMError when generation failed.
+    endpoint labels the retry metric.
+    """
+    model = get_model(model_name)
+    with admit():
+        deadline = time.monotonic() + LLM_BUDGET
+        for attempt in range(LLM_MAX_ATTEMPTS):
+            _breaker.check()
+            timeout = min(LLM_TIMEOUT, deadline - time.monotonic())
+            started = time.monotonic()
+            try:
+                response = _hedged(lambda: model.generate_content(
+                    prompt, generation_config=generation_config, request_options=_request_options(timeout)
+                ), timeout)
+            except Exception as e:
+                delay = _retry_delay(attempt, e, deadline, endpoint)
+                if delay is None:
+                    raise LLMError(f"Gemini call failed: {e}") from e
+                time.sleep(delay)
+                continue
+            _breaker.success()
+            _latencies.add(time.monotonic() - started)
+            return response_text(response)
+
+def stream(prompt, model_name, endpoint=None, slot=None):
+    """
+    Yield the answer text as Gemini generates it. Failed attempts are retried
+    (within the budget) only until the first text has been yielded. Uses the
+    caller's slot from admit() if given, otherwise takes one; it is released
+    when the generator finishes.
+    """
+    model = get_model(model_name)
+    slot = slot or admit()
+    try:
+        deadline = time.monotonic() + LLM_BUDGET
+        for attempt in range(LLM_MAX_ATTEMPTS):
+            _breaker.check()
+            timeout = min(LLM_TIMEOUT, deadline - time.monotonic())
+            produced = False
+            try:
+                response = model.generate_content(prompt, stream=True, request_options=_request_options(timeout))
+                for chunk in response:
+                    text = response_text(chunk)
+                    if text:
+                        produced = True
+                        yield text
+            except Exception as e:
+                if produced:
+                    # Text already sent cannot be taken back
+                    if _retryable(e):
+                        _breaker.failure()
+                    raise LLMError(f"Gemini stream failed: {e}") from e
+                delay = _retry_delay(attempt, e, deadline, endpoint)
+                if delay is None:
+                    raise LLMError(f"Gemini call failed: {e}") from e
+                time.sleep(delay)
+                continue
+            _breaker.success()
+            return
+    finally:
+        slot.release()
+
+async def agenerate(prompt, model_name, endpoint=None, generation_config=None):
+    """generate() through the async client; backoff yields to other requests."""
+    model = get_model(model_name)
+    with await admit_async():
+        deadline = time.monotonic() + LLM_BUDGET
+        for attempt in range(LLM_MAX_ATTEMPTS):
+            _breaker.check()
+            timeout = min(LLM_TIMEOUT, deadline - time.monotonic())
+            started = time.monotonic()
+            try:
+                response = await _ahedged(lambda: model.generate_content_async(
+                    prompt, generation_config=generation_config, request_options=_request_options(timeout)
+                ), timeout)
+            except Exception as e:
+                delay = _retry_delay(attempt, e, deadline, endpoint)
+                if delay is None:
+                    raise LLMError(f"Gemini call failed: {e}") from e
+                await asyncio.sleep(delay)
+                continue
+            _breaker.success()
+            _latencies.add(time.monotonic() - started)
+            return response_text(response)
+
+async def astream(prompt, model_name, endpoint=None, slot=None):
+    """stream() through the async client."""
+    model = get_model(model_name)
+    slot = slot or await admit_async()
+    try:
+        deadline = time.monotonic() + LLM_BUDGET
+        for attempt in range(LLM_MAX_ATTEMPTS):
+            _breaker.check()
+            timeout = min(LLM_TIMEOUT, deadline - time.monotonic())
+            produced = False
+            try:
+                response = await model.generate_content_async(
+                    prompt, stream=True, request_options=_request_options(timeout)
+                )
+                async for chunk in response:
+                    text = response_text(chunk)
+                    if text:
+                        produced = True
+                        yield text
+            except Exception as e:
+                if produced:
+                    if _retryable(e):
+                        _breaker.failure()
+                    raise LLMError(f"Gemini stream failed: {e}") from e
+                delay = _retry_delay(attempt, e, deadline, endpoint)
+                if delay is None:
+                    raise LLMError(f"Gemini call failed: {e}") from e
+                await asyncio.sleep(delay)
+                continue
+            _breaker.success()
+            return
+    finally:
+        slot.release()
+
+def stats():
+    """Circuit breaker state, hedging delay and free concurrency slots of this process."""
+    p95 = _latencies.p95()
+    return {
+        "circuit": _breaker.state(),
+        "p95_seconds": round(p95, 3) if p95 is not None else None,
+        "hedging": LLM_HEDGE,
+        "max_concurrency": LLM_MAX_CONCURRENCY
+    }
@@ -0,0 +1,92 @@
+# metrics.py - Prometheus metrics and per-request timing spans
+# Stage timings feed Prometheus histograms and are also collected per request for
+# the Server-Timing response header. With PROMETHEUS_MULTIPROC_DIR set (see
+# gunicorn.conf.py) every Gunicorn worker writes its samples to that directory and
+# /metrics on any worker reports the sum across all of them.
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+
+# Buckets from 1 ms (cached embedding) up to 30 s (slow Gemini call with retries)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_SECONDS = Histogram(
+    "chatbot_stage_seconds", "Time spent in each request stage", ["stage"], buckets=LATENCY_BUCKETS
+)
+STAGE_ERRORS = Counter("chatbot_stage_errors_total", "Exceptions raised inside a stage", ["stage"])
+REQUEST_SECONDS = Histogram(
+    "chatbot_request_seconds", "Request latency until the response is returned", ["endpoint"], buckets=LATENCY_BUCKETS
+)
+REQUESTS = Counter("chatbot_requests_total", "Requests by endpoint and status code", ["endpoint", "status"])
+IN_FLIGHT = Gauge(
+    "chatbot_requests_in_flight", "Requests currently being handled", ["endpoint"], multiprocess_mode="livesum"
+)
+LLM_RETRIES = Counter("chatbot_llm_retries_total", "Gemini calls retried after an error", ["endpoint"])
+LLM_HEDGES = Counter("chatbot_llm_hedges_total", "Second Gemini calls started because the first exceeded p95 latency")
+LLM_REJECTIONS = Counter(
+    "chatbot_llm_rejections_total", "Gemini calls refused without trying (circuit open, overloaded)", ["reason"]
+)
+CACHE_LOOKUPS = Counter("chatbot_cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+SINGLEFLIGHT = Counter(
+    "chatbot_singleflight_total",
+    "Chat computations by single-flight role (leader, follower, or other_worker for a result from another worker)",
+    ["role"]
+)
+ROUTES = Counter("chatbot_routes_total", "Questions by router outcome ('llm' when not answered by the fast path)", ["route"])
+RETRIEVALS = Counter(
+    "chatbot_retrievals_total",
+    "Queries retrieved by mode used (dense, hybrid, lexical, or fallback for BM25 while the embedding model is unavailable)",
+    ["mode"]
+)
+
+_timings = contextvars.ContextVar("timings", default=None)
+
+def start_timings():
+    """Begin collecting span timings for the current request; returns the list they are appended to."""
+    timings = []
+    _timings.set(timings)
+    return timings
+
+@contextmanager
+def span(stage):
+    """
+    Time a block as `stage`: observed in chatbot_stage_seconds, counted in
+    chatbot_stage_errors_total if it raises, and added to the current
+    request's Server-Timing list when one is being collected.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+def cache_lookup(cache, hit):
+    """Count a hit or miss for the named cache."""
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+def server_timing(timings, total=None):
+    """Format collected spans as a Server-Timing header value (durations in milliseconds)."""
+    entries = [f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in timings]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+def render():
+    """Return (body, content type) for /metrics, merged across worker processes in multiprocess mode."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
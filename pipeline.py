@@ -0,0 +1,81 @@
+# pipeline.py - Shared retrieval and streaming steps for the chat endpoints
+# Used by the Flask app (app.py) and the asyncio app (asgi.py) so both serve the same answers.
+import json
+from retrieval import get_store, search_query, search_queries
+from embeddings import normalize_text
+
+# Gemini model used for lead-generation answers
+ANSWER_MODEL = 'gemini-2.5-flash'
+
+FALLBACK_ANSWER = "I'm sorry, I do not have an answer. Please contact support for assistance."
+
+def retrieve(question, top_k=3):
+    """
+    Search the current store for the question (by RETRIEVAL_MODE); the store is
+    returned so callers keep using that version. The query embedding is None when
+    retrieval was lexical only.
+    """
+    store = get_store()
+    query_embedding, relevant_chunks = search_query(store, question, top_k=top_k)
+    chunk_ids = [chunk['id'] for score, chunk in relevant_chunks]
+    return store, query_embedding, relevant_chunks, chunk_ids
+
+def retrieve_batch(questions, top_k=3):
+    """
+    Batched retrieve(): one encode for all questions and one multi-query search.
+    Returns (store, query embeddings, relevant chunks per question, chunk ids per question);
+    each query embedding is None when retrieval was lexical only.
+    """
+    store = get_store()
+    query_embeddings, results = search_queries(store, questions, top_k=top_k)
+    if query_embeddings is None:
+        query_embeddings = [None] * len(questions)
+    chunk_ids = [[chunk['id'] for score, chunk in relevant_chunks] for relevant_chunks in results]
+    return store, query_embeddings, results, chunk_ids
+
+def group_batch_questions(questions):
+    """
+    Validate and de-duplicate the questions of a /api/chat/batch request.
+    Returns (results, unique, positions): results holds an error entry for each
+    invalid item and None elsewhere, and positions[i] lists the input indices
+    answered by unique[i].
+    """
+    results = [None] * len(questions)
+    unique = []
+    positions = []
+    seen = {}
+    for i, question in enumerate(questions):
+        text = question.strip() if isinstance(question, str) else ''
+        if not text:
+            results[i] = {'question': question, 'error': 'No question provided.'}
+            continue
+        key = normalize_text(text)
+        if key not in seen:
+            seen[key] = len(unique)
+            unique.append(text)
+            positions.append([])
+        positions[seen[key]].append(i)
+    return results, unique, positions
+
+def batch_response(results):
+    """JSON body for /api/chat/batch: per-item results in input order plus counts."""
+    return {
+        'results': results,
+        'count': len(results),
+        'errors': sum(1 for result in results if 'error' in result)
+    }
+
+def sse_event(event, data):
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def routed_events(answer, done):
+    """Events for a fast-path answer (see router.py): no sources, the whole answer as one token, then done."""
+    return [sse_event('sources', {'sources': []}), sse_event('token', {'text': answer}), sse_event('done', done)]
+
+def source_list(relevant_chunks):
+    """Citations sent to streaming clients: filename, chunk index and score of each retrieved chunk."""
+    return [
+        {'filename': chunk['filename'], 'chunk_index': chunk['chunk_index'], 'score': round(score, 4)}
+        for score, chunk in relevant_chunks
+    ]
@@ -0,0 +1,168 @@
+# prompts.py - Prompt assembly shared by app.py, asgi.py, terminal_chat.py and chat.py
+# Retrieved chunks overlap by CHUNK_OVERLAP characters, so neighbouring chunks from the
+# same file are merged back into contiguous spans before they go into the prompt, and
+# context stops at a token budget so prompt size (and LLM latency) stays bounded.
+import math
+from config import CHUNK_OVERLAP, PROMPT_CONTEXT_TOKENS
+
+LEAD_SYSTEM_PROMPT = (
+    "You are a professional business development chatbot for Convo Sol, an AI SaaS company. "
+    "Your primary goal is to generate leads and convince potential clients to start projects with us. "
+    "Be conversational, brief, and persuasive. Focus on understanding their needs and positioning our services as the solution. "
+    "If they show interest, guide them towards scheduling a meeting to discuss their project in detail.\n\n"
+    "Guidelines:\n"
+    "- Keep responses concise and engaging (2-3 sentences max)\n"
+    "- Ask follow-up questions to understand their project needs\n"
+    "- Highlight our expertise and successful track record\n"
+    "- When appropriate, suggest scheduling a consultation call\n"
+    "- If clients want to connect with co-founders, provide their contact details from the company information\n"
+    "- Co-founders: Muneeb Qureshi (muneebq2003@gmail.com, LinkedIn: https://www.linkedin.com/in/muneebqureshi2003/), Muhammad Hadi (muhammadhadiabid@gmail.com, LinkedIn: https://www.linkedin.com/in/muhammad-hadi-abid), Awais Khaleeq (ds.awaisk@gmail.com, LinkedIn: https://www.linkedin.com/in/muhammad-awais-khaleeq)\n"
+    "- Use a friendly, professional tone like you're chatting with a potential client"
+)
+
+STRICT_SYSTEM_PROMPT = """You are an assistant that MUST ONLY use the provided CONTEXT to answer the user's question.
+Do NOT hallucinate, do NOT use outside knowledge. If the answer cannot be found in the context, reply exactly:
+"I don't know based on provided documents."
+
+When answering, provide a brief introduction or summary focusing on the most important information only. Do not provide all details at once. If more specifics are needed, suggest the user ask for further details. Be concise. After your answer include a short "Sources:" line listing filename(s) and chunk indices used, for example:
+Sources: doc1.txt#2, doc2.txt#0
+
+As a lead generation bot for Convo Sol, always encourage users to contact Convo Sol directly via email (info@convosol.com, support@convosol.com), website (convosol.com), LinkedIn (https://www.linkedin.com/company/convosol/), or contact the co-founders (Muneeb Qureshi: muneebq2003@gmail.com, Muhammad Hadi: muhammadhadiabid@gmail.com, Awais Khaleeq: ds.awaisk@gmail.com) for pricing details, further discussions, or to schedule a meeting.
+"""
+
+def estimate_tokens(text):
+    """Rough token count for Gemini (about 4 characters per token for English text)."""
+    return math.ceil(len(text) / 4)
+
+def _join(a, b):
+    """
+    Merge two chunks of the same file, b starting at or before a's end.
+    Uses character offsets when available, otherwise the known chunk overlap.
+    """
+    if a.get('end') is not None and b.get('start') is not None:
+        overlap = a['end'] - b['start']
+        if overlap < 0:
+            return None
+        return a['text'] + b['text'][overlap:]
+    if b['chunk_indices'][0] == a['chunk_indices'][-1] + 1 and CHUNK_OVERLAP and \
+            a['text'][-CHUNK_OVERLAP:] == b['text'][:CHUNK_OVERLAP]:
+        return a['text'] + b['text'][CHUNK_OVERLAP:]
+    return None
+
+def merge_chunks(results):
+    """
+    Merge overlapping or adjacent chunks from the same file into contiguous spans.
+    results: list of (score, chunk) from the vector store.
+    Returns spans (dicts with filename, text, start, end, chunk_indices, chunk_ids,
+    score) ordered by their best chunk score.
+    """
+    by_file = {}
+    for score, chunk in results:
+        by_file.setdefault(chunk['filename'], []).append({
+            'filename': chunk['filename'],
+            'text': chunk['text'],
+            'start': chunk.get('start'),
+            'end': chunk.get('end'),
+            'chunk_indices': [chunk['chunk_index']],
+            'chunk_ids': [chunk.get('id')],
+            'score': score
+        })
+
+    spans = []
+    for pieces in by_file.values():
+        pieces.sort(key=lambda p: (p['start'] if p['start'] is not None else -1, p['chunk_indices'][0]))
+        current = pieces[0]
+        for piece in pieces[1:]:
+            if piece['chunk_indices'][0] in current['chunk_indices']:
+                continue  # same chunk retrieved twice
+            merged_text = _join(current, piece)
+            if merged_text is None:
+                spans.append(current)
+                current = piece
+                continue
+            current = dict(
+                current,
+                text=merged_text,
+                end=piece['end'],
+                chunk_indices=current['chunk_indices'] + piece['chunk_indices'],
+                chunk_ids=current['chunk_ids'] + piece['chunk_ids'],
+                score=max(current['score'], piece['score'])
+            )
+        spans.append(current)
+
+    spans.sort(key=lambda s: -s['score'])
+    return spans
+
+def pack_context(results, token_budget=PROMPT_CONTEXT_TOKENS):
+    """
+    Merge retrieved chunks into spans and keep the best ones that fit token_budget.
+    The span that crosses the budget is cut at a word boundary if a useful part fits.
+    """
+    packed = []
+    used = 0
+    for span in merge_chunks(results):
+        text = span['text'].strip()
+        tokens = estimate_tokens(text)
+        if used + tokens > token_budget:
+            remaining = token_budget - used
+            if remaining < 50:
+                break
+            text = text[:remaining * 4].rsplit(' ', 1)[0]
+            tokens = estimate_tokens(text)
+        packed.append(dict(span, text=text))
+        used += tokens
+        if used >= token_budget:
+            break
+    return packed
+
+def build_lead_prompt(question, results, token_budget=PROMPT_CONTEXT_TOKENS, history=None):
+    """
+    Lead-generation prompt used by the chat endpoints and terminal front ends.
+    history is the compacted conversation so far (see sessions.py), if any.
+    Returns (prompt, info) where info reports token estimates and the spans used.
+    """
+    spans = pack_context(results, token_budget)
+    context = "\n\n".join(span['text'] for span in spans)
+    conversation = f"Conversation so far:\n{history}\n\n" if history else ""
+    prompt = (
+        f"{LEAD_SYSTEM_PROMPT}\n\n"
+        f"Company Information:\n{context}\n\n"
+        f"{conversation}"
+        f"Client: {question}\n"
+        f"Response:"
+    )
+    return prompt, _prompt_info(prompt, context, results, spans, history)
+
+def build_strict_prompt(question, results, token_budget=PROMPT_CONTEXT_TOKENS):
+    """
+    Context-only prompt with filename/chunk citations (used by chat.py).
+    Returns (prompt, citations, info).
+    """
+    spans = pack_context(results, token_budget)
+    context_texts = []
+    citations = []
+    for span in spans:
+        indices = span['chunk_indices']
+        label = str(indices[0]) if len(indices) == 1 else f"{indices[0]}-{indices[-1]}"
+        context_texts.append(f"---\nFilename: {span['filename']}\nChunk: {label}\nText:\n{span['text']}\n---")
+        citations.extend(f"{span['filename']}#{i}" for i in indices)
+
+    context_block = "\n\n".join(context_texts)
+    prompt = f"""{STRICT_SYSTEM_PROMPT}
+
+Provided context:
+{context_block}
+
+User question: {question}
+
+If you can answer, answer and include the Sources line."""
+    return prompt, citations, _prompt_info(prompt, context_block, results, spans)
+
+def _prompt_info(prompt, context, results, spans, history=None):
+    return {
+        'prompt_tokens': estimate_tokens(prompt),
+        'context_tokens': estimate_tokens(context),
+        'history_tokens': estimate_tokens(history or ""),
+        'chunks_retrieved': len(results),
+        'spans': len(spans)
+    }
@@ -0,0 +1,80 @@
+# recall.py - Exact re-scoring and recall measurement for approximate vector search
+# Shared by the FAISS index (faiss_index.py) and the quantized codes (quantized.py):
+# both find candidates approximately, re-score a shortlist with the exact vectors
+# of the memory-mapped snapshot, and report recall@k against exact search.
+import os
+import time
+import numpy as np
+from faq import EMBEDDINGS_FILE as FAQ_EMBEDDINGS_FILE
+
+# Corpus rows used as queries when a snapshot has no FAQ questions
+RECALL_QUERIES = 200
+
+class ExactRerank:
+    """
+    Re-score approximate candidates with the exact vectors, read from the
+    memory-mapped snapshot: factor * k candidates are fetched per k results.
+    """
+
+    def __init__(self, embeddings, factor):
+        self.embeddings = embeddings
+        self.factor = max(1, factor)
+
+    def __call__(self, query, ids, k):
+        """The k best of the candidate row ids by exact score: (ids, scores), best first."""
+        ids = np.sort(ids[ids >= 0])  # ascending row order reads the memory map sequentially
+        scores = np.asarray(self.embeddings[ids], dtype=np.float32) @ query
+        best = np.argsort(-scores)[:k]
+        return ids[best], scores[best]
+
+def exact_top_k(embeddings, queries, k, block=65536):
+    """Exact top-k row ids per query, scanning the (possibly memory-mapped) matrix in blocks."""
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), k), dtype=np.int64)
+    for start in range(0, len(embeddings), block):
+        scores = queries @ np.asarray(embeddings[start:start + block], dtype=np.float32).T
+        ids = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+        scores = np.concatenate([best_scores, scores], axis=1)
+        ids = np.concatenate([best_ids, ids], axis=1)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids = np.take_along_axis(ids, top, axis=1)
+    return best_ids
+
+def recall_queries(path, embeddings, seed=0):
+    """
+    Queries for a build-time recall check of the snapshot in `path`: its FAQ
+    questions (real user questions) when it has them, otherwise a sample of the
+    indexed rows. Returns (queries, "faq" or "corpus").
+    """
+    faq_path = os.path.join(path, FAQ_EMBEDDINGS_FILE) if path else None
+    if faq_path and os.path.exists(faq_path):
+        queries = np.load(faq_path)
+        if queries.shape[1:] == embeddings.shape[1:]:
+            return np.asarray(queries, dtype=np.float32), "faq"
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(embeddings), size=min(RECALL_QUERIES, len(embeddings)), replace=False))
+    return np.asarray(embeddings[rows], dtype=np.float32), "corpus"
+
+def measure_recall(search, embeddings, queries, k=10, truth=None):
+    """
+    Recall@k of search(query, k) -> row ids against exact search, with its
+    latency: {"recall", "p50_ms", "p95_ms"}. truth (from exact_top_k) can be
+    passed to reuse it across several measurements.
+    """
+    k = min(k, len(embeddings))
+    if truth is None:
+        truth = exact_top_k(embeddings, queries, k)
+    found = []
+    timings = []
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        ids = search(query, k)
+        timings.append(time.perf_counter() - started)
+        found.append(len(set(np.asarray(ids).tolist()) & set(expected.tolist())) / k)
+    ms = np.asarray(timings) * 1000.0
+    return {
+        "recall": round(float(np.mean(found)), 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3)
+    }
@@ -1,17 +1,50 @@
 # retrieval.py - Query Embedding & Search
 # Uses ChromaDB and local sentence-transformers for query embeddings (consistent with ingest.py)
-import chromadb
-from embeddings import get_embedding
-from config import TOP_K
+#
+# Vector backends (VECTOR_BACKEND) share the InMemoryVectorStore interface:
+# search(), search_batch(), version, docs and len(). A backend is a loader in
+# VECTOR_BACKENDS that opens a snapshot version as a store:
+# - exact: numpy matrix-vector product over the memory-mapped snapshot embeddings
+# - faiss: the FAISS index ingest.py built into the snapshot (see faiss_index.py)
+# - int8, binary: a scan over compact codes of the embeddings, re-scored exactly
+#   (see quantized.py)
+#
+# Retrieval modes (RETRIEVAL_MODE) combine the vector store with the BM25 index of
+# the same snapshot (see bm25.py), attached to the store as store.lexical:
+# - dense: embedding search only
+# - hybrid: dense and BM25 rankings fused by reciprocal rank
+# - lexical: BM25 only; no embedding model needed
+# With LEXICAL_FALLBACK, dense and hybrid retrieval answer from BM25 alone while the
+# embedding model is loading in another thread or failing to load.
+import threading
+import time
+import numpy as np
+from embeddings import get_embeddings, model_available
+from snapshot import current_version, load_snapshot
+from metrics import RETRIEVALS, span
+from recall import ExactRerank
+from config import (
+    TOP_K, SNAPSHOT_CHECK_INTERVAL, VECTOR_BACKEND, FAISS_NPROBE, FAISS_RERANK,
+    RETRIEVAL_MODE, LEXICAL_FALLBACK, HYBRID_CANDIDATES, RRF_K
+)
+
+RETRIEVAL_MODES = ("dense", "hybrid", "lexical")
 
 # Lazy-loaded ChromaDB client and collection
 _client = None
 _collection = None
 
+# Lazy-loaded in-process vector store (see get_store)
+_store = None
+_store_version = None
+_store_checked_at = 0.0
+_store_lock = threading.Lock()
+
 def _get_collection():
     """Lazy load ChromaDB collection to avoid blocking startup."""
     global _client, _collection
     if _client is None:
+        import chromadb  # slow to import; only needed without a snapshot
         _client = chromadb.PersistentClient(path="db")
     if _collection is None:
         try:
@@ -20,30 +53,330 @@ def _get_collection():
             raise RuntimeError(f"Failed to load ChromaDB collection: {e}")
     return _collection
 
-def retrieve_top_k(query, top_k=TOP_K):
-    """Get the query embedding using local model and retrieve top-k chunks relevant to the query using ChromaDB."""
-    # Get query embedding from local model
-    embedding = get_embedding(query, task_type="retrieval_query")
+def release_collection():
+    """Drop the ChromaDB client so it is reopened on next use (e.g. in each worker after fork)."""
+    global _client, _collection
+    _client = None
+    _collection = None
 
-    # Query ChromaDB
+def _load_from_collection():
+    """Read every chunk (embedding, text, metadata) out of the ChromaDB collection."""
     collection = _get_collection()
-    results = collection.query(
-        query_embeddings=[embedding],
-        n_results=top_k
-    )
-
-    # Format results to match original return format
-    formatted_results = []
-    if results['documents'] and len(results['documents']) > 0:
-        for i in range(len(results['documents'][0])):
-            distance = results['distances'][0][i] if results['distances'] else 0
-            # Convert distance to similarity score (ChromaDB returns distances, lower is better)
-            score = 1 - distance
-            chunk = {
-                'text': results['documents'][0][i],
-                'filename': results['metadatas'][0][i].get('filename', ''),
-                'chunk_index': results['metadatas'][0][i].get('chunk_index', 0)
-            }
-            formatted_results.append((float(score), chunk))
-
-    return formatted_results
+    results = collection.get(include=["embeddings", "documents", "metadatas"])
+    docs = []
+    for chunk_id, text, meta in zip(results["ids"], results["documents"], results["metadatas"]):
+        meta = meta or {}
+        docs.append({
+            'id': chunk_id,
+            'text': text,
+            'filename': meta.get('filename', ''),
+            'chunk_index': meta.get('chunk_index', 0),
+            'start': meta.get('start'),
+            'end': meta.get('end')
+        })
+    return results["embeddings"], docs
+
+class InMemoryVectorStore:
+    """
+    Exact cosine-similarity search over all chunk embeddings.
+    Embeddings are kept in one contiguous, L2-normalized float32 matrix so a query
+    is a single matrix-vector product followed by argpartition for the top-k.
+
+    With no arguments the store is built from the current snapshot (memory-mapped,
+    shared between workers) or, if none has been published yet, from ChromaDB.
+    Pass normalized=True when the embeddings are already unit length (as in a
+    snapshot) so a memory-mapped array is used in place instead of copied.
+    """
+
+    backend = "exact"
+
+    def __init__(self, embeddings=None, docs=None, normalized=False, version=None):
+        if embeddings is None:
+            version = current_version()
+            if version is not None:
+                embeddings, docs = load_snapshot(version)
+                normalized = True
+            else:
+                embeddings, docs = _load_from_collection()
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2 or len(matrix) != len(docs):
+            raise ValueError("embeddings must be a 2-D array with one row per doc")
+        self.matrix = matrix if normalized else np.ascontiguousarray(_normalize_rows(matrix))
+        self.docs = docs
+        self.version = version or "chroma"
+        self.lexical = None  # BM25Index over the same rows, attached by open_store
+        self._filenames = None
+
+    def __len__(self):
+        return len(self.docs)
+
+    def search(self, query_embedding, top_k=TOP_K, filenames=None):
+        """
+        Return the top_k chunks for one query embedding as a list of (score, chunk)
+        tuples, best first. filenames optionally restricts results to those files.
+        """
+        with span("search"):
+            return self.search_batch([query_embedding], top_k=top_k, filenames=filenames)[0]
+
+    def search_lexical(self, query, top_k=TOP_K, filenames=None):
+        """BM25 counterpart of search() for a query text; chunks sharing no term with it are left out."""
+        mask = np.isin(self._filename_array(), list(filenames)) if filenames else None
+        ids, scores = self.lexical.search(query, top_k, mask)
+        return [(float(score), self.docs[i]) for i, score in zip(ids, scores)]
+
+    def search_batch(self, query_embeddings, top_k=TOP_K, filenames=None):
+        """Search several query embeddings at once; returns one result list per query."""
+        queries = _normalize_rows(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        if queries.shape[1] != self.matrix.shape[1]:
+            raise ValueError(
+                f"Query dimension {queries.shape[1]} does not match index dimension {self.matrix.shape[1]}"
+            )
+        if len(self.docs) == 0 or top_k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        top, top_scores = self._top_k(queries, min(top_k, len(self.docs)), filenames)
+        batch = []
+        for row_idx, row_scores in zip(top, top_scores):
+            batch.append([
+                (float(score), self.docs[i])
+                for i, score in zip(row_idx, row_scores)
+                if np.isfinite(score)
+            ])
+        return batch
+
+    def _top_k(self, queries, k, filenames=None):
+        """Row ids and scores of the k best rows per query, best first; a score of -inf marks no result."""
+        if len(queries) == 1:
+            scores = (self.matrix @ queries[0])[None, :]
+        else:
+            scores = queries @ self.matrix.T
+
+        if filenames:
+            mask = np.isin(self._filename_array(), list(filenames))
+            scores[:, ~mask] = -np.inf
+
+        if k < scores.shape[1]:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(k), (len(queries), 1))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def _filename_array(self):
+        """Per-row filenames, built on first use (decodes every chunk record once)."""
+        if self._filenames is None:
+            self._filenames = np.array([d['filename'] for d in self.docs])
+        return self._filenames
+
+class FaissVectorStore(InMemoryVectorStore):
+    """
+    Approximate search through the FAISS index ingest.py built into a snapshot
+    (flat, IVF or IVF-PQ; see faiss_index.py). The snapshot's exact embeddings stay
+    memory-mapped: IVF-PQ fetches rerank * k candidates and re-scores them exactly,
+    so only those rows are ever read.
+    """
+
+    backend = "faiss"
+
+    def __init__(self, index, info, embeddings, docs, version=None, nprobe=FAISS_NPROBE, rerank=FAISS_RERANK):
+        super().__init__(embeddings, docs, normalized=True, version=version)
+        if index.ntotal != len(docs):
+            raise ValueError(f"FAISS index has {index.ntotal} vectors for {len(docs)} chunks")
+        self.index = index
+        self.info = info
+        self.nprobe = nprobe
+        self._rerank = ExactRerank(self.matrix, rerank) if info["type"] == "ivfpq" else None
+
+    def _top_k(self, queries, k, filenames=None):
+        import faiss
+
+        params = faiss.SearchParametersIVF(nprobe=self.nprobe) if self.info["type"] != "flat" else faiss.SearchParameters()
+        if filenames:
+            rows = np.flatnonzero(np.isin(self._filename_array(), list(filenames))).astype(np.int64)
+            params.sel = selector = faiss.IDSelectorBatch(rows)  # kept referenced for the search
+        fetch = k * self._rerank.factor if self._rerank is not None else k
+        scores, ids = self.index.search(np.ascontiguousarray(queries), fetch, params=params)
+        if self._rerank is not None:
+            return _rerank_batch(self._rerank, queries, ids, k)
+        scores[ids < 0] = -np.inf
+        return ids, scores
+
+class QuantizedVectorStore(InMemoryVectorStore):
+    """
+    Search over compact int8 or binary codes of the snapshot embeddings (see
+    quantized.py): the codes are scanned for rerank * k candidates per query, which
+    are re-scored exactly against the memory-mapped float vectors, so only those
+    rows are ever read.
+    """
+
+    def __init__(self, codes, embeddings, docs, version=None, rerank=0):
+        super().__init__(embeddings, docs, normalized=True, version=version)
+        if len(codes.codes) != len(docs):
+            raise ValueError(f"{codes.kind} codes have {len(codes.codes)} rows for {len(docs)} chunks")
+        from quantized import rerank_factor
+
+        self.codes = codes
+        self.backend = codes.kind
+        self._rerank = ExactRerank(self.matrix, rerank or rerank_factor(codes.kind))
+
+    def _top_k(self, queries, k, filenames=None):
+        from quantized import shortlist
+
+        mask = np.isin(self._filename_array(), list(filenames)) if filenames else None
+        candidates = shortlist(self.codes, queries, k * self._rerank.factor, mask)
+        return _rerank_batch(self._rerank, queries, candidates, k)
+
+def _rerank_batch(rerank, queries, candidates, k):
+    """Re-score each query's candidate row ids exactly; (ids, scores) padded with -1 / -inf."""
+    top = np.full((len(queries), k), -1, dtype=np.int64)
+    top_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    for row, (query, ids) in enumerate(zip(queries, candidates)):
+        best, best_scores = rerank(query, ids, k)
+        top[row, :len(best)] = best
+        top_scores[row, :len(best)] = best_scores
+    return top, top_scores
+
+def _load_exact(version, embeddings, docs):
+    return InMemoryVectorStore(embeddings, docs, normalized=True, version=version)
+
+def _load_faiss(version, embeddings, docs):
+    from faiss_index import load_faiss_index
+
+    loaded = load_faiss_index(version)
+    if loaded is None:
+        print(f"⚠️  Snapshot {version} has no FAISS index (run ingest.py with VECTOR_BACKEND=faiss); using exact search")
+        return _load_exact(version, embeddings, docs)
+    index, info = loaded
+    return FaissVectorStore(index, info, embeddings, docs, version=version)
+
+def _load_quantized(kind):
+    def load(version, embeddings, docs):
+        from quantized import load_quantized
+
+        return QuantizedVectorStore(load_quantized(version, kind, embeddings), embeddings, docs, version=version)
+    return load
+
+# VECTOR_BACKEND -> loader(version, embeddings, docs) returning a store for that snapshot
+VECTOR_BACKENDS = {
+    "exact": _load_exact,
+    "faiss": _load_faiss,
+    "int8": _load_quantized("int8"),
+    "binary": _load_quantized("binary")
+}
+
+def open_store(version, backend=VECTOR_BACKEND, lexical=RETRIEVAL_MODE != "dense" or LEXICAL_FALLBACK):
+    """
+    Open a snapshot version with the given vector backend (the ChromaDB collection,
+    exactly, when version is None) and, if lexical, attach its BM25 index.
+    """
+    if version is None:
+        store = InMemoryVectorStore(*_load_from_collection())
+    else:
+        if backend not in VECTOR_BACKENDS:
+            raise ValueError(f"Unknown VECTOR_BACKEND {backend!r} (expected one of {', '.join(VECTOR_BACKENDS)})")
+        embeddings, docs = load_snapshot(version)
+        store = VECTOR_BACKENDS[backend](version, embeddings, docs)
+    if lexical:
+        from bm25 import BM25Index, load_bm25
+
+        store.lexical = load_bm25(version) if version is not None else None
+        if store.lexical is None:
+            if version is not None:
+                print(f"⚠️  Snapshot {version} has no current BM25 index (re-run ingest.py); building it in memory")
+            store.lexical = BM25Index.build(doc['text'] for doc in store.docs)
+    return store
+
+def _normalize_rows(matrix):
+    """L2-normalize each row; zero rows are left as zeros."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def get_store():
+    """
+    Return the shared vector store, loading it on first use.
+    At most every SNAPSHOT_CHECK_INTERVAL seconds the CURRENT snapshot pointer is
+    re-read; if ingest.py has published a new version it is loaded and swapped in
+    with a single reference assignment. Requests already holding the old store
+    finish against it, and its memory maps are released once they drop it.
+    """
+    global _store, _store_version, _store_checked_at
+    now = time.monotonic()
+    if _store is not None and now - _store_checked_at < SNAPSHOT_CHECK_INTERVAL:
+        return _store
+    with _store_lock:
+        if _store is None or now - _store_checked_at >= SNAPSHOT_CHECK_INTERVAL:
+            _store_checked_at = now
+            version = current_version()
+            if _store is None or (version is not None and version != _store_version):
+                try:
+                    with span("store_load"):
+                        store = open_store(version)
+                except Exception as e:
+                    if _store is None:
+                        raise RuntimeError(f"Failed to load vector store: {e}")
+                    print(f"Failed to load snapshot {version}, keeping {_store_version}: {e}")
+                else:
+                    _store, _store_version = store, version
+                    print(f"Loaded vector store version {store.version} ({len(store)} chunks, {store.backend} search)")
+    return _store
+
+def index_version():
+    """Version of the vector store currently serving requests ("chroma" when no snapshot exists)."""
+    return get_store().version
+
+def embed_query(query):
+    """L2-normalized query embedding (served from the embedding cache for repeated questions)."""
+    with span("embed"):
+        return get_embeddings([query], normalize=True)[0]
+
+def search_queries(store, queries, top_k=TOP_K, filenames=None, mode=RETRIEVAL_MODE):
+    """
+    Retrieve the top_k chunks for each query text from `store` by retrieval mode.
+    Returns (query embeddings, one result list per query); the embeddings are None
+    when retrieval was lexical only (mode "lexical", or the LEXICAL_FALLBACK).
+    """
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown RETRIEVAL_MODE {mode!r} (expected one of {', '.join(RETRIEVAL_MODES)})")
+    query_embeddings = None
+    if mode != "lexical":
+        if store.lexical is None or not LEXICAL_FALLBACK:
+            with span("embed"):
+                query_embeddings = get_embeddings(queries, normalize=True)
+        elif model_available():
+            try:
+                with span("embed"):
+                    query_embeddings = get_embeddings(queries, normalize=True)
+            except Exception as e:
+                print(f"⚠️  {e}; answering from the BM25 index")
+    if query_embeddings is None:
+        if store.lexical is None:
+            raise RuntimeError("Lexical retrieval needs a BM25 index (set LEXICAL_FALLBACK or RETRIEVAL_MODE)")
+        RETRIEVALS.labels("lexical" if mode == "lexical" else "fallback").inc(len(queries))
+        with span("lexical"):
+            return None, [store.search_lexical(query, top_k=top_k, filenames=filenames) for query in queries]
+
+    hybrid = mode == "hybrid" and store.lexical is not None
+    RETRIEVALS.labels("hybrid" if hybrid else "dense").inc(len(queries))
+    fetch = max(top_k, HYBRID_CANDIDATES) if hybrid else top_k
+    with span("search"):
+        results = store.search_batch(query_embeddings, top_k=fetch, filenames=filenames)
+    if hybrid:
+        from bm25 import reciprocal_rank_fusion
+
+        with span("lexical"):
+            results = [
+                reciprocal_rank_fusion([dense, store.search_lexical(query, top_k=fetch, filenames=filenames)], top_k, k=RRF_K)
+                for query, dense in zip(queries, results)
+            ]
+    return query_embeddings, results
+
+def search_query(store, query, top_k=TOP_K, filenames=None, mode=RETRIEVAL_MODE):
+    """search_queries() for one query text: (query embedding or None, results)."""
+    query_embeddings, results = search_queries(store, [query], top_k=top_k, filenames=filenames, mode=mode)
+    return (query_embeddings[0] if query_embeddings is not None else None), results[0]
+
+def retrieve_top_k(query, top_k=TOP_K, filenames=None):
+    """Retrieve the top-k chunks relevant to the query from the in-memory store (by RETRIEVAL_MODE)."""
+    return search_query(get_store(), query, top_k=top_k, filenames=filenames)[1]
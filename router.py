@@ -0,0 +1,167 @@
+# router.py - Fast path that answers without retrieval or the LLM
+# Checked before the RAG pipeline. Greetings and other intents are matched with
+# regular expressions (DEFAULT_INTENTS, or a JSON file at ROUTER_INTENTS_PATH with
+# the same shape); then the question embedding is compared with the curated FAQ
+# questions of the current snapshot (see faq.py). A FAQ match at or above
+# FAQ_THRESHOLD returns the curated answer verbatim, in a few milliseconds. The FAQ
+# match needs the embedding model, so it is skipped with RETRIEVAL_MODE=lexical.
+import re
+import json
+import threading
+import numpy as np
+from retrieval import embed_query, get_store
+from embeddings import model_available
+from faq import load_faq_index
+from metrics import ROUTES, span
+from config import ROUTER_ENABLED, ROUTER_INTENTS_PATH, FAQ_THRESHOLD, LEXICAL_FALLBACK, RETRIEVAL_MODE
+
+CONTACT_ANSWER = (
+    "You can reach Convo Sol at info@convosol.com or support@convosol.com, on convosol.com, or on LinkedIn "
+    "(https://www.linkedin.com/company/convosol/). To talk to a co-founder directly: Muneeb Qureshi "
+    "(muneebq2003@gmail.com), Muhammad Hadi (muhammadhadiabid@gmail.com) or Awais Khaleeq (ds.awaisk@gmail.com)."
+)
+
+# Patterns are matched case-insensitively against the whole (stripped) question
+DEFAULT_INTENTS = [
+    {
+        "name": "greeting",
+        "patterns": [
+            r"^(hi|hello|hey|hiya|howdy|greetings|good (morning|afternoon|evening))"
+            r"( (there|team|all|everyone|convo ?sol))?[\s!.,:)]*$"
+        ],
+        "answer": "Hello! How can I help you with ConvoSol today?"
+    },
+    {
+        "name": "thanks",
+        "patterns": [r"^(thanks|thank you|thx|cheers)( (so|very) much| a lot)?( for (your|the) help)?[\s!.,:)]*$"],
+        "answer": "You're welcome! Is there anything else I can help you with?"
+    },
+    {
+        "name": "goodbye",
+        "patterns": [r"^(bye|goodbye|see you|see ya)( later| soon)?[\s!.,:)]*$"],
+        "answer": "Thanks for chatting with Convo Sol! Reach out any time at info@convosol.com."
+    },
+    {
+        "name": "contact",
+        "patterns": [
+            r"^(how (can|do) i |can i |i want to |i'd like to )?(contact|reach|get in touch with|talk to|speak (to|with)) "
+            r"(you|convo ?sol|your team|the team|someone|a human|the (co-?)?founders?)( directly| please)?[\s!.,?]*$",
+            r"^what('s| is| are) (your|convo ?sol'?s) (email|e-mail|contact (details|info|information))\??$"
+        ],
+        "answer": CONTACT_ANSWER
+    }
+]
+
+class Router:
+    """Intent rules and FAQ matching, with hit counts per route."""
+
+    def __init__(self, intents, faq_threshold=0.9):
+        self.intents = [
+            (intent["name"], [re.compile(p, re.IGNORECASE) for p in intent["patterns"]], intent["answer"])
+            for intent in intents
+        ]
+        self.faq_threshold = faq_threshold
+        self.hits = {}
+        self.misses = 0
+        self._faq = None
+        self._faq_version = None
+        self._lock = threading.Lock()
+
+    def match_intent(self, question):
+        text = question.strip()
+        for name, patterns, answer in self.intents:
+            if any(pattern.search(text) for pattern in patterns):
+                return {"route": name, "answer": answer}
+        return None
+
+    def _faq_index(self, version):
+        """The FAQ index of a snapshot version, reloaded when the served version changes."""
+        if version != self._faq_version:
+            with self._lock:
+                if version != self._faq_version:
+                    self._faq = load_faq_index(version)
+                    self._faq_version = version
+        return self._faq
+
+    def match_faq(self, query_embedding, index):
+        embeddings, entries = index
+        if embeddings.shape[1] != len(query_embedding):
+            return None  # index built with another embedding model
+        scores = embeddings @ np.asarray(query_embedding, dtype=np.float32)
+        best = int(np.argmax(scores))
+        if scores[best] < self.faq_threshold:
+            return None
+        entry = entries[best]
+        return {"route": "faq", "answer": entry["answer"], "faq_question": entry["question"], "score": float(scores[best])}
+
+    def route(self, question, query=None, query_embedding=None):
+        """
+        Curated answer for a question as {"route", "answer", ...}, or None to use
+        the RAG pipeline. query is the text matched against the FAQ (the rewritten
+        follow-up in a session, by default the question); query_embedding skips
+        embedding it when the caller already has it.
+        """
+        with span("route"):
+            routed = self.match_intent(question)
+            if routed is None and self.faq_threshold <= 1 and RETRIEVAL_MODE != "lexical":
+                index = self._faq_index(get_store().version)
+                if index is not None and query_embedding is None:
+                    query_embedding = self._embed(query or question)
+                if index is not None and query_embedding is not None:
+                    routed = self.match_faq(query_embedding, index)
+        with self._lock:
+            if routed is None:
+                self.misses += 1
+            else:
+                self.hits[routed["route"]] = self.hits.get(routed["route"], 0) + 1
+        ROUTES.labels(routed["route"] if routed else "llm").inc()
+        return routed
+
+    def _embed(self, text):
+        """The query embedding, or None with LEXICAL_FALLBACK while the model is loading or failing (FAQ skipped)."""
+        if not LEXICAL_FALLBACK:
+            return embed_query(text)
+        if not model_available():
+            return None
+        try:
+            return embed_query(text)
+        except RuntimeError as e:
+            print(f"⚠️  FAQ match skipped: {e}")
+            return None
+
+    def stats(self):
+        with self._lock:
+            total = sum(self.hits.values()) + self.misses
+            return {
+                "hits": dict(self.hits),
+                "llm": self.misses,
+                "hit_rate": sum(self.hits.values()) / total if total else 0.0,
+                "faq_entries": len(self._faq[1]) if self._faq else 0,
+                "faq_threshold": self.faq_threshold
+            }
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_router():
+    """The shared router, built on first use from ROUTER_INTENTS_PATH or DEFAULT_INTENTS."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                intents = DEFAULT_INTENTS
+                if ROUTER_INTENTS_PATH:
+                    with open(ROUTER_INTENTS_PATH, "r", encoding="utf-8") as f:
+                        intents = json.load(f)
+                _router = Router(intents, faq_threshold=FAQ_THRESHOLD)
+    return _router
+
+def route(question, query=None, query_embedding=None):
+    """Curated answer for a question from the shared router, or None (always None with ROUTER_ENABLED=false)."""
+    if not ROUTER_ENABLED:
+        return None
+    return get_router().route(question, query, query_embedding)
+
+def stats():
+    """Fast-path hits per route, questions sent to the LLM and the hit rate."""
+    return dict(get_router().stats(), enabled=ROUTER_ENABLED)
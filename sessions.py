@@ -0,0 +1,285 @@
+# sessions.py - Conversation sessions for follow-up questions
+# A session keeps the recent turns of one conversation, so a client can follow
+# "what chatbots do you build?" with "how much does that cost?". Three things keep
+# it cheap:
+# - follow-ups are rewritten with the previous question before retrieval, so the
+#   vector search still finds the chunks the conversation is about;
+# - history is compacted to SESSION_HISTORY_TOKENS: recent turns stay verbatim,
+#   older ones shrink to a short list of earlier questions and then drop out, so
+#   the prompt stays the same size however long the conversation runs;
+# - the store is bounded (LRU by count and memory, idle TTL). SESSION_BACKEND=sqlite
+#   shares sessions between Gunicorn workers through a local SQLite file.
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from prompts import estimate_tokens
+from metrics import cache_lookup
+from config import (
+    SESSION_BACKEND, SESSION_DB_PATH, SESSION_MAX, SESSION_MAX_BYTES, SESSION_TTL, SESSION_HISTORY_TOKENS
+)
+
+# Client-chosen ids (a UUID works); an unknown id starts a new conversation
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+# Words and openings that make a question depend on the previous one
+FOLLOW_UP_WORDS = {
+    "it", "its", "that", "this", "those", "these", "they", "them", "their", "there",
+    "he", "she", "him", "her", "one", "ones", "same", "else", "more"
+}
+FOLLOW_UP_STARTS = ("and ", "also ", "but ", "so ", "then ", "what about", "how about")
+
+# Longest rewritten retrieval query, in words (the topic comes first and is kept)
+MAX_QUERY_WORDS = 48
+
+# Longest entry in the list of earlier questions, in words
+MAX_EARLIER_WORDS = 16
+
+def new_session():
+    return {"turns": [], "earlier": []}
+
+def _session_size(session):
+    return len(json.dumps(session))
+
+class InMemorySessionStore:
+    """
+    Sessions of this process: LRU-bounded by count and by approximate size in
+    bytes, and dropped after ttl seconds without use.
+    """
+
+    def __init__(self, maxsize=10000, ttl=None, max_bytes=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._sessions = OrderedDict()  # id -> (session, size, last used)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, session_id):
+        session, size, used_at = self._sessions.pop(session_id)
+        self._bytes -= size
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            session, size, used_at = entry
+            now = time.monotonic()
+            if self.ttl and now - used_at >= self.ttl:
+                self._remove(session_id)
+                return None
+            self._sessions[session_id] = (session, size, now)
+            self._sessions.move_to_end(session_id)
+            return json.loads(json.dumps(session))  # callers get their own copy
+
+    def put(self, session_id, session):
+        session = json.loads(json.dumps(session))
+        size = _session_size(session)
+        now = time.monotonic()
+        with self._lock:
+            if session_id in self._sessions:
+                self._remove(session_id)
+            self._sessions[session_id] = (session, size, now)
+            self._bytes += size
+            while len(self._sessions) > 1:
+                oldest_id, (oldest, oldest_size, used_at) = next(iter(self._sessions.items()))
+                expired = self.ttl and now - used_at >= self.ttl
+                if not expired and len(self._sessions) <= self.maxsize and \
+                        (not self.max_bytes or self._bytes <= self.max_bytes):
+                    break
+                self._remove(oldest_id)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "maxsize": self.maxsize,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions
+            }
+
+class SQLiteSessionStore:
+    """
+    Sessions in a local SQLite file (WAL mode), shared by every worker on the host.
+    Expired rows and rows beyond maxsize (least recently written first) are pruned
+    every PRUNE_EVERY writes.
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, path, maxsize=10000, ttl=None):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._writes = 0
+        self._local = threading.local()
+
+    def _connect(self):
+        """One connection per thread, reopened in a forked worker."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, session_id):
+        row = self._connect().execute(
+            "SELECT data, updated_at FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None or (self.ttl and time.time() - row[1] >= self.ttl):
+            return None
+        return json.loads(row[0])
+
+    def put(self, session_id, session):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (id, data, updated_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(session), time.time())
+        )
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self._prune(conn)
+
+    def _prune(self, conn):
+        if self.ttl:
+            conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl,))
+        conn.execute(
+            "DELETE FROM sessions WHERE id NOT IN (SELECT id FROM sessions ORDER BY updated_at DESC LIMIT ?)",
+            (self.maxsize,)
+        )
+
+    def stats(self):
+        count = self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {"backend": "sqlite", "path": self.path, "sessions": count, "maxsize": self.maxsize}
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_session_store():
+    """The configured session store (SESSION_BACKEND), created on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if SESSION_BACKEND == "sqlite":
+                    _store = SQLiteSessionStore(SESSION_DB_PATH, maxsize=SESSION_MAX, ttl=SESSION_TTL or None)
+                elif SESSION_BACKEND == "memory":
+                    _store = InMemorySessionStore(
+                        maxsize=SESSION_MAX, ttl=SESSION_TTL or None, max_bytes=SESSION_MAX_BYTES or None
+                    )
+                else:
+                    raise ValueError(f"Unknown SESSION_BACKEND {SESSION_BACKEND!r} (expected 'memory' or 'sqlite')")
+    return _store
+
+def _clip(text, max_words):
+    words = text.split()
+    return " ".join(words[:max_words]) + (" ..." if len(words) > max_words else "")
+
+def rewrite_query(question, session):
+    """
+    Retrieval query for a question in the context of the session: a follow-up
+    (short, or referring back with "it", "that", "what about" ...) is prefixed
+    with the previous retrieval query; other questions are used as they are.
+    """
+    if session["turns"]:
+        previous = session["turns"][-1]["query"]
+    elif session["earlier"]:
+        previous = session["earlier"][-1]
+    else:
+        return question
+    lowered = question.lower()
+    words = re.findall(r"[a-z']+", lowered)
+    if len(words) <= 3 or FOLLOW_UP_WORDS.intersection(words) or lowered.startswith(FOLLOW_UP_STARTS):
+        return _clip(f"{previous} {question}", MAX_QUERY_WORDS).rstrip(" .")
+    return question
+
+def history_text(session):
+    """The session's history as prompt text: earlier questions, then recent turns verbatim."""
+    lines = []
+    if session["earlier"]:
+        lines.append("Earlier the client asked about: " + "; ".join(session["earlier"]))
+    for turn in session["turns"]:
+        lines.append(f"Client: {turn['question']}")
+        lines.append(f"You: {turn['answer']}")
+    return "\n".join(lines)
+
+def compact(session, token_budget=SESSION_HISTORY_TOKENS):
+    """
+    Shrink the session until history_text() fits token_budget. The oldest turns
+    leave first, each leaving a clipped copy of its question in "earlier", which
+    itself is kept to a quarter of the budget.
+    """
+    while session["turns"] and estimate_tokens(history_text(session)) > token_budget:
+        oldest = session["turns"].pop(0)
+        session["earlier"].append(_clip(oldest["question"], MAX_EARLIER_WORDS))
+        while session["earlier"] and estimate_tokens("; ".join(session["earlier"])) > token_budget // 4:
+            session["earlier"].pop(0)
+    return session
+
+class Conversation:
+    """
+    One request's view of a session. Without a session id it is stateless: no
+    history, the question is its own retrieval query and nothing is stored.
+    """
+
+    def __init__(self, session_id=None, session=None, store=None):
+        self.session_id = session_id
+        self.session = session or new_session()
+        self.store = store
+
+    @property
+    def has_history(self):
+        return bool(self.session["turns"] or self.session["earlier"])
+
+    def retrieval_query(self, question):
+        return rewrite_query(question, self.session)
+
+    def history_text(self):
+        return history_text(self.session) or None
+
+    def record(self, question, query, answer):
+        """Append the finished turn, compact the history and save the session."""
+        if self.store is None:
+            return
+        self.session["turns"].append({"question": question, "query": query, "answer": answer})
+        self.store.put(self.session_id, compact(self.session))
+
+    def reply(self, body):
+        """Response body with the session id added for session requests."""
+        if self.session_id is not None:
+            body = dict(body, session_id=self.session_id)
+        return body
+
+def open_conversation(session_id):
+    """
+    Conversation for a request's optional session_id. Raises ValueError for an id
+    that is not 8-64 letters, digits, '-' or '_'.
+    """
+    if session_id is None or session_id == "":
+        return Conversation()
+    if not isinstance(session_id, str) or not SESSION_ID_PATTERN.match(session_id):
+        raise ValueError("session_id must be 8-64 letters, digits, '-' or '_'")
+    store = get_session_store()
+    session = store.get(session_id)
+    cache_lookup("session", session is not None)
+    return Conversation(session_id, session, store)
+
+def stats():
+    """Size and limits of the session store."""
+    return get_session_store().stats()
@@ -0,0 +1,266 @@
+# singleflight.py - Coalesce identical in-flight questions
+# When a link to the site is shared, many visitors send the same opening question
+# within seconds. Requests for the same normalized question against the same index
+# version share one computation (embed + retrieve + Gemini): the first request is
+# the leader and runs it, the others wait for its result. Nothing is kept after the
+# computation finishes; the answer cache (answer_cache.py) is what serves repeats.
+#
+# Backends (SINGLEFLIGHT_BACKEND):
+# - memory: requests of one worker process share a computation;
+# - file:   workers on the same host also share it. The leading worker holds an
+#           flock on SINGLEFLIGHT_DIR/<key hash>.lock while it computes and writes
+#           the result next to it; workers that find the lock taken wait for it to
+#           be released and read the result. Result files are removed after
+#           RESULT_TTL seconds, lock files once unused for LOCK_TTL seconds.
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from embeddings import normalize_text
+from metrics import SINGLEFLIGHT, span
+from config import SINGLEFLIGHT_ENABLED, SINGLEFLIGHT_BACKEND, SINGLEFLIGHT_DIR, SINGLEFLIGHT_TIMEOUT
+
+# Seconds a cross-worker result stays readable for the workers waiting on it
+RESULT_TTL = 10
+
+# Seconds after which an unused lock file is removed
+LOCK_TTL = 600
+
+# How often a worker waiting on another worker's lock checks it (seconds)
+POLL_INTERVAL = 0.01
+
+def question_key(question, version):
+    """Key shared by requests that would get the same answer: index version and normalized question."""
+    return f"{version}:{normalize_text(question)}"
+
+class SingleFlight:
+    """
+    In-process single-flight: do(key, fn) runs fn once per key at a time and
+    hands its result (or exception) to every caller that arrived meanwhile.
+    A caller that waited longer than `timeout` runs fn itself.
+    """
+
+    def __init__(self, timeout=40.0):
+        self.timeout = timeout
+        self.leaders = 0
+        self.followers = 0
+        self._calls = {}  # key -> Future of the running computation
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.followers += 1
+        if not leader:
+            SINGLEFLIGHT.labels("follower").inc()
+            try:
+                with span("singleflight"):
+                    return future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                return fn()
+
+        SINGLEFLIGHT.labels("leader").inc()
+        try:
+            result = self._run(key, fn)
+        except BaseException as e:
+            self._finish(key)
+            future.set_exception(e)
+            raise
+        self._finish(key)
+        future.set_result(result)
+        return result
+
+    def _run(self, key, fn):
+        return fn()
+
+    def _finish(self, key):
+        # Forget the key before publishing, so a request arriving after completion starts afresh
+        with self._lock:
+            del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "in_flight": len(self._calls),
+                "leaders": self.leaders,
+                "followers": self.followers
+            }
+
+class FileSingleFlight(SingleFlight):
+    """
+    SingleFlight shared by the worker processes of a host through flock'd lock
+    files in `directory`. Within a process, callers still coalesce in memory first.
+    """
+
+    def __init__(self, directory, timeout=40.0):
+        super().__init__(timeout)
+        self.directory = directory
+        self.shared = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _run(self, key, fn):
+        import fcntl
+
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        lock_path = os.path.join(self.directory, digest + ".lock")
+        result_path = os.path.join(self.directory, digest + ".json")
+        fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                locked = True
+            except BlockingIOError:
+                # Another worker is computing this answer: wait for it to finish
+                waiting_since = time.time()
+                with span("singleflight"):
+                    locked = self._wait_for_lock(fd, fcntl)
+                if locked:
+                    result = self._read_result(result_path, waiting_since)
+                    if result is not None:
+                        with self._lock:
+                            self.shared += 1
+                        SINGLEFLIGHT.labels("other_worker").inc()
+                        return result["value"]
+                # The other worker failed or took too long; compute the answer here
+            if locked:
+                os.utime(fd)  # marks the lock file as in use for _prune
+            value = fn()
+            if locked:
+                self._write_result(result_path, value)
+            return value
+        finally:
+            os.close(fd)  # also releases the flock
+
+    def _wait_for_lock(self, fd, fcntl):
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                continue
+        return False
+
+    def _read_result(self, path, since):
+        """The result another worker published after `since`, as {"value": ...}, or None."""
+        try:
+            if os.stat(path).st_mtime < since:
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_result(self, path, value):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"value": value}, f)
+        os.replace(tmp_path, path)
+        self._prune()
+
+    def _prune(self):
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                age = now - entry.stat().st_mtime
+                if (entry.name.endswith(".json") and age > RESULT_TTL) or \
+                        (entry.name.endswith(".lock") and age > LOCK_TTL):
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                continue
+
+    def stats(self):
+        return dict(super().stats(), backend="file", directory=self.directory, other_worker=self.shared)
+
+class AsyncSingleFlight:
+    """
+    Single-flight for asyncio code (asgi.py), per worker process. The computation
+    runs as its own task, so a leader whose client disconnects does not cancel it
+    for the requests waiting on it.
+    """
+
+    def __init__(self, timeout=40.0):
+        self.timeout = timeout
+        self.leaders = 0
+        self.followers = 0
+        self._calls = {}  # key -> Task of the running computation
+
+    async def do(self, key, fn):
+        """Await fn() (a coroutine function), shared with concurrent callers for the same key."""
+        task = self._calls.get(key)
+        if task is None:
+            self.leaders += 1
+            SINGLEFLIGHT.labels("leader").inc()
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._finish(key, done))
+            return await asyncio.shield(task)
+
+        self.followers += 1
+        SINGLEFLIGHT.labels("follower").inc()
+        try:
+            with span("singleflight"):
+                return await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except asyncio.TimeoutError:
+            return await fn()
+
+    def _finish(self, key, task):
+        self._calls.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # retrieved here, so it is not logged when every caller went away
+
+    def stats(self):
+        return {"backend": "memory", "in_flight": len(self._calls), "leaders": self.leaders, "followers": self.followers}
+
+_flight = None
+_async_flight = None
+_flight_lock = threading.Lock()
+
+def get_flight():
+    """The configured single-flight group (SINGLEFLIGHT_BACKEND), created on first use."""
+    global _flight
+    if _flight is None:
+        with _flight_lock:
+            if _flight is None:
+                if SINGLEFLIGHT_BACKEND == "file":
+                    _flight = FileSingleFlight(SINGLEFLIGHT_DIR, timeout=SINGLEFLIGHT_TIMEOUT)
+                elif SINGLEFLIGHT_BACKEND == "memory":
+                    _flight = SingleFlight(timeout=SINGLEFLIGHT_TIMEOUT)
+                else:
+                    raise ValueError(
+                        f"Unknown SINGLEFLIGHT_BACKEND {SINGLEFLIGHT_BACKEND!r} (expected 'memory' or 'file')"
+                    )
+    return _flight
+
+def get_async_flight():
+    """The single-flight group for asyncio code; always per process."""
+    global _async_flight
+    if _async_flight is None:
+        _async_flight = AsyncSingleFlight(timeout=SINGLEFLIGHT_TIMEOUT)
+    return _async_flight
+
+def do(question, version, fn):
+    """fn() shared with concurrent requests for the same question and index version (just fn() when disabled)."""
+    if not SINGLEFLIGHT_ENABLED:
+        return fn()
+    return get_flight().do(question_key(question, version), fn)
+
+async def ado(question, version, fn):
+    """do() for asyncio code: awaits the coroutine function fn."""
+    if not SINGLEFLIGHT_ENABLED:
+        return await fn()
+    return await get_async_flight().do(question_key(question, version), fn)
+
+def stats(asynchronous=False):
+    """Computations led and joined by this process."""
+    flight = get_async_flight() if asynchronous else get_flight()
+    return dict(flight.stats(), enabled=SINGLEFLIGHT_ENABLED)
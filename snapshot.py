@@ -0,0 +1,176 @@
+# snapshot.py - Versioned, memory-mapped index snapshots
+# ingest.py writes a snapshot per run; retrieval.py memory-maps the current one so
+# every Gunicorn worker shares a single copy through the OS page cache.
+#
+# Layout:
+#   db/snapshots/CURRENT               name of the live version (swapped with os.replace)
+#   db/snapshots/<version>/embeddings.npy   float32 (n, dim), rows L2-normalized
+#   db/snapshots/<version>/chunks.bin       UTF-8 JSON records, one per chunk, back to back
+#   db/snapshots/<version>/offsets.npy      int64 (n + 1) byte offsets into chunks.bin
+#   db/snapshots/<version>/manifest.json    version, count, dim, created_at
+#   db/snapshots/<version>/faq_*            curated FAQ question index (see faq.py)
+#   db/snapshots/<version>/bm25*            BM25 inverted index over the chunk texts (see bm25.py)
+#   db/snapshots/<version>/vectors.*        optional FAISS index (see faiss_index.py)
+#   db/snapshots/<version>/int8_*, binary_*, quantized.json   optional compact codes (see quantized.py)
+import os
+import json
+import mmap
+import time
+import uuid
+import shutil
+import numpy as np
+from config import SNAPSHOT_DIR, SNAPSHOT_KEEP
+
+CURRENT_FILE = "CURRENT"
+
+class ChunkTable:
+    """
+    Read-only sequence of chunk dicts backed by a memory-mapped chunks.bin.
+    Records are decoded on access, so only the chunks actually returned by a
+    search are ever materialized as Python objects.
+    """
+
+    def __init__(self, path, offsets):
+        self.offsets = offsets
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("chunk index out of range")
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return json.loads(self._data[start:end].decode("utf-8"))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+def _fsync_file(path):
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+def current_version(root=SNAPSHOT_DIR):
+    """Return the name of the live snapshot version, or None if no snapshot has been published."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return version or None
+
+class SnapshotWriter:
+    """
+    Write a snapshot incrementally so ingest never holds the whole corpus in memory:
+    add() batches of (embeddings, chunks) until `count` rows are written, then
+    publish() makes the version current. Extra index files can be written into
+    `path` before publishing.
+    """
+
+    def __init__(self, count, dim, root=SNAPSHOT_DIR, keep=SNAPSHOT_KEEP):
+        self.count = count
+        self.dim = dim
+        self.root = root
+        self.keep = keep
+        self.version = time.strftime("%Y%m%d%H%M%S") + "-" + uuid.uuid4().hex[:6]
+        os.makedirs(root, exist_ok=True)
+        self.path = os.path.join(root, f".tmp-{self.version}")
+        os.makedirs(self.path)
+        self._embeddings = np.lib.format.open_memmap(
+            os.path.join(self.path, "embeddings.npy"), mode="w+", dtype=np.float32, shape=(count, dim)
+        )
+        self._chunks_file = open(os.path.join(self.path, "chunks.bin"), "wb")
+        self._offsets = np.zeros(count + 1, dtype=np.int64)
+        self._written = 0
+
+    def add(self, embeddings, chunks):
+        """Append rows; embeddings must already be L2-normalized."""
+        if len(embeddings) != len(chunks):
+            raise ValueError("embeddings and chunks must have the same length")
+        start = self._written
+        if start + len(chunks) > self.count:
+            raise ValueError(f"Snapshot was sized for {self.count} chunks")
+        self._embeddings[start:start + len(chunks)] = embeddings
+        for i, chunk in enumerate(chunks, start=start):
+            record = json.dumps(chunk, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            self._chunks_file.write(record)
+            self._offsets[i + 1] = self._offsets[i] + len(record)
+        self._written += len(chunks)
+
+    def embeddings(self):
+        """The rows written so far (memory-mapped), e.g. to build an extra index before publishing."""
+        self._embeddings.flush()
+        return self._embeddings[:self._written]
+
+    def publish(self):
+        """Finish the files, move them into place and atomically make this version current."""
+        if self._written != self.count:
+            raise RuntimeError(f"Snapshot expected {self.count} chunks, got {self._written}")
+        self._embeddings.flush()
+        del self._embeddings
+        self._chunks_file.close()
+        np.save(os.path.join(self.path, "offsets.npy"), self._offsets)
+        manifest = {
+            "version": self.version,
+            "count": self.count,
+            "dim": self.dim,
+            "created_at": time.time(),
+        }
+        with open(os.path.join(self.path, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        for name in os.listdir(self.path):
+            _fsync_file(os.path.join(self.path, name))
+        os.rename(self.path, os.path.join(self.root, self.version))
+        self.path = os.path.join(self.root, self.version)
+
+        # Publish: readers see either the old or the new CURRENT, never a partial write
+        tmp_current = os.path.join(self.root, f".{CURRENT_FILE}.{self.version}")
+        with open(tmp_current, "w", encoding="utf-8") as f:
+            f.write(self.version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_current, os.path.join(self.root, CURRENT_FILE))
+
+        _prune(self.root, self.keep, self.version)
+        return self.version
+
+    def abort(self):
+        """Discard an unpublished snapshot."""
+        self._chunks_file.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+def write_snapshot(embeddings, chunks, root=SNAPSHOT_DIR, keep=SNAPSHOT_KEEP):
+    """
+    Write embeddings (rows already L2-normalized) and chunk dicts as a new snapshot
+    version and atomically make it current. Returns the new version name.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    writer = SnapshotWriter(len(chunks), embeddings.shape[1] if embeddings.ndim == 2 else 0, root=root, keep=keep)
+    writer.add(embeddings.reshape(len(chunks), writer.dim), chunks)
+    return writer.publish()
+
+def _prune(root, keep, current):
+    """Remove all but the newest `keep` versions. Mapped files stay valid for readers until they unmap."""
+    versions = sorted(
+        name for name in os.listdir(root)
+        if not name.startswith(".") and name != CURRENT_FILE and os.path.isdir(os.path.join(root, name))
+    )
+    for name in versions[:-max(keep, 1)]:
+        if name != current:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+def load_snapshot(version, root=SNAPSHOT_DIR):
+    """Memory-map a snapshot version. Returns (embeddings, chunks) where chunks is a ChunkTable."""
+    path = os.path.join(root, version)
+    embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+    offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+    chunks = ChunkTable(os.path.join(path, "chunks.bin"), offsets)
+    if len(chunks) != len(embeddings):
+        raise RuntimeError(f"Snapshot {version} is inconsistent: {len(embeddings)} embeddings, {len(chunks)} chunks")
+    return embeddings, chunks
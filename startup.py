@@ -0,0 +1,82 @@
+# startup.py - Cold start: warm-up and readiness
+# Heavy libraries (torch/sentence-transformers, chromadb, google.generativeai) are
+# imported on first use, so importing the app is quick and /health answers at once.
+# warm_up() then pays the remaining one-off costs before the first chat: under
+# Gunicorn --preload it runs once in the master before workers fork (see
+# gunicorn.conf.py), otherwise in a background thread in each process.
+# /ready answers 503 until it has finished.
+import threading
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
+_ready = threading.Event()
+_lock = threading.Lock()         # guards starting the background thread
+_warm_lock = threading.Lock()    # held for the whole warm-up
+_thread = None
+_status = {"state": "pending", "import_seconds": None, "warm_up_seconds": None, "steps": {}, "error": None}
+
+def imports_done(name):
+    """Log how long importing the app took, counted from the first import of this module."""
+    _status["import_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+    print(f"⏱️  {name} imported in {_status['import_seconds']:.2f}s")
+
+def _record(step, seconds):
+    _status["steps"][step] = round(seconds, 3)
+    print(f"⏱️  Warm-up {step}: {seconds:.2f}s")
+
+def warm_up(fork_safe=False):
+    """
+    Load the embedding model, run a dummy encode (unless RETRIEVAL_MODE=lexical),
+    open the vector index and import the Gemini client. Runs once per process
+    tree; later calls return the status.
+    fork_safe=True is for the Gunicorn master: nothing is left running that
+    forked workers could not use (no encoder threads, no open ChromaDB client).
+    """
+    with _warm_lock:
+        if _status["state"] in ("ready", "failed"):
+            return status()
+        _status["state"] = "warming_up"
+        started = time.perf_counter()
+        try:
+            import embeddings
+            import retrieval
+            import llm
+
+            if retrieval.RETRIEVAL_MODE != "lexical":  # lexical retrieval never loads the model
+                for step, seconds in embeddings.warm_up(fork_safe=fork_safe).items():
+                    _record(step, seconds)
+
+            step_started = time.perf_counter()
+            store = retrieval.get_store()
+            if fork_safe:
+                retrieval.release_collection()
+            _record("index_load", time.perf_counter() - step_started)
+
+            step_started = time.perf_counter()
+            llm.get_genai()
+            _record("gemini_client", time.perf_counter() - step_started)
+        except Exception as e:
+            _status["state"] = "failed"
+            _status["error"] = str(e)
+            print(f"❌ Warm-up failed: {e}")
+            return status()
+
+        _status["warm_up_seconds"] = round(time.perf_counter() - started, 3)
+        _status["state"] = "ready"
+        _ready.set()
+        print(f"✅ Ready in {_status['warm_up_seconds']:.2f}s ({len(store.docs)} chunks, index version {store.version})")
+        return status()
+
+def warm_up_in_background():
+    """Start warm_up() on a daemon thread unless it has already been started."""
+    global _thread
+    with _lock:
+        if _thread is not None or _status["state"] != "pending":
+            return
+        _thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+        _thread.start()
+
+def status():
+    """Readiness, import and per-step warm-up timings (seconds) for /ready."""
+    return dict(_status, steps=dict(_status["steps"]), ready=_ready.is_set())
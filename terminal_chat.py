@@ -5,68 +5,52 @@ Run with: python terminal_chat.py
 """
 
 from retrieval import retrieve_top_k
-import google.generativeai as genai
-from config import GEMINI_API_KEY
-import time
-
-# Configure Google GenAI for Gemini
-genai.configure(api_key=GEMINI_API_KEY)
+from prompts import build_lead_prompt
+from router import route
+import llm
 
 def get_answer(question):
     """Get answer for a question using RAG system."""
+    return "".join(stream_answer(question))
+
+def stream_answer(question):
+    """Yield the answer for a question in pieces as Gemini generates it."""
     try:
+        # Greetings, intents and curated FAQ answers need no retrieval or LLM call
+        routed = route(question)
+        if routed is not None:
+            yield routed["answer"]
+            return
+
         print("🔍 Searching for relevant information...")
         
         # Retrieve top relevant chunks for the question
         relevant_chunks = retrieve_top_k(question, top_k=3)
         print(f"📚 Found {len(relevant_chunks)} relevant chunks")
         
-        # Extract text from chunks
-        context = "\n".join([chunk['text'] for score, chunk in relevant_chunks])
-
-        # Build a prompt with context and question
-        prompt = (
-            f"You are a professional business development chatbot for Convo Sol, an AI SaaS company. "
-            f"Your primary goal is to generate leads and convince potential clients to start projects with us. "
-            f"Be conversational, brief, and persuasive. Focus on understanding their needs and positioning our services as the solution. "
-            f"If they show interest, guide them towards scheduling a meeting to discuss their project in detail.\n\n"
-            f"Guidelines:\n"
-            f"- Keep responses concise and engaging (2-3 sentences max)\n"
-            f"- Ask follow-up questions to understand their project needs\n"
-            f"- Highlight our expertise and successful track record\n"
-            f"- When appropriate, suggest scheduling a consultation call\n"
-            f"- If clients want to connect with co-founders, provide their contact details from the company information\n"
-            f"- Co-founders: Muneeb Qureshi (muneebq2003@gmail.com, LinkedIn: https://www.linkedin.com/in/muneebqureshi2003/), Muhammad Hadi (muhammadhadiabid@gmail.com, LinkedIn: https://www.linkedin.com/in/muhammad-hadi-abid), Awais Khaleeq (ds.awaisk@gmail.com, LinkedIn: https://www.linkedin.com/in/muhammad-awais-khaleeq)\n"
-            f"- Use a friendly, professional tone like you're chatting with a potential client\n\n"
-            f"Company Information:\n{context}\n\n"
-            f"Client: {question}\n"
-            f"Response:"
-        )
+        # Merge overlapping chunks and build the prompt within the context token budget
+        prompt, prompt_info = build_lead_prompt(question, relevant_chunks)
+        print(f"🧾 Prompt: ~{prompt_info['prompt_tokens']} tokens ({prompt_info['spans']} context spans)")
 
         print("🤖 Generating response...")
         
-        # Call Gemini API to get the answer
-        for attempt in range(3):
-            try:
-                model = genai.GenerativeModel('gemini-2.5-flash')
-                response = model.generate_content(prompt)
-                answer_text = response.text
-                
-                if answer_text and answer_text.strip():
-                    return answer_text
-                else:
-                    return "I'm sorry, I do not have an answer. Please contact support for assistance."
-                    
-            except Exception as e:
-                print(f"⚠️  API error (attempt {attempt + 1}): {e}")
-                if attempt < 2:
-                    time.sleep(1)
-                else:
-                    return "Failed to generate response. Please try again later."
+        # Stream the answer through the shared client (retries only before any text is produced)
+        produced = False
+        try:
+            for text in llm.stream(prompt, 'gemini-2.5-flash'):
+                produced = True
+                yield text
+        except llm.LLMError as e:
+            print(f"⚠️  API error: {e}")
+            if not produced:
+                yield "Failed to generate response. Please try again later."
+            return
+        if not produced:
+            yield "I'm sorry, I do not have an answer. Please contact support for assistance."
                     
     except Exception as e:
         print(f"❌ Error: {e}")
-        return "An error occurred while processing your question."
+        yield "An error occurred while processing your question."
 
 def main():
     """Main chatbot loop."""
@@ -91,10 +75,11 @@ def main():
                 print("❓ Please ask a question.")
                 continue
                 
-            # Get and display answer
+            # Get and display answer as it streams in
             print("\n🤖 Bot:", end=" ")
-            answer = get_answer(question)
-            print(answer)
+            for text in stream_answer(question):
+                print(text, end="", flush=True)
+            print()
             print("-" * 60)
             
         except KeyboardInterrupt:
@@ -3,31 +3,37 @@ import os
 import re
 import pickle
 
-def read_text_files(folder="data"):
-    files = []
-    for fname in os.listdir(folder):
+def iter_text_files(folder="data"):
+    """Yield {"filename", "text"} for each .txt file, one file in memory at a time (sorted by name)."""
+    for fname in sorted(os.listdir(folder)):
         if fname.lower().endswith(".txt"):
             path = os.path.join(folder, fname)
             with open(path, "r", encoding="utf-8") as f:
-                files.append({"filename": fname, "text": f.read()})
-    return files
+                yield {"filename": fname, "text": f.read()}
 
-def chunk_text(text, size=800, overlap=200):
+def read_text_files(folder="data"):
+    return list(iter_text_files(folder))
+
+def iter_chunks(text, size=800, overlap=200):
     """
     Chunk by characters with overlap (simple, robust).
-    Yields list of (chunk_text, start_index, end_index)
+    Yields (chunk_text, start_index, end_index) lazily.
     """
-    chunks = []
     start = 0
     length = len(text)
     while start < length:
         end = start + size
-        chunk = text[start: end]
-        chunks.append((chunk, start, min(end, length)))
+        yield text[start: end], start, min(end, length)
         start = end - overlap
         if start < 0:
             start = 0
-    return chunks
+
+def chunk_text(text, size=800, overlap=200):
+    """
+    Chunk by characters with overlap (simple, robust).
+    Returns list of (chunk_text, start_index, end_index)
+    """
+    return list(iter_chunks(text, size=size, overlap=overlap))
 
 def save_db(obj, path):
     os.makedirs(os.path.dirname(path), exist_ok=True)